@@ -1,2 +1,4 @@
 from .data_extraction import DataExtract, LoadOMNI
 from .data_structures import TPA, TPADataset
+from .pipeline import DatasetJob, catalog_jobs, run_pipeline
+from .instrumentation import Instrumentation
@@ -0,0 +1,2 @@
+from .fixtures import make_fixtures
+from .suite import Benchmark, compare_results, default_benchmarks, load_results, run_benchmarks, save_results
@@ -0,0 +1,46 @@
+# Standard library
+import argparse
+import os
+import sys
+import tempfile
+# Self-written modules
+from .fixtures import make_fixtures
+from .suite import compare_results, default_benchmarks, format_result, load_results, run_benchmarks, save_results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m tpa_analysis.benchmarks',
+                                     description='Benchmarks of the TPA analysis with synthetic OMNI data and catalogs.')
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help='file the results are saved to')
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'tpa_analysis_benchmarks'),
+                        help='directory of the generated fixtures, which are reused between runs')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='number of times each benchmark is timed')
+    parser.add_argument('-q', '--quick', action='store_true', help='only run the smallest scale of each benchmark')
+    parser.add_argument('-k', '--select', default=None,
+                        help='only run the benchmarks with this text in their name, e.g. load_OMNI_data')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure the peak memory')
+    parser.add_argument('--compare', default=None, help='earlier results file to compare the median times with')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='a benchmark that is this many times slower than in --compare is a regression')
+    args = parser.parse_args(argv)
+
+    print(f'writing fixtures to {args.fixtures} (if needed)')
+    fixtures = make_fixtures(args.fixtures)
+    benchmarks = [benchmark for benchmark in default_benchmarks(fixtures, quick=args.quick)
+                  if args.select is None or args.select in benchmark.name]
+    results = run_benchmarks(benchmarks, repeat=args.repeat, measure_memory=not args.no_memory,
+                             progress=lambda result: print(format_result(result)))
+    save_results(results, args.output)
+    print(f'results saved to {args.output}')
+
+    if args.compare is None:
+        return 0
+    comparison = compare_results(load_results(args.compare), results, args.threshold)
+    for benchmark in comparison:
+        print(f'{benchmark["benchmark"]:<45} {benchmark["scale"]:<18} {benchmark["ratio"]:6.2f}x'
+              f'{"  REGRESSION" if benchmark["regression"] else ""}')
+    return 1 if any(benchmark['regression'] for benchmark in comparison) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
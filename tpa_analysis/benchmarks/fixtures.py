@@ -0,0 +1,258 @@
+# Standard library
+import calendar
+import datetime as dt
+import json
+import os
+from typing import List
+# Packages
+import numpy as np
+import openpyxl
+import pandas as pd
+import scipy.io
+# Self-written modules
+from ..data_extraction.excel_cache import cache_spreadsheet
+from ..data_extraction.test_OMNI import LoadOMNI
+from ..data_extraction.tpa_extract import DataExtract
+
+
+# Increase when the fixtures change, so that old fixtures are written again
+FIXTURE_VERSION = 3
+FIXTURE_START = dt.datetime(2015, 7, 1)
+FIXTURE_MONTHS = 3
+# Typical value and spread of the OMNI parameters. Other parameters are normally distributed around 0 with spread 1
+OMNI_DISTRIBUTIONS = {'BxGSE': (0, 4), 'ByGSE': (0, 4), 'BzGSE': (0, 3), 'ByGSM': (0, 4), 'BzGSM': (0, 3),
+                      '<B>': (6, 2), 'Bt': (6, 2), 'vel': (420, 90), 'vxGSE': (-420, 90), 'vyGSE': (0, 20),
+                      'vzGSE': (0, 20), 'n': (6, 4), 'Temp': (1e5, 5e4), 'Pdyn': (2, 1.2), 'Ey': (0, 1.5),
+                      'beta': (1, .8), 'MA': (10, 4), 'AE': (200, 180), 'AL': (-120, 120), 'AU': (80, 60),
+                      'SYM/H': (-10, 15), 'clock': (180, 100)}
+# Arguments that DataExtract passes to pd.read_excel for each spreadsheet, see write_spreadsheet
+CUMNOCK2009_FILENAME = 'Single_Multiple_Arcs_IMF_dipole_list_2015_AK_prel_dadu.xls'
+CUMNOCK2009_READ_ARGS = {'sheet_name': 'Sheet1', 'index_col': None, 'usecols': 'A, C, D, N'}
+CUMNOCK2005_FILENAME = 'listoftimes.xls'
+CUMNOCK2005_READ_ARGS = {'sheet_name': 'Sheet1', 'index_col': None, 'usecols': 'A, G, M', 'skiprows': [1, 2]}
+THOR_FILENAME = 'Sept_Oct_2015_TPAs_final_210518.xlsx'
+# Datasets of DataExtract that are read from the spreadsheets
+EXCEL_DATASETS = ['This study', 'Cumnock et al. (2009)', 'Cumnock (2005)']
+
+
+def write_OMNI_month(OMNI_dir: str, year: int, month: int, rng: np.random.Generator) -> str:
+    """Writes a fake monthly OMNI file (OMNI_1min_YYYYMM_Lv1.mat) in the same format as the real files: 'edesh'
+    (seconds since the start of the month, every minute except for a few data gaps), 'comp' (one column for each
+    parameter in LoadOMNI.full_para_list, NaN where data is missing) and 'sdate' ('YYYY-MM-DD').
+    Returns: path to the file.
+    """
+    minutes = np.arange(calendar.monthrange(year, month)[1] * 1440)
+    # Data gaps of up to a few hours
+    gap_starts = rng.choice(minutes.size, size=8, replace=False)
+    gap_lengths = rng.integers(10, 300, size=gap_starts.size)
+    missing = np.zeros(minutes.size, dtype=bool)
+    for gap_start, gap_length in zip(gap_starts, gap_lengths):
+        missing[gap_start:gap_start + gap_length] = True
+    minutes = minutes[~missing]
+
+    comp = np.empty((minutes.size, len(LoadOMNI.full_para_list)))
+    for i, paraname in enumerate(LoadOMNI.full_para_list):
+        mean, spread = OMNI_DISTRIBUTIONS.get(paraname, (0, 1))
+        # Slowly varying values, as in the solar wind
+        walk = np.cumsum(rng.normal(size=minutes.size)) / np.sqrt(minutes.size)
+        comp[:, i] = mean + spread * (walk + .3 * rng.normal(size=minutes.size))
+    comp[rng.random(comp.shape) < .05] = np.nan
+
+    path = os.path.join(OMNI_dir, f'OMNI_1min_{year}{month:02d}_Lv1.mat')
+    scipy.io.savemat(path, {'edesh': (minutes * 60.).reshape(-1, 1), 'comp': comp,
+                            'sdate': f'{year}-{month:02d}-01'})
+    return path
+
+
+def make_OMNI_archive(OMNI_dir: str, start: dt.datetime = FIXTURE_START, n_months: int = FIXTURE_MONTHS,
+                      seed: int = 0) -> List[str]:
+    os.makedirs(OMNI_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    months = pd.date_range(start, periods=n_months, freq='MS')
+    return [write_OMNI_month(OMNI_dir, month.year, month.month, rng) for month in months]
+
+
+def random_dates(rng: np.random.Generator, size: int, start: dt.datetime = FIXTURE_START,
+                 n_months: int = FIXTURE_MONTHS) -> List[dt.datetime]:
+    """Sorted random dates (whole minutes) between start + 1 day and the end of the OMNI fixtures."""
+    minutes = rng.integers(1440, n_months * 28 * 1440, size=size)
+    return [start + dt.timedelta(minutes=int(minute)) for minute in np.sort(minutes)]
+
+
+def write_kullen_catalog(tpa_dir: str, size: int, rng: np.random.Generator,
+                         filename: str = 'datafile_tpa_location.dat') -> str:
+    path = os.path.join(tpa_dir, filename)
+    with open(path, 'w') as catalog:
+        catalog.write('; date  type time MLT start  -  -  MLT end\n')
+        for date in random_dates(rng, size):
+            arc_type = rng.choice(['ab1', 'ab2', 'bd1'], p=[.8, .1, .1])
+            catalog.write(f'{date:%y%m%d} {arc_type} {date:%H%M} {rng.uniform(0, 24):.1f} x x '
+                          f'{rng.uniform(0, 24):.1f}\n')
+    return path
+
+
+def write_fear_catalog(tpa_dir: str, size: int, rng: np.random.Generator,
+                       filename: str = 'fear_TPA_data_frompaper.txt') -> str:
+    path = os.path.join(tpa_dir, filename)
+    with open(path, 'w') as catalog:
+        catalog.write('Nr Date Time - - - - MLT - Hemisphere Moving\n')
+        for i, date in enumerate(random_dates(rng, size)):
+            catalog.write(f'{i + 1} {date:%d-%b-%Y} {date:%H:%M} - - - - {rng.uniform(0, 24):.1f} - '
+                          f'{rng.choice(["N", "S"])} {rng.choice(["Y", "N"])}\n')
+    return path
+
+
+def write_reidy_catalog(tpa_dir: str, size: int, rng: np.random.Generator,
+                        filename: str = 'reidy_TPA_data.txt') -> str:
+    path = os.path.join(tpa_dir, filename)
+    with open(path, 'w') as catalog:
+        catalog.write('# Nr Day Month Year Time - - - - Hemisphere\n')
+        for i, date in enumerate(random_dates(rng, size)):
+            catalog.write(f'{i + 1} {date:%d %b %Y %H:%M} - - - - {rng.choice(["NS", "N", "S"])}\n')
+    return path
+
+
+def thor_spreadsheet(n_events: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Fake spreadsheet of new_thor_dataclean, as returned by pd.read_excel: one row for each image, with the northern
+    (Date to Notes) or southern (Date.1 to Notes.1) hemisphere filled in, and an empty row between events. Empty
+    cells are NaN and the times are datetime.time, like in the catalog."""
+    columns = ['Date', 'Time', 'Hemi-sphere', 'X1 dusk', 'X2', 'X3', 'X4 dawn', 'Notes', 'Conjugacy/FOV',
+               'Date.1', 'Time.1', 'Hemi-sphere.1', 'X1 dusk.1', 'X2.1', 'X3.1', 'X4 dawn.1', 'Notes.1']
+    comments = [np.nan, np.nan, np.nan, 'conjugate', 'non-conjugate', 'no image', 'multiple', 'multiple arcs',
+                '- ignore!']
+    rows = [[np.nan] * len(columns)]
+    for date in random_dates(rng, n_events):
+        for _ in range(rng.integers(1, 6)):
+            image_time = (date + dt.timedelta(minutes=int(rng.integers(0, 120)))).time()
+            n_arcs = int(rng.integers(0, 4))
+            positions = [round(position, 1) for position in rng.uniform(100, 350, n_arcs)] + [np.nan] * (4 - n_arcs)
+            comment = comments[rng.integers(len(comments))]
+            if rng.random() < .5:
+                rows.append([date.replace(hour=0, minute=0), image_time, 'N', *positions, np.nan, comment,
+                             *[np.nan] * 8])
+            else:
+                rows.append([date.replace(hour=0, minute=0), *[np.nan] * 6, np.nan, comment,
+                             date.replace(hour=0, minute=0), image_time, 'S', *positions, np.nan])
+        rows.append([np.nan] * len(columns))
+    spreadsheet = pd.DataFrame(rows[:-1], columns=columns)
+    for column in ['Date', 'Date.1']:
+        spreadsheet[column] = pd.to_datetime(spreadsheet[column], errors='coerce')
+    return spreadsheet
+
+
+def cumnock2009_spreadsheet(size: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Fake spreadsheet of cumnock2009_dataclean (the columns in CUMNOCK2009_READ_ARGS['usecols'])."""
+    rows = [[int(f'{date:%y%j}'), rng.choice(['n', 's']), f'{date:%H%M%S}-{date + dt.timedelta(minutes=30):%H%M%S}',
+             rng.choice(['dawn', 'dusk'])] for date in random_dates(rng, size)]
+    rows.append(['Single arcs', None, None, None])
+    return pd.DataFrame(rows, columns=['Date', 'Hemisphere', 'Time', 'Dawn/dusk'], dtype=object)
+
+
+def cumnock2005_spreadsheet(size: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Fake spreadsheet of cumnock2005_dataclean (the columns in CUMNOCK2005_READ_ARGS['usecols']). The dates are
+    from 2000-2003, so that the year and day of year are written as a number with fewer than 5 digits."""
+    dates = random_dates(rng, size, start=dt.datetime(2000 + int(rng.integers(0, 4)), 1, 1))
+    rows = [[int(f'{date:%y%j}'), f'{date:%H:%M:%S}', rng.choice(['dawn', 'dusk'])] for date in dates]
+    rows.append(['Do not use the events below', None, None])
+    return pd.DataFrame(rows, columns=['Date', 'Time', 'Dawn/dusk'], dtype=object)
+
+
+def excel_column_index(letters: str) -> int:
+    """Index of an Excel column, e.g. 0 for 'A' and 13 for 'N'."""
+    index = 0
+    for letter in letters.strip().upper():
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def write_spreadsheet(path: str, spreadsheet: pd.DataFrame, sheet_name: str = 'Sheet1', usecols: str = None,
+                      skiprows: List[int] = None, **read_args) -> str:
+    """Writes spreadsheet to a real Excel file, so that pd.read_excel(path, sheet_name=sheet_name, usecols=usecols,
+    skiprows=skiprows) parses it like the spreadsheets of the catalogs. The columns are placed in the Excel columns
+    of usecols (e.g. 'A, C, D, N') with unused columns in between, and the rows in skiprows are filled with notes.
+    Other arguments of pd.read_excel (e.g. index_col=None) are ignored.
+    The file is written with openpyxl (in the .xlsx format), also for .xls filenames: pd.read_excel detects the
+    format from the content of the file.
+    Returns: path.
+    """
+    if usecols is not None:
+        positions = [excel_column_index(letters) for letters in usecols.split(',')]
+        layout = pd.DataFrame(dict((f'Unused {position}', [None] * len(spreadsheet))
+                                   for position in range(max(positions) + 1)), index=spreadsheet.index)
+        for position, column in zip(positions, spreadsheet.columns):
+            layout[f'Unused {position}'] = spreadsheet[column]
+        spreadsheet = layout.rename(columns=dict((f'Unused {position}', column)
+                                                 for position, column in zip(positions, spreadsheet.columns)))
+    if skiprows:
+        rows = list(spreadsheet.astype(object).itertuples(index=False, name=None))
+        # Row 0 of the file is the header, so row i of the file is row i - 1 of the spreadsheet
+        for row_number in sorted(skiprows):
+            rows.insert(row_number - 1, ('Skipped row',) + (None,) * (spreadsheet.shape[1] - 1))
+        spreadsheet = pd.DataFrame(rows, columns=spreadsheet.columns)
+    # The cells are written with openpyxl instead of DataFrame.to_excel, which writes datetime.time as text, so that
+    # times are Excel time cells like in the catalogs. Empty cells (NaN, NaT, None) are left empty
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = sheet_name
+    sheet.append(list(spreadsheet.columns))
+    for row in spreadsheet.astype(object).itertuples(index=False, name=None):
+        sheet.append([None if pd.isnull(value) else value.to_pydatetime() if isinstance(value, pd.Timestamp)
+                      else value.item() if isinstance(value, np.generic) else value for value in row])
+    workbook.save(path)
+    return path
+
+
+def seed_spreadsheet(data_extractor: DataExtract, filename: str, spreadsheet: pd.DataFrame, **read_args) -> str:
+    """Writes a placeholder file for a spreadsheet and puts the spreadsheet in the parse cache of data_extractor (see
+    excel_cache), as if pd.read_excel(path, **read_args) had returned it, e.g. to check code that reads a spreadsheet
+    without an Excel writer.
+    Returns: path of the placeholder file.
+    """
+    path = data_extractor.data_dir + filename
+    with open(path, 'w') as placeholder:
+        placeholder.write(f'Fake spreadsheet with {len(spreadsheet)} rows, see tpa_analysis.benchmarks.fixtures\n')
+    cache_spreadsheet(spreadsheet, path, cache_dir=data_extractor.excel_cache_dir, **read_args)
+    return path
+
+
+def make_catalogs(tpa_dir: str, size: int, seed: int = 0) -> DataExtract:
+    """Writes fake catalogs of every format in DataExtract with about size TPAs each. The Kullen, Fear and Reidy
+    catalogs are text files and the other catalogs are Excel files (see write_spreadsheet). The spreadsheets are
+    parsed once, so that they are in the parse cache of DataExtract (see excel_cache).
+    Returns: a DataExtract for tpa_dir.
+    """
+    os.makedirs(tpa_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    data_extractor = DataExtract(tpa_dir)
+    write_kullen_catalog(tpa_dir, size, rng)
+    write_fear_catalog(tpa_dir, size, rng)
+    write_reidy_catalog(tpa_dir, size, rng)
+    write_spreadsheet(tpa_dir + THOR_FILENAME, thor_spreadsheet(max(size // 3, 1), rng))
+    write_spreadsheet(tpa_dir + CUMNOCK2009_FILENAME, cumnock2009_spreadsheet(size, rng), **CUMNOCK2009_READ_ARGS)
+    write_spreadsheet(tpa_dir + CUMNOCK2005_FILENAME, cumnock2005_spreadsheet(size, rng), **CUMNOCK2005_READ_ARGS)
+    for dataset_name in EXCEL_DATASETS:
+        list(data_extractor.get_tpas(dataset_name))
+    return data_extractor
+
+
+def make_fixtures(fixture_dir: str, catalog_sizes: List[int] = (100, 1000), seed: int = 0) -> dict:
+    """Writes all fixtures of the benchmarks into fixture_dir, unless they have already been written with the same
+    settings: an OMNI archive in OMNI/ and catalogs with each size in catalogs_<size>/.
+    Returns: the paths of the fixtures, {'OMNI': OMNI_dir, 'catalogs': {size: tpa_dir}}.
+    """
+    settings = {'version': FIXTURE_VERSION, 'seed': seed, 'start': str(FIXTURE_START), 'months': FIXTURE_MONTHS,
+                'catalog_sizes': sorted(catalog_sizes)}
+    fixtures = {'OMNI': os.path.join(fixture_dir, 'OMNI', ''),
+                'catalogs': dict((size, os.path.join(fixture_dir, f'catalogs_{size}', '')) for size in catalog_sizes)}
+    settings_path = os.path.join(fixture_dir, 'fixtures.json')
+    if os.path.exists(settings_path):
+        with open(settings_path) as settings_file:
+            if json.load(settings_file) == settings:
+                return fixtures
+
+    make_OMNI_archive(fixtures['OMNI'], seed=seed)
+    for size, tpa_dir in fixtures['catalogs'].items():
+        make_catalogs(tpa_dir, size, seed=seed + size)
+    with open(settings_path, 'w') as settings_file:
+        json.dump(settings, settings_file, indent=1)
+    return fixtures
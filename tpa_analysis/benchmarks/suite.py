@@ -0,0 +1,279 @@
+# Standard library
+import datetime as dt
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+# Packages
+import numpy as np
+import pandas as pd
+import scipy
+# Self-written modules
+from ..data_extraction.dipole_table import lookup_dipole_tilt
+from ..data_extraction.omni_cache import clear_OMNI_cache
+from ..data_extraction.test_OMNI import LoadOMNI
+from ..data_extraction.tpa_extract import DataExtract
+from ..data_structures.tpa import TPA
+from ..data_structures.tpa_dataset import TPADataset
+from ..statistics.analysis import compare_dists, compare_dists_batch
+from .fixtures import FIXTURE_START, THOR_FILENAME, random_dates
+
+
+# Increase when the format of the results file changes
+RESULTS_VERSION = 1
+PARAMETERS = ['BxGSE', 'ByGSM', 'BzGSM', 'vel']
+
+
+@dataclass
+class Benchmark:
+    """One benchmark of a function at one scale.
+    name (str): the function that is benchmarked, e.g. 'LoadOMNI.load_OMNI_data'.
+    scale (str): the scale of the benchmark, e.g. '1 month'.
+    setup (Callable): prepares the benchmark (not timed) and returns a function without arguments that is timed.
+                      setup is called before every repeat, so every repeat starts from the same state.
+    number (int): how many times the function is called in each repeat. The time of one call is reported.
+    """
+    name: str
+    scale: str
+    setup: Callable[[], Callable[[], object]]
+    number: int = 1
+
+
+def load_OMNI_benchmark(OMNI_dir: str, days: int, cached: bool = False) -> Callable[[], Callable[[], object]]:
+    def setup():
+        if not cached:
+            clear_OMNI_cache()
+        loader = LoadOMNI(FIXTURE_START, FIXTURE_START + dt.timedelta(days=days) - dt.timedelta(minutes=1),
+                          data_dir=OMNI_dir)
+        return lambda: loader.load_OMNI_data(paras_in=PARAMETERS)
+    return setup
+
+
+def tpa_benchmark(method: Callable[[TPA], object], n_tpas: int, seed: int = 0,
+                  clear_cache: bool = False) -> Callable[[], Callable[[], object]]:
+    """Calls method for n_tpas TPAs at random dates."""
+    dates = random_dates(np.random.default_rng(seed), n_tpas)
+
+    def setup():
+        if clear_cache:
+            clear_OMNI_cache()
+        tpas = [TPA(date, hemisphere='n') for date in dates]
+        return lambda: [method(tpa) for tpa in tpas]
+    return setup
+
+
+def append_benchmark(n_tpas: int, seed: int = 0) -> Callable[[], Callable[[], object]]:
+    rng = np.random.default_rng(seed)
+    tpas = [TPA(date, hemisphere='n', dadu='dawn', moving='yes') for date in random_dates(rng, n_tpas)]
+    for tpa in tpas:
+        tpa.dipole = rng.normal(scale=20)
+        for paraname in PARAMETERS:
+            setattr(tpa, paraname, rng.normal())
+
+    def setup():
+        dataset = TPADataset('benchmark', 20, 100, FIXTURE_START, FIXTURE_START)
+        return lambda: [dataset.append(tpa) for tpa in tpas]
+    return setup
+
+
+def dataset_parameters_benchmark(OMNI_dir: str, days: int) -> Callable[[], Callable[[], object]]:
+    def setup():
+        clear_OMNI_cache()
+        dataset = TPADataset('benchmark', 20, 100, FIXTURE_START,
+                             FIXTURE_START + dt.timedelta(days=days) - dt.timedelta(minutes=1))
+        return lambda: dataset.get_dataset_parameters(OMNI_dir, PARAMETERS + ['dipole'])
+    return setup
+
+
+def catalog_benchmark(tpa_dir: str, dataset_name: str, cache_excel: bool = True,
+                      **kwargs) -> Callable[[], Callable[[], object]]:
+    """get_tpas of a catalog. Without cache_excel, the spreadsheets are parsed with pd.read_excel in every call."""
+    def setup():
+        data_extractor = DataExtract(tpa_dir, cache_excel=cache_excel)
+        return lambda: list(data_extractor.get_tpas(dataset_name, **kwargs))
+    return setup
+
+
+def check_thor_spreadsheet(tpa_dir: str):
+    """Checks that the times of the fake spreadsheet of new_thor_dataclean are read back as datetime.time, like the
+    times of the catalog, so that the benchmarks parse the same input as the real spreadsheet."""
+    spreadsheet = pd.read_excel(tpa_dir + THOR_FILENAME)
+    for column in ['Time', 'Time.1']:
+        times = spreadsheet[column].dropna()
+        if times.empty or not all(isinstance(time, dt.time) for time in times):
+            raise ValueError(f'The {column} column of {tpa_dir + THOR_FILENAME} is not read as datetime.time. '
+                             f'Write the fixtures again with fixtures.make_fixtures.')
+
+
+def compare_dists_benchmark(n_bins: int, seed: int = 0) -> Callable[[], Callable[[], object]]:
+    """compare_dists with a background where many bins (in the tails) have fewer than 5 counts and have to be merged."""
+    rng = np.random.default_rng(seed)
+    bins = np.linspace(-5, 5, n_bins + 1)
+    sample = np.histogram(rng.normal(.2, size=5 * n_bins), bins)[0]
+    # The expected counts of the sample, from the distribution of a larger background
+    background = np.histogram(rng.normal(size=50 * n_bins), bins)[0]
+    comparison = background * sample.sum() / background.sum()
+    return lambda: lambda: compare_dists(sample, comparison, bins)
+
+
+def compare_dists_batch_benchmark(n_histograms: int, n_bins: int = 40,
+                                  seed: int = 0) -> Callable[[], Callable[[], object]]:
+    """compare_dists_batch of n_histograms histograms like in compare_dists_benchmark."""
+    rng = np.random.default_rng(seed)
+    bins = np.linspace(-5, 5, n_bins + 1)
+    samples, comparisons = [], []
+    for _ in range(n_histograms):
+        sample = np.histogram(rng.normal(.2, size=5 * n_bins), bins)[0]
+        background = np.histogram(rng.normal(size=50 * n_bins), bins)[0]
+        samples.append(sample)
+        comparisons.append(background * sample.sum() / background.sum())
+    return lambda: lambda: compare_dists_batch(samples, comparisons, [bins] * n_histograms)
+
+
+def default_benchmarks(fixtures: dict, quick: bool = False) -> List[Benchmark]:
+    """The benchmarks of the extraction -> parameters -> statistics pipeline at several scales.
+    Inputs:
+    fixtures (dict): paths of the fixtures, see fixtures.make_fixtures.
+    quick (bool): only run the smallest scale of each benchmark.
+    """
+    OMNI_dir = fixtures['OMNI']
+    catalog_sizes = sorted(fixtures['catalogs'])
+
+    def scales(*values):
+        return values[:1] if quick else values
+
+    def days_scale(days):
+        return f'{days} day' if days == 1 else f'{days} days'
+
+    benchmarks = []
+    for days in scales(1, 30, 90):
+        benchmarks.append(Benchmark('LoadOMNI.load_OMNI_data', days_scale(days), load_OMNI_benchmark(OMNI_dir, days)))
+    benchmarks.append(Benchmark('LoadOMNI.load_OMNI_data', '30 days (cached)',
+                                load_OMNI_benchmark(OMNI_dir, 30, cached=True)))
+    for n_tpas in scales(10, 100):
+        benchmarks.append(Benchmark('TPA.get_parameters', f'{n_tpas} TPAs', tpa_benchmark(
+            lambda tpa: tpa.get_parameters(OMNI_dir, PARAMETERS, 100, 20), n_tpas, clear_cache=True)))
+    for n_tpas in scales(100, 1000):
+        benchmarks.append(Benchmark('TPA.get_dipole_data', f'{n_tpas} TPAs', tpa_benchmark(
+            lambda tpa: tpa.get_dipole_data(20), n_tpas)))
+    for n_tpas in scales(1000, 10000):
+        benchmarks.append(Benchmark('TPADataset.append', f'{n_tpas} TPAs', append_benchmark(n_tpas)))
+    for days in scales(30, 90):
+        benchmarks.append(Benchmark('TPADataset.get_dataset_parameters', days_scale(days),
+                                    dataset_parameters_benchmark(OMNI_dir, days)))
+    for size in scales(*catalog_sizes):
+        tpa_dir = fixtures['catalogs'][size]
+        check_thor_spreadsheet(tpa_dir)
+        benchmarks.append(Benchmark('DataExtract.new_thor_dataclean', f'{size // 3} events',
+                                    catalog_benchmark(tpa_dir, 'This study')))
+        for dataset_name in ['Kullen et al. (2002)', 'Fear & Milan (2012)', 'Reidy et al. (2018)',
+                             'Cumnock et al. (2009)', 'Cumnock (2005)']:
+            benchmarks.append(Benchmark(f'DataExtract.get_tpas({dataset_name!r})', f'{size} TPAs',
+                                        catalog_benchmark(tpa_dir, dataset_name)))
+        # The same catalogs with parsing the spreadsheets
+        benchmarks.append(Benchmark('DataExtract.new_thor_dataclean', f'{size // 3} events (uncached)',
+                                    catalog_benchmark(tpa_dir, 'This study', cache_excel=False)))
+        for dataset_name in ['Cumnock et al. (2009)', 'Cumnock (2005)']:
+            benchmarks.append(Benchmark(f'DataExtract.get_tpas({dataset_name!r})', f'{size} TPAs (uncached)',
+                                        catalog_benchmark(tpa_dir, dataset_name, cache_excel=False)))
+    for n_bins in scales(10, 100, 1000):
+        benchmarks.append(Benchmark('compare_dists', f'{n_bins} bins', compare_dists_benchmark(n_bins),
+                                    number=max(1000 // n_bins, 1)))
+    for n_histograms in scales(10, 1000):
+        benchmarks.append(Benchmark('compare_dists_batch', f'{n_histograms} histograms',
+                                    compare_dists_batch_benchmark(n_histograms)))
+    return benchmarks
+
+
+def time_benchmark(benchmark: Benchmark, repeat: int = 5, measure_memory: bool = True) -> dict:
+    """Times benchmark `repeat` times, and measures its peak memory (with tracemalloc) in one more repeat.
+    Returns: the results of the benchmark, with the time of each repeat in seconds (per call), the best and median
+    time and the peak memory in bytes that was allocated during a call (None if measure_memory is False).
+    """
+    times = []
+    for _ in range(repeat):
+        function = benchmark.setup()
+        start = time.perf_counter()
+        for _ in range(benchmark.number):
+            function()
+        times.append((time.perf_counter() - start) / benchmark.number)
+
+    peak_memory = None
+    if measure_memory:
+        function = benchmark.setup()
+        tracemalloc.start()
+        try:
+            start_memory = tracemalloc.get_traced_memory()[0]
+            function()
+            peak_memory = tracemalloc.get_traced_memory()[1] - start_memory
+        finally:
+            tracemalloc.stop()
+    return {'benchmark': benchmark.name, 'scale': benchmark.scale, 'number': benchmark.number, 'repeat': repeat,
+            'times': times, 'best': min(times), 'median': statistics.median(times), 'peak_memory': peak_memory}
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(benchmarks: List[Benchmark], repeat: int = 5, measure_memory: bool = True,
+                   progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """Runs the benchmarks one after another.
+    Returns: the results in the format that is saved by save_results: {'metadata': ..., 'results': [...]}, where
+    'results' has one dict for each benchmark, see time_benchmark.
+    """
+    # The dipole tilt table is built the first time it is used, which should not be part of the benchmarks
+    lookup_dipole_tilt(np.zeros(1))
+    results = []
+    for benchmark in benchmarks:
+        results.append(time_benchmark(benchmark, repeat, measure_memory))
+        if progress is not None:
+            progress(results[-1])
+    metadata = {'version': RESULTS_VERSION, 'date': dt.datetime.now().isoformat(timespec='seconds'),
+                'revision': git_revision(), 'python': platform.python_version(), 'platform': platform.platform(),
+                'numpy': np.__version__, 'pandas': pd.__version__, 'scipy': scipy.__version__}
+    return {'metadata': metadata, 'results': results}
+
+
+def save_results(results: dict, path: str):
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=1)
+
+
+def load_results(path: str) -> dict:
+    with open(path) as results_file:
+        results = json.load(results_file)
+    if results['metadata']['version'] != RESULTS_VERSION:
+        raise ValueError(f'{path} has results of version {results["metadata"]["version"]}, not {RESULTS_VERSION}.')
+    return results
+
+
+def compare_results(old: dict, new: dict, threshold: float = 1.25) -> List[dict]:
+    """Compares the median times of the benchmarks that are in both results.
+    Returns: one dict for each benchmark with the old and new median time, their ratio (new / old) and whether the
+    benchmark is a regression (the ratio is above threshold).
+    """
+    old_results = dict(((result['benchmark'], result['scale']), result) for result in old['results'])
+    comparison = []
+    for result in new['results']:
+        old_result = old_results.get((result['benchmark'], result['scale']))
+        if old_result is None:
+            continue
+        ratio = result['median'] / old_result['median']
+        comparison.append({'benchmark': result['benchmark'], 'scale': result['scale'], 'old': old_result['median'],
+                           'new': result['median'], 'ratio': ratio, 'regression': ratio > threshold})
+    return comparison
+
+
+def format_result(result: dict) -> str:
+    memory = '' if result['peak_memory'] is None else f'{result["peak_memory"] / 2**20:9.1f} MiB'
+    return f'{result["benchmark"]:<45} {result["scale"]:<18} {result["median"] * 1e3:11.3f} ms {memory}'
@@ -1,2 +1,5 @@
 from .test_OMNI import LoadOMNI
+from .omni_cache import OMNI_cache, OMNI_cache_info, clear_OMNI_cache
+from .omni_store import OMNIStore, convert_OMNI_archive, ingest_OMNI_files, read_summary, update_summaries
+from .time_index import TimeIndex
 from .tpa_extract import DataExtract
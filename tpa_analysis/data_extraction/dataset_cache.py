@@ -0,0 +1,158 @@
+# Standard library
+import datetime as dt
+import glob
+import hashlib
+import json
+import os
+import shutil
+from functools import lru_cache
+from typing import Iterable, List, Optional
+# Packages
+import numpy as np
+# Self-written modules
+from .omni_store import column_filename
+
+
+# Increase when the format of the cache changes
+CACHE_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+# The dataset attributes that are cached, each a dict of 1D arrays
+GROUPS = ['total', 'tpa_values', 'tpa_properties']
+
+
+@lru_cache(maxsize=None)
+def code_version() -> str:
+    """Hash of the code that extracts and calculates the datasets (the whole package except for plotting and
+    benchmarks, e.g. also statistics.windows, which averages the parameters of the TPAs), so that cached datasets are
+    recalculated automatically when the code changes."""
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code_hash = hashlib.sha1(str(CACHE_VERSION).encode())
+    for path in sorted(glob.glob(os.path.join(package_dir, '**', '*.py'), recursive=True)):
+        if os.path.relpath(path, package_dir).split(os.sep)[0] not in ('plotting', 'benchmarks'):
+            with open(path, 'rb') as code_file:
+                code_hash.update(code_file.read())
+    return code_hash.hexdigest()[:12]
+
+
+def file_hash(path: str) -> str:
+    file_sha = hashlib.sha1()
+    with open(path, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(2**20), b''):
+            file_sha.update(block)
+    return file_sha.hexdigest()
+
+
+def dataset_key(dataset, parameters: Iterable[str], source_files: Iterable[str] = (),
+                settings: Optional[dict] = None) -> str:
+    """Key of a dataset in the cache. Everything that changes the content of the dataset is part of the key: the
+    name, period, time shift and averaging time of the dataset, the parameters, the content of the source files (e.g.
+    the TPA catalog), other settings (e.g. the keyword arguments of DataExtract.get_tpas) and the code version.
+    Inputs:
+    dataset (TPADataset): the dataset.
+    parameters (Iterable[str]): the calculated parameters.
+    source_files (Iterable[str]): paths to the files the dataset is extracted from, see DataExtract.source_file.
+    settings (dict): other settings that change the dataset. The values have to be convertible to strings.
+    """
+    key_content = {'version': CACHE_VERSION,
+                   'code': code_version(),
+                   'name': dataset.name,
+                   'start_time': str(dataset.start_time),
+                   'end_time': str(dataset.end_time),
+                   'time_shift': dataset.time_shift,
+                   'average_calctime': dataset.average_calctime,
+                   'parameters': sorted(parameters),
+                   # The name of the file does not matter, only its content
+                   'sources': sorted(file_hash(path) for path in source_files),
+                   'settings': dict((name, str(value)) for name, value in (settings or {}).items())}
+    return hashlib.sha256(json.dumps(key_content, sort_keys=True, default=str).encode()).hexdigest()[:24]
+
+
+def to_plain_array(values) -> (np.ndarray, str):
+    """Converts a column into an array that can be saved and loaded without pickle.
+    Object columns (e.g. the dates, or strings mixed with None) are converted into datetime64 or fixed-width strings.
+    Returns: the array and the dtype that the column has to be converted back into when it is loaded.
+    """
+    array = np.asarray(values)
+    if array.dtype.kind != 'O':
+        return array, str(array.dtype)
+    if all(isinstance(value, (dt.date, np.datetime64)) for value in array):
+        return array.astype('datetime64[us]'), 'object'
+    if all(isinstance(value, (str, type(None))) for value in array):
+        # None (e.g. an unknown dadu) is saved as '' and restored as None
+        none_mask = np.array([value is None for value in array], dtype=bool)
+        strings = np.array(['' if value is None else value for value in array], dtype=str)
+        if none_mask.any() and (strings[~none_mask] == '').any():
+            raise TypeError('Columns with both None and empty strings can not be cached.')
+        return strings, 'object' if none_mask.any() else str(strings.dtype)
+    raise TypeError(f'Columns of dtype object with values of type {type(array[0]).__name__} can not be cached.')
+
+
+def from_plain_array(array: np.ndarray, dtype: str):
+    if dtype != 'object':
+        return array
+    if array.dtype.kind == 'M':
+        return np.asarray(array).astype(object)
+    return np.array([None if value == '' else value for value in array.tolist()], dtype=object)
+
+
+class DatasetCache:
+    """Content-addressed cache of the calculated values of TPADatasets.
+    Every dataset is saved in its own directory named after dataset_key, with one uncompressed .npy file per column
+    (which is memory-mapped when it is loaded) and a manifest with the settings. Changing any of the inputs of the key
+    gives a new key, so outdated datasets are never loaded and do not have to be removed by hand.
+    Inputs:
+    cache_dir (str): directory of the cache.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.path(key), MANIFEST_NAME))
+
+    def save(self, dataset, key: str, settings: Optional[dict] = None):
+        """Saves the total, tpa_values and tpa_properties of the dataset under key."""
+        entry_dir = self.path(key)
+        tmp_dir = entry_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        manifest = {'version': CACHE_VERSION, 'name': dataset.name,
+                    'settings': dict((name, str(value)) for name, value in (settings or {}).items())}
+        for group in GROUPS:
+            manifest[group] = {}
+            for i, (column_name, values) in enumerate(getattr(dataset, group).items()):
+                array, dtype = to_plain_array(values)
+                filename = f'{group}_{i:02d}_{column_filename(column_name)}'
+                np.save(os.path.join(tmp_dir, filename), array, allow_pickle=False)
+                manifest[group][column_name] = {'file': filename, 'dtype': dtype}
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=1)
+        # Replace the entry in one step so that other processes never load a half-written dataset
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+
+    def load(self, dataset, key: str, mmap_mode: Optional[str] = 'r') -> bool:
+        """Loads the total, tpa_values and tpa_properties of the dataset saved under key into dataset.
+        The numeric columns are memory-mapped (read-only) unless mmap_mode is None.
+        Returns: True if the dataset was cached, otherwise False (and the dataset is not changed).
+        """
+        if key not in self:
+            return False
+        entry_dir = self.path(key)
+        with open(os.path.join(entry_dir, MANIFEST_NAME)) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest['version'] != CACHE_VERSION:
+            return False
+        for group in GROUPS:
+            setattr(dataset, group, dict(
+                (column_name, from_plain_array(np.load(os.path.join(entry_dir, column['file']), mmap_mode=mmap_mode,
+                                                       allow_pickle=False), column['dtype']))
+                for column_name, column in manifest[group].items()))
+        return True
+
+    def keys(self) -> List[str]:
+        return sorted(os.path.basename(os.path.dirname(path))
+                      for path in glob.glob(os.path.join(self.cache_dir, '*', MANIFEST_NAME)))
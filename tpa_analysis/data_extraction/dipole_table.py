@@ -0,0 +1,121 @@
+# Standard library
+import datetime as dt
+import hashlib
+import json
+import os
+from functools import lru_cache
+# Packages
+import numpy as np
+from geopack import geopack
+# Self-written modules
+from .dipole_tilt import dipole_tilt, to_unix_seconds
+
+
+# Increase when the way the table is calculated changes, so that old tables are rebuilt
+TABLE_VERSION = 1
+TABLE_START = dt.datetime(1960, 1, 1)
+TABLE_STOP = dt.datetime(2030, 1, 1)
+TABLE_STEP = 300  # seconds
+DEFAULT_TABLE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'tpa_analysis')
+
+
+def igrf_hash() -> str:
+    """Hash of the IGRF dipole coefficients used by geopack. A table built with other coefficients is rebuilt."""
+    geopack.load_igrf(0.)
+    coefficients = np.concatenate([geopack.yruts, geopack.igrf['g'][1:3].ravel(), geopack.igrf['h'][2]])
+    return hashlib.sha1(np.ascontiguousarray(coefficients, dtype=float).tobytes()).hexdigest()[:12]
+
+
+def table_path(table_dir: str = None, start: dt.datetime = TABLE_START, stop: dt.datetime = TABLE_STOP,
+               step: int = TABLE_STEP) -> str:
+    table_dir = DEFAULT_TABLE_DIR if table_dir is None else table_dir
+    return os.path.join(table_dir, f'dipole_tilt_v{TABLE_VERSION}_{start:%Y%m%d}_{stop:%Y%m%d}_{step}s.npy')
+
+
+def build_dipole_table(table_dir: str = None, start: dt.datetime = TABLE_START, stop: dt.datetime = TABLE_STOP,
+                       step: int = TABLE_STEP, chunk_size: int = 2**20) -> str:
+    """Calculates the dipole tilt (in degrees, as float32) every `step` seconds between `start` and `stop` and saves
+    it to `table_dir`, together with a .json file with the settings of the table and its largest interpolation error.
+    Returns: path to the table.
+    """
+    path = table_path(table_dir, start, stop, step)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    start_ut, stop_ut = to_unix_seconds([start, stop])
+    size = int((stop_ut - start_ut) // step) + 1
+
+    table = np.empty(size, dtype=np.float32)
+    max_error = 0.
+    for chunk_start in range(0, size, chunk_size):
+        ut = start_ut + step * np.arange(chunk_start, min(chunk_start + chunk_size, size), dtype=float)
+        table[chunk_start:chunk_start + ut.size] = dipole_tilt(ut)
+
+    # The linear interpolation error is largest between the samples, so check the error at all midpoints
+    for chunk_start in range(0, size - 1, chunk_size):
+        chunk = slice(chunk_start, min(chunk_start + chunk_size, size - 1))
+        midpoints = start_ut + step * (np.arange(chunk.start, chunk.stop, dtype=float) + 0.5)
+        interpolated = (table[chunk].astype(float) + table[chunk.start + 1:chunk.stop + 1]) / 2
+        max_error = max(max_error, np.abs(interpolated - dipole_tilt(midpoints)).max())
+
+    # Write to temporary files first so that other processes never read half-written tables
+    with open(path + '.tmp', 'wb') as table_file:
+        np.save(table_file, table)
+    with open(path + '.json.tmp', 'w') as meta_file:
+        json.dump({'version': TABLE_VERSION, 'start': start_ut, 'step': step, 'size': size, 'igrf': igrf_hash(),
+                   'max_error': max_error}, meta_file, indent=1)
+    os.replace(path + '.tmp', path)
+    os.replace(path + '.json.tmp', path + '.json')
+    return path
+
+
+class DipoleTiltTable:
+    """Precomputed dipole tilt angles that are linearly interpolated to any time within the table."""
+
+    def __init__(self, path: str):
+        with open(path + '.json') as meta_file:
+            meta = json.load(meta_file)
+        self.path = path
+        self.start = meta['start']
+        self.step = meta['step']
+        self.igrf = meta['igrf']
+        # Largest error (in degrees) of the interpolated dipole tilt compared to dipole_tilt.dipole_tilt
+        self.max_error = meta['max_error']
+        self.table = np.load(path, mmap_mode='r')
+        self.stop = self.start + self.step * (self.table.size - 1)
+
+    def __call__(self, times) -> np.ndarray:
+        """Dipole tilt in degrees at `times` (datetimes or seconds since 1970-01-01).
+        Times outside of the table are calculated with dipole_tilt.dipole_tilt instead."""
+        ut = to_unix_seconds(times)
+        position = (ut - self.start) / self.step
+        inside = (ut >= self.start) & (ut <= self.stop)
+        index = np.clip(np.floor(position), 0, self.table.size - 2).astype(np.intp)
+        fraction = position - index
+        tilt = np.asarray(self.table[index] * (1 - fraction) + self.table[index + 1] * fraction)
+        if not inside.all():
+            tilt[~inside] = dipole_tilt(ut[~inside])
+        return tilt
+
+
+@lru_cache(maxsize=None)
+def load_dipole_table(table_dir: str = None) -> DipoleTiltTable:
+    """Load the dipole tilt table from `table_dir`. The table is built the first time and whenever it was built with
+    other IGRF coefficients than the ones geopack uses now."""
+    path = table_path(table_dir)
+    if os.path.exists(path) and os.path.exists(path + '.json'):
+        table = DipoleTiltTable(path)
+        if table.igrf == igrf_hash():
+            return table
+    return DipoleTiltTable(build_dipole_table(table_dir))
+
+
+def lookup_dipole_tilt(times, table_dir: str = None) -> np.ndarray:
+    """Dipole tilt in degrees at `times` (datetimes or seconds since 1970-01-01), interpolated from the precomputed
+    table. The error compared to dipole_tilt.dipole_tilt is at most load_dipole_table().max_error degrees."""
+    return load_dipole_table(table_dir)(times)
+
+
+if __name__ == '__main__':
+    table = load_dipole_table()
+    ut = np.random.default_rng(0).uniform(table.start, table.stop, 10**6)
+    print(f'Largest interpolation error: {table.max_error:.2e} degrees '
+          f'(random times: {np.abs(table(ut) - dipole_tilt(ut)).max():.2e} degrees)')
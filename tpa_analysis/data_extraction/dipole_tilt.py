@@ -0,0 +1,104 @@
+# Standard library
+import datetime as dt
+# Packages
+import numpy as np
+from geopack import geopack
+
+
+def to_unix_seconds(times) -> np.ndarray:
+    """Convert datetimes (datetime.datetime, numpy.datetime64 or arrays of them) or seconds since 1970-01-01 into
+    seconds since 1970-01-01 as floats."""
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.number):
+        return times.astype(float)
+    return (times.astype('datetime64[us]') - np.datetime64(0, 'us')) / np.timedelta64(1, 's')
+
+
+def dipole_coefficients(ut: np.ndarray):
+    """Dipole IGRF coefficients g10, g11, h11 at the times `ut` (seconds since 1970-01-01).
+    Uses the coefficients loaded by geopack and the same linear interpolation (and extrapolation outside of the IGRF
+    epochs) as geopack.load_igrf."""
+    # geopack loads the IGRF coefficients when it is imported, but load_igrf initializes them if it has not
+    geopack.load_igrf(0.)
+    yruts = geopack.yruts
+    # (n, m) = (1, 0) and (1, 1) have index 1 and 2. The Schmidt normalization factor is 1 for n = 1.
+    g = geopack.igrf['g'][1:3, :]
+    h = geopack.igrf['h'][2, :]
+
+    yridx = np.clip(np.searchsorted(yruts, ut, side='right') - 1, 0, yruts.size - 2)
+    f1 = (ut - yruts[yridx]) / (yruts[yridx + 1] - yruts[yridx])
+    f0 = 1 - f1
+    g10 = -(g[0, yridx] * f0 + g[0, yridx + 1] * f1)
+    g11 = -(g[1, yridx] * f0 + g[1, yridx + 1] * f1)
+    h11 = -(h[yridx] * f0 + h[yridx + 1] * f1)
+    return g10, g11, h11
+
+
+def sun_direction(ut: np.ndarray):
+    """Greenwich mean sidereal time (in radians, not reduced to [0, 2 pi)) and the unit vector pointing to the sun in GEI at the times `ut`
+    (seconds since 1970-01-01). Same approximation as geopack.sun."""
+    # Days since J2000
+    d = ut * (1. / 86400) + 2440587.5 - 2451545.0
+    # Mean obliquity of the ecliptic
+    e = 0.4090877233749509 - 6.2831853e-9 * d
+    # Mean anomaly and mean longitude of the sun. Unlike geopack.sun, the angles are not reduced modulo 2 pi as they are
+    # only used in sin and cos. This changes the result by less than 1e-12 radians.
+    g = 6.2400582213628066 + 0.0172019699945780 * d
+    q = 4.8949329668507771 + 0.0172027916955899 * d
+    # Geocentric apparent ecliptic longitude
+    ecliptic_longitude = q + 0.0334230551756914 * np.sin(g) + 0.0003490658503989 * np.sin(2 * g)
+    # (cos(sdec)*cos(srasn), cos(sdec)*sin(srasn), sin(sdec)) without calculating the declination and right ascension
+    sin_longitude = np.sin(ecliptic_longitude)
+    sun_x = np.cos(ecliptic_longitude)
+    sun_y = np.cos(e) * sin_longitude
+    sun_z = np.sin(e) * sin_longitude
+    gst = 4.894961212735792 + 6.30038809898489 * d
+    return gst, sun_x, sun_y, sun_z
+
+
+def dipole_tilt(times, degrees: bool = True, chunk_size: int = 2**13) -> np.ndarray:
+    """Calculates the dipole tilt angle of the Earth for all `times` at once.
+    Gives the same result as geopack.recalc(ut) (to within floating point rounding), but for whole arrays of times.
+    Inputs:
+    times (array_like): datetimes or seconds since 1970-01-01.
+    degrees (bool): return the dipole tilt in degrees instead of radians.
+    chunk_size (int): number of times that are calculated together. Keeps the temporary arrays in the CPU cache.
+    Returns: the dipole tilt angle for each time.
+    """
+    ut = to_unix_seconds(times)
+    psi = np.empty(ut.shape)
+    ut_flat = ut.reshape(-1)
+    psi_flat = psi.reshape(-1)
+    for chunk_start in range(0, ut_flat.size, chunk_size):
+        chunk = slice(chunk_start, chunk_start + chunk_size)
+        psi_flat[chunk] = _dipole_tilt(ut_flat[chunk])
+    return np.degrees(psi, out=psi) if degrees else psi
+
+
+def _dipole_tilt(ut: np.ndarray) -> np.ndarray:
+    """Dipole tilt angle in radians, following geopack.recalc."""
+    g10, g11, h11 = dipole_coefficients(ut)
+
+    # Unit vector of the dipole axis in GEO: (sin(teta0)*cos(lambda0), sin(teta0)*sin(lambda0), cos(teta0))
+    sqr = np.sqrt(g10**2 + g11**2 + h11**2)
+    stcl = g11 / sqr
+    stsl = h11 / sqr
+    ct0 = g10 / sqr
+
+    gst, sun_x, sun_y, sun_z = sun_direction(ut)
+    cgst = np.cos(gst)
+    sgst = np.sin(gst)
+    # The tilt angle is arcsin of the dot product of the dipole axis and the direction to the sun, both in GEI
+    sps = (stcl * cgst - stsl * sgst) * sun_x + (stcl * sgst + stsl * cgst) * sun_y + ct0 * sun_z
+    return np.arcsin(sps)
+
+
+if __name__ == '__main__':
+    # Check that the vectorized dipole tilt is equal to the one from geopack
+    rng = np.random.default_rng(0)
+    ut = rng.uniform((dt.datetime(1960, 1, 1) - dt.datetime(1970, 1, 1)).total_seconds(),
+                     (dt.datetime(2030, 1, 1) - dt.datetime(1970, 1, 1)).total_seconds(), 10000)
+    geopack_tilt = np.array([geopack.recalc(t) for t in ut])
+    max_difference = np.abs(dipole_tilt(ut, degrees=False) - geopack_tilt).max()
+    print(f'Largest difference to geopack.recalc: {max_difference:.3e} rad')
+    assert max_difference < 1e-10
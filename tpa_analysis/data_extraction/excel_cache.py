@@ -0,0 +1,55 @@
+# Standard library
+import glob
+import hashlib
+import os
+# Packages
+import pandas as pd
+
+
+# Increase when the format of the cache changes
+EXCEL_CACHE_VERSION = 1
+
+
+def excel_cache_names(path: str, *args, **kwargs) -> (str, str):
+    """Names of the cached spreadsheet: a hash of the absolute path and the arguments of pd.read_excel, and a hash of
+    the size and modification time of the spreadsheet (which changes when the spreadsheet is modified)."""
+    read_hash = hashlib.sha1(repr((os.path.abspath(path), args, sorted(kwargs.items()))).encode()).hexdigest()[:16]
+    stat = os.stat(path)
+    version_hash = hashlib.sha1(repr((EXCEL_CACHE_VERSION, pd.__version__, stat.st_size,
+                                      stat.st_mtime_ns)).encode()).hexdigest()[:12]
+    return read_hash, version_hash
+
+
+def read_excel_cached(path: str, *args, cache_dir: str = None, **kwargs):
+    """Same as pd.read_excel(path, *args, **kwargs), but the parsed spreadsheet is saved in cache_dir and read from
+    there until the spreadsheet is modified (its size or modification time changes). Reading the cache is much faster
+    than parsing the spreadsheet again. The spreadsheet is parsed every time if cache_dir is None.
+    """
+    if cache_dir is None:
+        return pd.read_excel(path, *args, **kwargs)
+    read_hash, version_hash = excel_cache_names(path, *args, **kwargs)
+    cache_path = os.path.join(cache_dir, f'{read_hash}_{version_hash}.pkl')
+    if os.path.exists(cache_path):
+        return pd.read_pickle(cache_path)
+
+    spreadsheet = pd.read_excel(path, *args, **kwargs)
+    cache_spreadsheet(spreadsheet, path, *args, cache_dir=cache_dir, **kwargs)
+    return spreadsheet
+
+
+def cache_spreadsheet(spreadsheet, path: str, *args, cache_dir: str, **kwargs) -> str:
+    """Saves spreadsheet, the result of pd.read_excel(path, *args, **kwargs), in cache_dir. See read_excel_cached.
+    Returns: path of the cached spreadsheet.
+    """
+    read_hash, version_hash = excel_cache_names(path, *args, **kwargs)
+    cache_path = os.path.join(cache_dir, f'{read_hash}_{version_hash}.pkl')
+    os.makedirs(cache_dir, exist_ok=True)
+    # Remove the spreadsheet cached before it was modified
+    for outdated_path in glob.glob(os.path.join(cache_dir, f'{read_hash}_*.pkl')):
+        if outdated_path != cache_path:
+            os.remove(outdated_path)
+    # Replace the file in one step so that other processes never read a half-written spreadsheet
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    pd.to_pickle(spreadsheet, tmp_path)
+    os.replace(tmp_path, cache_path)
+    return cache_path
@@ -0,0 +1,80 @@
+# Standard library
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Hashable, Optional
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'entries', 'nbytes', 'max_bytes'])
+
+
+class OMNICache:
+    """Least recently used cache of decoded OMNI months, bounded by the total size in bytes of the cached arrays.
+    Used by LoadOMNI.load_OMNI_data so that many TPAs in the same month only decode the .mat file once.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 2**20):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[object]:
+        """Returns the cached value for `key` or None if it is not cached."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def put(self, key: Hashable, value: object, nbytes: int):
+        """Add `value` (taking up `nbytes` bytes) to the cache, evicting the least recently used months if needed.
+        Values larger than the cache are not stored."""
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, nbytes)
+            self._nbytes += nbytes
+            self._evict()
+
+    def resize(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """Remove all cached months and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions, len(self._entries), self._nbytes, self.max_bytes)
+
+    def _evict(self):
+        while self._nbytes > self.max_bytes:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self._nbytes -= nbytes
+            self.evictions += 1
+
+
+# Shared by all LoadOMNI objects in the process
+OMNI_cache = OMNICache()
+
+
+def clear_OMNI_cache():
+    """Remove all decoded OMNI months from the process-wide cache."""
+    OMNI_cache.clear()
+
+
+def OMNI_cache_info() -> CacheInfo:
+    """Hits, misses, evictions and size of the process-wide cache of decoded OMNI months."""
+    return OMNI_cache.info()
@@ -0,0 +1,410 @@
+# Standard library
+import argparse
+import calendar
+import datetime as dt
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+from typing import Callable, Dict, List, Optional
+# Packages
+import numpy as np
+import scipy.io
+# Self-written modules
+from ..statistics.streaming import RunningStats, StreamingHistogram
+from .omni_cache import OMNI_cache, clear_OMNI_cache
+from .test_OMNI import LoadOMNI, assemble_chunks
+from .time_index import TimeIndex
+
+
+STORE_VERSION = 1
+MANIFEST_NAME = 'omni_store.json'
+TIME_NAME = 'time.npy'
+SUMMARY_NAME = 'summary.json'
+MONTH_PATTERN = re.compile(r'OMNI_1min_(\d{4})(\d{2})_Lv1$')
+
+
+def column_filename(paraname: str) -> str:
+    """Convert an OMNI parameter name (e.g. 'SYM/H' or 'n  MF') into a file name that is safe on all platforms."""
+    return re.sub(r'[^0-9A-Za-z]+', '_', paraname).strip('_') + '.npy'
+
+
+def month_name(filename: str) -> str:
+    """Name of the store directory of a monthly OMNI file, e.g. 'OMNI_1min_201509_Lv1'."""
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def validate_OMNI_file(matfile: dict, mat_path: str):
+    """Checks that a loaded monthly OMNI file has the format that LoadOMNI reads, and raises a ValueError otherwise:
+    'edesh' with increasing seconds within the month, 'comp' with one column for every parameter in
+    LoadOMNI.full_para_list and one row for every time in 'edesh', and 'sdate' with the first day of the month in the
+    file name.
+    """
+    name = month_name(mat_path)
+    match = MONTH_PATTERN.match(name)
+    if match is None:
+        raise ValueError(f'{mat_path} is not named like OMNI_1min_YYYYMM_Lv1.mat.')
+    missing = [key for key in ['edesh', 'comp', 'sdate'] if key not in matfile]
+    if missing:
+        raise ValueError(f'{name} does not contain {", ".join(missing)}.')
+
+    year, month = int(match.group(1)), int(match.group(2))
+    try:
+        sdate = dt.datetime.strptime(str(matfile['sdate'][0]), '%Y-%m-%d')
+    except (ValueError, IndexError):
+        raise ValueError(f'sdate of {name} is not a date (YYYY-MM-DD): {matfile["sdate"]!r}.') from None
+    if sdate != dt.datetime(year, month, 1):
+        raise ValueError(f'sdate of {name} is {sdate:%Y-%m-%d}, not the first day of the month of the file.')
+
+    edesh = np.asarray(matfile['edesh'], dtype=float).ravel()
+    month_seconds = calendar.monthrange(year, month)[1] * 86400
+    if edesh.size == 0 or not np.isfinite(edesh).all():
+        raise ValueError(f'edesh of {name} is empty or not finite.')
+    if (np.diff(edesh) <= 0).any():
+        raise ValueError(f'edesh of {name} is not increasing.')
+    if edesh[0] < 0 or edesh[-1] >= month_seconds:
+        raise ValueError(f'edesh of {name} is not within the month ({edesh[0]} to {edesh[-1]} seconds).')
+
+    comp = matfile['comp']
+    expected_shape = (edesh.size, len(LoadOMNI.full_para_list))
+    if comp.shape != expected_shape:
+        raise ValueError(f'comp of {name} has shape {comp.shape} but {expected_shape} is expected (one row for every '
+                         f'time in edesh and one column for every parameter).')
+    if not np.issubdtype(comp.dtype, np.floating):
+        raise ValueError(f'comp of {name} has dtype {comp.dtype} instead of floats.')
+
+
+def convert_OMNI_file(mat_path: str, store_dir: str, dtype=None, validate: bool = False) -> str:
+    """Convert a single monthly OMNI .mat file into the columnar store in `store_dir`.
+    Every parameter in `comp` is written as one contiguous .npy file and `edesh` is converted into a shared time axis of
+    seconds since 1970-01-01.
+    Inputs:
+    mat_path (str): path to the OMNI_1min_YYYYMM_Lv1.mat file.
+    store_dir (str): directory of the columnar store. Will be created if it does not exist.
+    dtype (numpy.dtype, optional): dtype of the stored parameters. By default the dtype of `comp` is kept.
+    validate (bool): check the file with validate_OMNI_file before anything is written to the store.
+    Returns: the name of the month that was converted.
+    """
+    matfile = scipy.io.loadmat(mat_path)
+    if validate:
+        validate_OMNI_file(matfile, mat_path)
+    sdate = matfile['sdate'][0]
+    month_start = dt.datetime.strptime(sdate, '%Y-%m-%d')
+    # Same truncation as edesh.astype('timedelta64[s]') in LoadOMNI
+    time = int((month_start - dt.datetime(1970, 1, 1)).total_seconds()) + matfile['edesh'].ravel().astype(np.int64)
+    comp = matfile['comp']
+
+    name = month_name(mat_path)
+    month_dir = os.path.join(store_dir, name)
+    os.makedirs(month_dir, exist_ok=True)
+    # The summary of earlier data of the month is outdated
+    if os.path.exists(os.path.join(month_dir, SUMMARY_NAME)):
+        os.remove(os.path.join(month_dir, SUMMARY_NAME))
+    save_column(os.path.join(month_dir, TIME_NAME), time)
+    for ind, paraname in enumerate(LoadOMNI.full_para_list):
+        column = comp[:, ind] if dtype is None else comp[:, ind].astype(dtype)
+        save_column(os.path.join(month_dir, column_filename(paraname)), np.ascontiguousarray(column))
+
+    manifest = read_manifest(store_dir)
+    if name in manifest['months']:
+        # The time indices of the overwritten month are outdated
+        clear_OMNI_cache()
+    manifest['months'][name] = {'sdate': sdate, 'size': int(time.size), 'dtype': str(comp.dtype if dtype is None
+                                                                                      else np.dtype(dtype))}
+    write_manifest(store_dir, manifest)
+    return name
+
+
+def save_column(path: str, column: np.ndarray):
+    """Save one column as a .npy file. It is written to a temporary file first, so that a month that is overwritten
+    never has a half-written column and arrays that are memory-mapped from the old file keep the old data."""
+    with open(path + '.tmp', 'wb') as column_file:
+        np.save(column_file, column)
+    os.replace(path + '.tmp', path)
+
+
+def convert_OMNI_archive(data_dir: str, store_dir: str, dtype=None, overwrite: bool = False) -> List[str]:
+    """One-time conversion of a directory of monthly OMNI .mat files into a columnar store.
+    Months that already exist in the store are skipped unless `overwrite` is True.
+    Returns: names of the months that were converted.
+    """
+    converted_months = read_manifest(store_dir)['months']
+    converted = []
+    for mat_path in sorted(glob.glob(os.path.join(data_dir, 'OMNI_1min_*_Lv1.mat'))):
+        if overwrite or month_name(mat_path) not in converted_months:
+            converted.append(convert_OMNI_file(mat_path, store_dir, dtype=dtype))
+    return converted
+
+
+def ingest_OMNI_files(mat_paths: List[str], store_dir: str, bins: Dict[str, np.ndarray] = None, dtype=None,
+                      overwrite: bool = False, on_error: Callable[[str, Exception], None] = None) -> List[str]:
+    """Adds new monthly OMNI files to the store and updates the summaries of the store (see update_summaries), without
+    converting or summarizing the months that are already in the store again.
+    Every file is checked with validate_OMNI_file before it is written to the store.
+    Inputs:
+    mat_paths (List[str]): paths to OMNI_1min_YYYYMM_Lv1.mat files.
+    store_dir (str): directory of the columnar store. Will be created if it does not exist.
+    bins (dict): bin edges of the histogram of each parameter, see update_summaries. Default: the bins of the store.
+    dtype (numpy.dtype, optional): dtype of the stored parameters, see convert_OMNI_file.
+    overwrite (bool): also convert months that are already in the store, e.g. when a corrected file has been released.
+    on_error (Callable): called with the path and the error of a file that cannot be read or is invalid, after which
+                         the other files are still added. Default: the error is raised (the files before it have been
+                         added, but not summarized).
+    Returns: names of the months that were added.
+    """
+    converted_months = read_manifest(store_dir)['months']
+    ingested = []
+    for mat_path in mat_paths:
+        if not overwrite and month_name(mat_path) in converted_months:
+            continue
+        try:
+            ingested.append(convert_OMNI_file(mat_path, store_dir, dtype=dtype, validate=True))
+        except (OSError, ValueError, scipy.io.matlab.MatReadError) as error:
+            if on_error is None:
+                raise
+            on_error(mat_path, error)
+    update_summaries(store_dir, bins)
+    return ingested
+
+
+def summary_key(bins: Dict[str, list]) -> str:
+    """Identifies the bins of the summaries, so that months with summaries of other bins are summarized again."""
+    return hashlib.sha1(json.dumps(bins, sort_keys=True).encode()).hexdigest()
+
+
+def summarize_month(store_dir: str, name: str, bins: Dict[str, list]) -> dict:
+    """Summary statistics of every parameter of one month of the store and histograms of the parameters in bins, as
+    saved in the summary file of the month (see update_summaries)."""
+    store = OMNIStore(store_dir)
+    parameters = {}
+    for paraname in LoadOMNI.full_para_list:
+        values = store.column(name, paraname)
+        parameters[paraname] = {'stats': RunningStats().update(values).to_dict()}
+        if paraname in bins:
+            parameters[paraname]['hist'] = StreamingHistogram(bins[paraname]).update(values).to_dict()
+    return {'bins': bins, 'parameters': parameters}
+
+
+def update_summaries(store_dir: str, bins: Dict[str, np.ndarray] = None) -> List[str]:
+    """Saves summary statistics (statistics.RunningStats) of every parameter, and histograms
+    (statistics.StreamingHistogram) of the parameters in bins, for every month of the store that has no summary yet or
+    one with other bins. The summaries of the whole store are then combined from the months without reading the data
+    again, see read_summary.
+    Inputs:
+    store_dir (str): directory of the columnar store.
+    bins (dict): bin edges of the histogram of each parameter, e.g. {'BzGSM': np.linspace(-20, 20, 81)}. They are
+                 saved in the store and used by later updates. Default: the bins of the store (no histograms if none
+                 have been given before).
+    Returns: names of the months that were summarized.
+    """
+    manifest = read_manifest(store_dir)
+    if bins is None:
+        bins = manifest.get('summary_bins', {})
+    bins = dict((paraname, np.asarray(edges, dtype=float).tolist()) for paraname, edges in bins.items())
+    key = summary_key(bins)
+
+    summarized = []
+    for name, month in sorted(manifest['months'].items()):
+        if month.get('summary') == key and os.path.exists(os.path.join(store_dir, name, SUMMARY_NAME)):
+            continue
+        summary_path = os.path.join(store_dir, name, SUMMARY_NAME)
+        with open(summary_path + '.tmp', 'w') as summary_file:
+            json.dump(summarize_month(store_dir, name, bins), summary_file)
+        os.replace(summary_path + '.tmp', summary_path)
+        month['summary'] = key
+        summarized.append(name)
+    manifest['summary_bins'] = bins
+    write_manifest(store_dir, manifest)
+    return summarized
+
+
+def read_summary(store_dir: str, parameters: List[str] = None, months: List[str] = None) -> dict:
+    """Combines the saved summaries of the months of the store (see update_summaries).
+    Inputs:
+    store_dir (str): directory of the columnar store.
+    parameters (List[str]): parameters to summarize. Default: all parameters.
+    months (List[str]): names of the months to summarize (e.g. 'OMNI_1min_201509_Lv1'). Default: all months.
+    Returns: dict with for each parameter a dict with 'stats' (statistics.RunningStats) and, if the store has bins for
+             the parameter, 'hist' (statistics.StreamingHistogram), like TPADataset.get_dataset_summary.
+    """
+    manifest = read_manifest(store_dir)
+    parameters = LoadOMNI.full_para_list if parameters is None else parameters
+    months = sorted(manifest['months']) if months is None else [month_name(month) for month in months]
+    key = summary_key(manifest.get('summary_bins', {}))
+
+    summary = {}
+    for name in months:
+        if manifest['months'].get(name, {}).get('summary') != key:
+            raise ValueError(f'{name} has no up-to-date summary in the OMNI store in {store_dir}. '
+                             f'Run update_summaries first.')
+        with open(os.path.join(store_dir, name, SUMMARY_NAME)) as summary_file:
+            month = json.load(summary_file)['parameters']
+        for paraname in parameters:
+            stats = RunningStats.from_dict(month[paraname]['stats'])
+            if paraname not in summary:
+                summary[paraname] = {'stats': stats}
+                if 'hist' in month[paraname]:
+                    summary[paraname]['hist'] = StreamingHistogram.from_dict(month[paraname]['hist'])
+                continue
+            summary[paraname]['stats'].merge(stats)
+            if 'hist' in month[paraname]:
+                summary[paraname]['hist'].merge(StreamingHistogram.from_dict(month[paraname]['hist']))
+    return summary
+
+
+def read_manifest(store_dir: str) -> dict:
+    """Read the manifest of the store. Returns an empty manifest if no store exists in `store_dir`."""
+    manifest_path = os.path.join(store_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {'version': STORE_VERSION,
+                'columns': dict((paraname, column_filename(paraname)) for paraname in LoadOMNI.full_para_list),
+                'months': {}}
+    with open(manifest_path) as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest['version'] != STORE_VERSION:
+        raise ValueError(f'OMNI store in {store_dir} has version {manifest["version"]} but version {STORE_VERSION} '
+                         f'is required. Convert the archive again with convert_OMNI_archive.')
+    return manifest
+
+
+def write_manifest(store_dir: str, manifest: dict):
+    os.makedirs(store_dir, exist_ok=True)
+    # Write to a temporary file first so that readers never see a half-written manifest
+    tmp_path = os.path.join(store_dir, MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.replace(tmp_path, os.path.join(store_dir, MANIFEST_NAME))
+
+
+class OMNIStore:
+    """Memory-mapped access to OMNI data converted with convert_OMNI_archive.
+    Only the requested parameters are mapped and only the pages within the requested time window are read from disk.
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.manifest = read_manifest(store_dir)
+
+    @staticmethod
+    def is_store(path: Optional[str]) -> bool:
+        """Checks if `path` is a directory containing a columnar OMNI store."""
+        return path is not None and os.path.exists(os.path.join(path, MANIFEST_NAME))
+
+    def column(self, filename: str, paraname: str) -> np.memmap:
+        """Memory-map one parameter (or 'time') of one month. `filename` is the name of the monthly .mat file."""
+        if paraname == 'BxGSM':
+            paraname = 'BxGSE'
+        name = month_name(filename)
+        if name not in self.manifest['months']:
+            raise FileNotFoundError(f'{name} has not been converted into the OMNI store in {self.store_dir}')
+        column_file = TIME_NAME if paraname == 'time' else self.manifest['columns'][paraname]
+        return np.load(os.path.join(self.store_dir, name, column_file), mmap_mode='r')
+
+    def load(self, dt_start: dt.datetime, dt_stop: dt.datetime, paras_in=None) -> dict:
+        """Load parameters between dt_start and dt_stop. Returns the same dict as LoadOMNI.paras."""
+        loader = LoadOMNI(dt_start, dt_stop)
+        return self.load_files(loader.data_files, loader.dt_ranges, paras_in)
+
+    def load_files(self, data_files: List[str], dt_ranges: List[list], paras_in=None) -> dict:
+        """Load parameters from the months in `data_files`, using the same time ranges as LoadOMNI.load_OMNI_data.
+        `dt_ranges` contains the start and stop of each month in seconds since the start of the month,
+        where a stop of -1 means the end of the month.
+        """
+        if paras_in is None:
+            paras_in = LoadOMNI.full_para_list
+
+        # The chunks are memory-mapped, so only the output is allocated
+        return assemble_chunks(self.iter_files(data_files, dt_ranges, paras_in), paras_in)
+
+    def iter_files(self, data_files: List[str], dt_ranges: List[list], paras_in=None):
+        """Generator version of load_files that yields the data of one month at a time.
+        The parameters are read-only memory-mapped arrays, which are only read from disk when they are used.
+        """
+        if paras_in is None:
+            paras_in = LoadOMNI.full_para_list
+
+        for filename, (dtdelta_start, dtdelta_stop) in zip(data_files, dt_ranges):
+            time_index = self.time_index(filename)
+            sdate = dt.datetime.strptime(self.manifest['months'][month_name(filename)]['sdate'], '%Y-%m-%d')
+            origin = (sdate - dt.datetime(1970, 1, 1)).total_seconds()
+            window = time_index.window(None if dtdelta_start == 0 else origin + dtdelta_start,
+                                       None if dtdelta_stop == -1 else origin + dtdelta_stop)
+
+            chunk = dict((paraname, self.column(filename, paraname)[window]) for paraname in paras_in)
+            chunk['datetime'] = time_index.times[window].astype('datetime64[s]').astype('datetime64[us]')
+            yield chunk
+
+    def time_index(self, filename: str) -> TimeIndex:
+        """TimeIndex of the (memory-mapped) time axis of one month. Kept in omni_cache.OMNI_cache so that the time
+        axis is only checked once. The size and modification time of the time axis are part of the key, so that a month
+        that has been overwritten in the store is indexed again."""
+        time_path = os.path.abspath(os.path.join(self.store_dir, month_name(filename), TIME_NAME))
+        stat = os.stat(time_path)
+        key = (time_path, stat.st_size, stat.st_mtime_ns)
+        time_index = OMNI_cache.get(key)
+        if time_index is None:
+            time = self.column(filename, 'time')
+            time_index = TimeIndex(time)
+            OMNI_cache.put(key, time_index, time.nbytes)
+        return time_index
+
+
+def parse_bins(text: str):
+    """Parses 'BzGSM=-20:20:81' (bin edges like np.linspace) for the command line."""
+    paraname, _, edges = text.rpartition('=')
+    try:
+        start, stop, num = edges.split(':')
+        return paraname, np.linspace(float(start), float(stop), int(num))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{text!r} is not of the form PARAMETER=START:STOP:NUM') from None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m tpa_analysis.data_extraction.omni_store',
+                                     description='Columnar store of the monthly 1-minute OMNI files.')
+    parser.add_argument('store_dir', help='directory of the store')
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest = commands.add_parser('ingest', help='add new monthly OMNI files (or all new files in directories) to the '
+                                                'store and update the summaries')
+    ingest.add_argument('paths', nargs='+', help='OMNI_1min_YYYYMM_Lv1.mat files or directories with them')
+    ingest.add_argument('--bins', type=parse_bins, action='append', default=None, metavar='PARAMETER=START:STOP:NUM',
+                        help='bins of the histogram of a parameter (can be repeated). Default: the bins of the store')
+    ingest.add_argument('--dtype', default=None, help='dtype of the stored parameters, e.g. float32')
+    ingest.add_argument('--overwrite', action='store_true', help='also convert months that are already in the store')
+    summary = commands.add_parser('summary', help='print the summary statistics of the whole store')
+    summary.add_argument('parameters', nargs='*', help='parameters to summarize. Default: all')
+    args = parser.parse_args(argv)
+
+    if args.command == 'summary':
+        lines = [f'{"parameter":<10} {"count":>10} {"NaN":>10} {"mean":>12} {"std":>12} {"min":>12} {"max":>12}']
+        for paraname, reducers in read_summary(args.store_dir, args.parameters or None).items():
+            stats = reducers['stats']
+            lines.append(f'{paraname:<10} {stats.count:>10} {stats.nan_count:>10} {stats.mean:>12.4g} '
+                         f'{stats.std:>12.4g} {stats.min:>12.4g} {stats.max:>12.4g}')
+        print('\n'.join(lines))
+        return 0
+
+    mat_paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            mat_paths.extend(sorted(glob.glob(os.path.join(path, 'OMNI_1min_*_Lv1.mat'))))
+        else:
+            mat_paths.append(path)
+    failed = []
+
+    def report_error(mat_path, error):
+        print(f'skipped {mat_path}: {error}', file=sys.stderr)
+        failed.append(mat_path)
+
+    ingested = ingest_OMNI_files(mat_paths, args.store_dir, None if args.bins is None else dict(args.bins), args.dtype,
+                                 args.overwrite, on_error=report_error)
+    for name in ingested:
+        print(f'added {name}')
+    print(f'{len(ingested)} months added, {len(failed)} files skipped')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
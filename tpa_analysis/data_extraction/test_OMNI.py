@@ -1,7 +1,13 @@
 import datetime
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 import scipy.io
 import numpy
 
+from .omni_cache import OMNI_cache
+from .time_index import TimeIndex
+
 
 class LoadOMNI:
     full_para_list = ['ID MF', 'ID PL', 'n  MF', 'n  PL', 'Inter',
@@ -45,39 +51,137 @@ class LoadOMNI:
         self.dt_ranges = dt_range_list
         self.data_dir = data_dir
 
-    def load_OMNI_data(self, paras_in=None):
-        para_dict = dict((paraname, ind) for ind, paraname in enumerate(LoadOMNI.full_para_list))
+    def load_OMNI_data(self, paras_in=None, n_workers=None, executor='thread'):
+        """Loads the parameters in paras_in into self.paras.
+        The months can be decoded in parallel by setting n_workers. executor is either 'thread' or 'process'. Threads
+        share the decoded months with the OMNI cache directly, while processes avoid the global interpreter lock.
+        """
         if paras_in is None:
             paras_in = LoadOMNI.full_para_list
-        paras = dict((paraname, numpy.empty(0)) for paraname in paras_in)
-        paras['datetime'] = numpy.empty(0, dtype=numpy.datetime64)
-        for ind_f, filename in enumerate(self.data_files):
-            matfile = scipy.io.loadmat(self.data_dir + filename)
-            edesh = matfile['edesh']
-            dtdelta_start = self.dt_ranges[ind_f][0]
-            dtdelta_stop = self.dt_ranges[ind_f][1]
-            dt0 = datetime.datetime.strptime(matfile['sdate'][0], '%Y-%m-%d')
-            if dtdelta_start == 0:
-                ind_t1 = 0
-            else:
-                ind_t1 = numpy.where(edesh >= dtdelta_start)[0][0]
-            if dtdelta_stop == -1:
-                ind_t2 = edesh.shape[0]
-            else:
-                ind_t2 = numpy.where(edesh <= dtdelta_stop)[0][-1]
+        from .omni_store import OMNIStore
+        if OMNIStore.is_store(self.data_dir):
+            # data_dir contains an archive converted with omni_store.convert_OMNI_archive
+            self.paras = OMNIStore(self.data_dir).load_files(self.data_files, self.dt_ranges, paras_in)
+            return
+        # The chunks are views of the decoded months, so the output is only allocated once
+        self.paras = assemble_chunks(self.iter_OMNI_data(paras_in, n_workers=n_workers, executor=executor), paras_in)
+
+    def iter_OMNI_data(self, paras_in=None, cache=True, n_workers=None, executor='thread'):
+        """Generator that yields the data one month at a time, as dicts in the same format as self.paras.
+        Only one month is held in memory at a time if cache is False, which makes it possible to reduce (e.g. histogram)
+        many years of data without loading all of it. See load_OMNI_data for n_workers and executor.
+        """
+        if paras_in is None:
+            paras_in = LoadOMNI.full_para_list
+        from .omni_store import OMNIStore
+        if OMNIStore.is_store(self.data_dir):
+            yield from OMNIStore(self.data_dir).iter_files(self.data_files, self.dt_ranges, paras_in)
+            return
+        months = self.read_months(paras_in, cache=cache, n_workers=n_workers, executor=executor)
+        for (time_index, dt0, data), (dtdelta_start, dtdelta_stop) in zip(months, self.dt_ranges):
+            window = time_index.window(None if dtdelta_start == 0 else dtdelta_start,
+                                       None if dtdelta_stop == -1 else dtdelta_stop)
+
+            chunk = dict((paraname, data[paraname][window]) for paraname in paras_in)
+            chunk['datetime'] = numpy.datetime64(dt0) + time_index.times[window].astype('timedelta64[s]')
+            yield chunk
+
+    def read_months(self, paras_in, cache=True, n_workers=None, executor='thread'):
+        """Generator that decodes all months in self.data_files and yields them in order, see read_month.
+        With n_workers, up to n_workers months are decoded at the same time in a thread or process pool."""
+        if n_workers is None:
+            for filename in self.data_files:
+                yield self.read_month(filename, paras_in, cache=cache)
+        elif executor in ('thread', 'process'):
+            # Threads share the decoded months with the OMNI cache directly (see read_month). Only the months that are
+            # not cached are sent to the processes, and the months that were decoded in processes are cached here.
+            # At most 2 * n_workers months are decoded ahead of the month that is yielded, so that a long window is
+            # never held in memory at once
+            pool_class = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+            with pool_class(max_workers=n_workers) as pool:
+                pending = deque()
+                for filename in self.data_files:
+                    if executor == 'thread':
+                        pending.append((None, pool.submit(self.read_month, filename, paras_in, cache)))
+                    else:
+                        key = self.month_key(filename, paras_in)
+                        month = OMNI_cache.get(key) if cache else None
+                        if month is None:
+                            month = pool.submit(decode_OMNI_month, self.data_dir + filename, paras_in)
+                        pending.append((key, month))
+                    if len(pending) > 2 * n_workers:
+                        yield self.finish_month(*pending.popleft(), cache=cache)
+                while pending:
+                    yield self.finish_month(*pending.popleft(), cache=cache)
+        else:
+            raise ValueError(f"executor has to be 'thread' or 'process', not {executor!r}")
+
+    def read_month(self, filename, paras_in, cache=True):
+        """Decode one monthly .mat file. Decoded months are kept in the process-wide omni_cache.OMNI_cache.
+        Returns a TimeIndex of edesh (seconds since dt0), dt0 and a dict with the data of each parameter in paras_in.
+        """
+        key = self.month_key(filename, paras_in)
+        month = OMNI_cache.get(key) if cache else None
+        if month is not None:
+            return month
+        return self.cache_month(key, *decode_OMNI_month(self.data_dir + filename, paras_in), cache=cache)
+
+    def month_key(self, filename, paras_in):
+        """Key of a decoded month in the OMNI cache. It contains the size and modification time of the file, so a
+        month is decoded again when its file is replaced (e.g. by a corrected release)."""
+        path = os.path.abspath(self.data_dir + filename)
+        stat = os.stat(path)
+        return path, stat.st_size, stat.st_mtime_ns, frozenset(paras_in)
+
+    @classmethod
+    def finish_month(cls, key, month, cache=True):
+        """Returns a month from read_months: a cached month as it is, the month of a future of read_month (key is None)
+        or the decoded month of a future of decode_OMNI_month, which is cached."""
+        if not isinstance(month, Future):
+            return month
+        if key is None:
+            return month.result()
+        return cls.cache_month(key, *month.result(), cache=cache)
+
+    @staticmethod
+    def cache_month(key, edesh, dt0, data, cache=True):
+        for array in [edesh, *data.values()]:
+            # Cached arrays are shared between all loaders
+            array.setflags(write=False)
+        month = (TimeIndex(edesh), dt0, data)
+        if cache:
+            OMNI_cache.put(key, month, edesh.nbytes + sum(array.nbytes for array in data.values()))
+        return month
+
 
-            dts = numpy.datetime64(dt0) + edesh[ind_t1:ind_t2].astype('timedelta64[s]')
+def decode_OMNI_month(path, paras_in):
+    """Decode one monthly .mat file.
+    Returns edesh (seconds since dt0), dt0 and a dict with the data of each parameter in paras_in."""
+    para_dict = dict((paraname, ind) for ind, paraname in enumerate(LoadOMNI.full_para_list))
+    para_dict['BxGSM'] = para_dict['BxGSE']
+    matfile = scipy.io.loadmat(path)
+    edesh = matfile['edesh'].ravel()
+    dt0 = datetime.datetime.strptime(matfile['sdate'][0], '%Y-%m-%d')
+    data = dict((paraname, numpy.ascontiguousarray(matfile['comp'][:, para_dict[paraname]]))
+                for paraname in paras_in)
+    return edesh, dt0, data
 
-            paras['datetime'] = numpy.append(paras['datetime'], dts)
-            data = matfile['comp']
-            for paraname in paras_in:
-                if paraname == 'BxGSM':
-                    newdata = data[ind_t1:ind_t2, para_dict['BxGSE']]
-                else:
-                    newdata = data[ind_t1:ind_t2, para_dict[paraname]]
 
-                paras[paraname] = numpy.append(paras[paraname], newdata)
-        self.paras = paras
+def assemble_chunks(chunks, paras_in):
+    """Copies the chunks from LoadOMNI.iter_OMNI_data (in order) into one preallocated array for each parameter.
+    Returns: dict in the same format as LoadOMNI.paras.
+    """
+    chunks = list(chunks)
+    size = sum(chunk['datetime'].size for chunk in chunks)
+    paras = dict((paraname, numpy.empty(size)) for paraname in paras_in)
+    paras['datetime'] = numpy.empty(size, dtype='datetime64[us]')
+    offset = 0
+    for chunk in chunks:
+        window = slice(offset, offset + chunk['datetime'].size)
+        for key, values in chunk.items():
+            paras[key][window] = values
+        offset = window.stop
+    return paras
 
 
 if __name__ == "__main__":
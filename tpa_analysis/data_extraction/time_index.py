@@ -0,0 +1,61 @@
+# Standard library
+from typing import Optional, Tuple
+# Packages
+import numpy as np
+
+
+class TimeIndex:
+    """Index of a sorted time axis (e.g. edesh of one OMNI month) for finding time windows with binary search.
+    Also keeps an index of the gaps in the data, i.e. where consecutive times are more than `step` apart.
+    Inputs:
+    times (numpy.ndarray): sorted (non-decreasing) times, e.g. seconds since the start of the month.
+    step (float): expected time between samples, in the same unit as `times`. 60 seconds for 1-minute OMNI data.
+    """
+
+    def __init__(self, times: np.ndarray, step: float = 60):
+        times = np.asarray(times).ravel()
+        if times.size > 1 and (times[1:] < times[:-1]).any():
+            raise ValueError('The times of a TimeIndex have to be sorted.')
+        self.times = times
+        self.step = step
+        # Index of the last time before each gap, see gap_index
+        self._gap_index = None
+
+    def __len__(self):
+        return self.times.size
+
+    def window(self, start: Optional[float] = None, stop: Optional[float] = None) -> slice:
+        """Slice of the times in a window, using the same window as LoadOMNI.load_OMNI_data: from the first time >=
+        start up to (but excluding) the last time <= stop. A start or stop of None means the start or end of the axis.
+        """
+        first = 0 if start is None else int(np.searchsorted(self.times, start, side='left'))
+        if stop is None:
+            last = self.times.size
+        else:
+            last = max(int(np.searchsorted(self.times, stop, side='right')) - 1, first)
+        return slice(first, last)
+
+    @property
+    def gap_index(self) -> np.ndarray:
+        """Index of the last time before each gap. Calculated the first time it is used."""
+        if self._gap_index is None:
+            self._gap_index = np.flatnonzero(np.diff(self.times) > self.step)
+        return self._gap_index
+
+    def gaps(self, start: Optional[float] = None, stop: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Gaps that overlap the window between start and stop.
+        Returns: the last time before and the first time after each gap.
+        """
+        gap_starts = self.times[self.gap_index]
+        gap_stops = self.times[self.gap_index + 1]
+        first = 0 if start is None else np.searchsorted(gap_stops, start, side='right')
+        last = gap_starts.size if stop is None else np.searchsorted(gap_starts, stop, side='left')
+        return gap_starts[first:last], gap_stops[first:last]
+
+    def coverage(self, start: float, stop: float) -> float:
+        """Fraction of the expected samples (one every `step`) in [start, stop) that exist in the data."""
+        expected = (stop - start) / self.step
+        if expected <= 0:
+            return np.nan
+        first, last = np.searchsorted(self.times, [start, stop], side='left')
+        return min((last - first) / expected, 1.)
@@ -1,21 +1,32 @@
 # Standard library
+import inspect
 import warnings
 import datetime as dt
 import re
-from typing import Iterable
+from typing import Iterable, List
 # Packages
 import pandas as pd
 import numpy as np
 # Self-written modules
+from .dataset_cache import DatasetCache, dataset_key
+from .excel_cache import read_excel_cached
 from ..data_structures.tpa import TPA
+from ..data_structures.tpa_batch import TPABatch
+
+
+# English month abbreviations as in the catalogs (same as '%b' in datetime.strptime)
+MONTH_ABBREVIATIONS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
 
 
 # TODO: create factory class?
 class DataExtract:
-    """Extracts transpolar arc (TPA) data from different datasets."""
+    """Extracts transpolar arc (TPA) data from different datasets.
+    With cache_excel, the spreadsheets of the datasets are only parsed once and then read from cache/excel/ in tpa_dir
+    until they are modified, see excel_cache.read_excel_cached."""
 
-    def __init__(self, tpa_dir):
+    def __init__(self, tpa_dir, cache_excel: bool = True):
         self.data_dir = tpa_dir
+        self.excel_cache_dir = tpa_dir + 'cache/excel/' if cache_excel else None
         self.name_to_function = {'Fear & Milan (2012)': self.fear_dataclean,
                                  'Kullen et al. (2002)': self.kullen_dataclean,
                                  'Cumnock et al. (2009)': self.cumnock2009_dataclean,
@@ -35,35 +46,58 @@ class DataExtract:
             raise KeyError(f'No TPA data extracting function for dataset with name {dataset_name}')
         return retriever_function(*args, **kwargs)
 
+    def get_tpa_batch(self, dataset_name: str, *args, **kwargs) -> TPABatch:
+        """Same as get_tpas, but returns the TPAs as a TPABatch. The text catalogs (Kullen, Fear and Reidy) and the new
+        dataset are converted directly from columns without creating TPA objects."""
+        batch_functions = {self.kullen_dataclean: self.kullen_batch,
+                           self.fear_dataclean: self.fear_batch,
+                           self.reidy_dataclean: self.reidy_batch,
+                           self.new_thor_dataclean: self.new_thor_batch}
+        retriever_function = self.name_to_function.get(dataset_name)
+        if retriever_function in batch_functions:
+            return batch_functions[retriever_function](*args, **kwargs)
+        return TPABatch.from_tpas(self.get_tpas(dataset_name, *args, **kwargs))
+
+    def read_excel(self, filename: str, *args, **kwargs):
+        """pd.read_excel with the parsed spreadsheet cached in self.excel_cache_dir."""
+        return read_excel_cached(filename, *args, cache_dir=self.excel_cache_dir, **kwargs)
+
     def kullen_dataclean(self, filename="datafile_tpa_location.dat"):
         """Extracting Kullen's data.
          """
+        yield from DataExtract.tpas_from_columns(self.kullen_columns(filename))
+
+    def kullen_columns(self, filename="datafile_tpa_location.dat") -> dict:
+        """Parses Kullen's data into columns (see DataExtract.tpas_from_columns).
+        The date and time are at fixed positions of each line and are converted for all TPAs at once."""
         filename = self.data_dir + filename
         with open(filename) as dat:
             kullen = dat.readlines()
 
-        for line in kullen:
-            tpa_parameters = line.split()
-            if line[0] not in "\n;" and tpa_parameters[1][2] == "1":
-                motion = DataExtract.calc_motion(float(tpa_parameters[3]), float(tpa_parameters[6]))
-                # elif cl[1][2] == "2":
-                #    motion = "unknown"
-                # else:
-                #    continue
-                dadu = DataExtract.calc_dadu(float(tpa_parameters[3]))
-                if tpa_parameters[1][:2] != "bd":
-                    yield TPA(dt.datetime.strptime(tpa_parameters[0] + line[11:15], "%y%m%d%H%M"), hemisphere="n",
-                              moving=motion, dadu=dadu)
-                elif tpa_parameters[1][:4] == "bd1h":
-                    yield TPA(dt.datetime.strptime(tpa_parameters[0] + line[11:15], "%y%m%d%H%M"), hemisphere="n",
-                              moving=motion, dadu=dadu)
+        rows = [(line, line.split()) for line in kullen if line[0] not in "\n;"]
+        # elif cl[1][2] == "2": motion = "unknown"
+        rows = [(line, tpa_parameters) for line, tpa_parameters in rows if tpa_parameters[1][2] == "1"
+                and (tpa_parameters[1][:2] != "bd" or tpa_parameters[1][:4] == "bd1h")]
+        # yymmddHHMM
+        digits = fixed_width_digits([tpa_parameters[0] + line[11:15] for line, tpa_parameters in rows], 10)
+        mlt_start = np.array([tpa_parameters[3] for _, tpa_parameters in rows], dtype=float)
+        mlt_end = np.array([tpa_parameters[6] for _, tpa_parameters in rows], dtype=float)
+
+        year, month, day, hour, minute = (digits[:, ::2] * 10 + digits[:, 1::2]).T
+        dates = compose_datetimes(two_digit_year(year), month, day, hour, minute)
+        return {'date': dates, 'hemisphere': np.full(len(rows), 'n'),
+                'moving': DataExtract.calc_motion(mlt_start, mlt_end), 'dadu': DataExtract.calc_dadu(mlt_start)}
+
+    def kullen_batch(self, filename="datafile_tpa_location.dat") -> TPABatch:
+        """Kullen's data as a TPABatch."""
+        return TPABatch.from_columns(self.kullen_columns(filename))
 
     def cumnock2009_dataclean(self, filename="Single_Multiple_Arcs_IMF_dipole_list_2015_AK_prel_dadu.xls",
                               usecols="A, C, D, N", sheet_name="Sheet1"):
         """Extracting Cumnock's first dataset."""
         filename = self.data_dir + filename
 
-        judy = pd.read_excel(filename, sheet_name=sheet_name, index_col=None, usecols=usecols)
+        judy = self.read_excel(filename, sheet_name=sheet_name, index_col=None, usecols=usecols)
         for index, row in judy.iterrows():
             try:
                 if int(row[0]) > 1:
@@ -90,7 +124,7 @@ class DataExtract:
         """Extracting Cumnock's second data."""
         filename = self.data_dir + filename
 
-        judy = pd.read_excel(filename, sheet_name=sheet_name, index_col=None, usecols=usecols, skiprows=[1, 2])
+        judy = self.read_excel(filename, sheet_name=sheet_name, index_col=None, usecols=usecols, skiprows=[1, 2])
 
         for index, row in judy.iterrows():
             if "Do not" in str(row[0]):
@@ -115,79 +149,85 @@ class DataExtract:
     @staticmethod
     def fear_fileclean(filename="Fear_TPA_data_frompaper.txt"):
         """Cleaning Fear's data to readable txt"""
-        clean = ""
         with open(filename, "r") as fear:
-            for line in fear:
-                if not line.split() == []:
-                    if line[0] == " ":
-                        space = 0
-                        for ch in line:
-                            if ch == " ":
-                                space += 1
-                            else:
-                                break
-                        clean += line[space:]
-                    else:
-                        clean += line
+            # Empty lines are removed and the other lines are left-aligned
+            clean = ''.join(line.lstrip(' ') for line in fear if line.split())
         with open('fear_TPA_data.txt', 'w') as fear:
             fear.write(clean)
 
     def fear_dataclean(self, filename='fear_TPA_data_frompaper.txt'):
         """Extracting Fear's data"""
-        filename = self.data_dir + filename
+        yield from DataExtract.tpas_from_columns(self.fear_columns(filename))
 
+    def fear_columns(self, filename='fear_TPA_data_frompaper.txt') -> dict:
+        """Parses Fear's data into columns (see DataExtract.tpas_from_columns)."""
+        filename = self.data_dir + filename
+        with open(filename) as fear:
+            # Only lines starting with the number of the TPA contain TPAs
+            rows = [tpa_parameters for tpa_parameters in map(str.split, fear)
+                    if tpa_parameters and is_int(tpa_parameters[0])]
+
+        day, month, year = zip(*(tpa_parameters[1].split('-') for tpa_parameters in rows)) if rows else ([], [], [])
+        day, year = np.array(day, dtype=int), np.array(year, dtype=int)
+        month = month_numbers(month)
         if 'frompaper' in filename:
-            with open(filename) as fear:
-                for line in fear:
-                    try:
-                        int(line.split()[0])
-                        tpa = True
-                    except ValueError:
-                        tpa = False
-                    if tpa:
-                        tpa_parameters = line.split()
-                        if tpa_parameters[10] == "N":
-                            motion = "no"
-                        elif tpa_parameters[10] == "Y":
-                            motion = "yes"
-                        else:
-                            motion = tpa_parameters[10]
-                            warnings.warn(f'WARNING: input for motion is neither Yes nor No but instead "{motion}"')
-                        dadu = DataExtract.calc_dadu(float(tpa_parameters[7]))
-
-                        yield TPA(dt.datetime.strptime(f'{tpa_parameters[1]}{tpa_parameters[2]}:00', '%d-%b-%Y%X'),
-                                  hemisphere=tpa_parameters[9].lower(), moving=motion, dadu=dadu)
+            hour, minute, second = clock_times([tpa_parameters[2] + ':00' for tpa_parameters in rows])
+            motion = np.array([tpa_parameters[10] for tpa_parameters in rows], dtype=str)
+            for unknown_motion in motion[(motion != 'N') & (motion != 'Y')]:
+                warnings.warn(f'WARNING: input for motion is neither Yes nor No but instead "{unknown_motion}"')
+            return {'date': compose_datetimes(year, month, day, hour, minute, second),
+                    'hemisphere': np.char.lower(np.array([tpa_parameters[9] for tpa_parameters in rows], dtype=str)),
+                    'moving': np.where(motion == 'N', 'no', np.where(motion == 'Y', 'yes', motion)),
+                    'dadu': DataExtract.calc_dadu(np.array([tpa_parameters[7] for tpa_parameters in rows],
+                                                           dtype=float))}
         else:
-            with open(filename) as fear:
-                for line in fear:
-                    try:
-                        int(line.split()[0])
-                        tpa = True
-                    except ValueError:
-                        tpa = False
-                    if tpa:
-                        tpa_parameters = line.split()
-                        yield TPA(dt.datetime.strptime(tpa_parameters[1] + tpa_parameters[2][:8], '%d-%b-%Y%X'),
-                                  tpa_parameters[3])
+            hour, minute, second = clock_times([tpa_parameters[2][:8] for tpa_parameters in rows])
+            return {'date': compose_datetimes(year, month, day, hour, minute, second),
+                    'hemisphere': np.array([tpa_parameters[3] for tpa_parameters in rows], dtype=str)}
+
+    def fear_batch(self, filename='fear_TPA_data_frompaper.txt') -> TPABatch:
+        """Fear's data as a TPABatch."""
+        return TPABatch.from_columns(self.fear_columns(filename))
 
     def reidy_dataclean(self, filename='reidy_TPA_data.txt'):
         """Extracts dataset by Reidy et al. (2018)."""
+        yield from DataExtract.tpas_from_columns(self.reidy_columns(filename))
+
+    def reidy_columns(self, filename='reidy_TPA_data.txt') -> dict:
+        """Parses the dataset by Reidy et al. (2018) into columns (see DataExtract.tpas_from_columns).
+        Conjugate TPAs ('NS') are split into one northern and one southern TPA. The conjugate property is 'conjugate'
+        or 'non-conjugate', like in the other catalogs."""
         filename = self.data_dir + filename
         with open(filename) as reidy:
-            for line in reidy:
-                if line[0] != '#':
-                    parameters = line.split()
-                    if parameters[9] == 'NS':
-                        yield TPA(dt.datetime.strptime(parameters[1] + parameters[2] + parameters[3] + parameters[4],
-                                                       '%d%b%Y%H:%M'), hemisphere='n',
-                                  conjugate=True)
-                        yield TPA(dt.datetime.strptime(parameters[1] + parameters[2] + parameters[3] + parameters[4],
-                                                       '%d%b%Y%H:%M'), hemisphere='s',
-                                  conjugate=True)
-                    else:
-                        yield TPA(dt.datetime.strptime(parameters[1] + parameters[2] + parameters[3] + parameters[4],
-                                                       '%d%b%Y%H:%M'),
-                                  hemisphere=parameters[9].lower(), conjugate=False)
+            rows = [line.split() for line in reidy if line[0] != '#' and line.strip()]
+
+        hour, minute, _ = clock_times([parameters[4] for parameters in rows])
+        dates = compose_datetimes(np.array([parameters[3] for parameters in rows], dtype=int),
+                                  month_numbers([parameters[2] for parameters in rows]),
+                                  np.array([parameters[1] for parameters in rows], dtype=int), hour, minute)
+        hemispheres = np.array([parameters[9] for parameters in rows], dtype=str)
+        conjugate = hemispheres == 'NS'
+        # Every conjugate TPA is repeated, first for the northern and then for the southern hemisphere
+        tpa_index = np.repeat(np.arange(len(rows)), np.where(conjugate, 2, 1))
+        second_of_pair = np.zeros(tpa_index.size, dtype=bool)
+        second_of_pair[1:] = tpa_index[1:] == tpa_index[:-1]
+        hemisphere = np.where(conjugate[tpa_index], np.where(second_of_pair, 's', 'n'),
+                              np.char.lower(hemispheres)[tpa_index])
+        return {'date': dates[tpa_index], 'hemisphere': hemisphere,
+                'conjugate': np.where(conjugate, 'conjugate', 'non-conjugate')[tpa_index]}
+
+    def reidy_batch(self, filename='reidy_TPA_data.txt') -> TPABatch:
+        """The dataset by Reidy et al. (2018) as a TPABatch."""
+        return TPABatch.from_columns(self.reidy_columns(filename))
+
+    @staticmethod
+    def tpas_from_columns(columns: dict):
+        """Generator that creates one TPA for each row of columns, a dict of arrays with the same length (e.g. from
+        kullen_columns) with 'date' (as numpy.datetime64) and other properties of TPA."""
+        size = len(columns['date'])
+        rows = dict((key, np.broadcast_to(values, (size,)).tolist()) for key, values in columns.items())
+        for i in range(size):
+            yield TPA(**dict((key, values[i]) for key, values in rows.items()))
 
     @staticmethod
     def merge_sn(row):
@@ -200,40 +240,48 @@ class DataExtract:
         notes.index = ['Note N', 'Note S', 'Conjugacy/FOV']
         return pd.concat([southern.iloc[:-1] if pd.notnull(southern['Time']) else northern[:-1], notes])
 
+    @staticmethod
+    def merge_sn_columns(datafile: pd.DataFrame) -> pd.DataFrame:
+        """Same as applying merge_sn to every row of datafile, but merges whole columns at once."""
+        northern = datafile.iloc[:, :datafile.columns.get_loc('Conjugacy/FOV')]
+        southern = datafile.iloc[:, datafile.columns.get_loc('Date.1'):]
+        southern.columns = [name.replace('.1', '') for name in southern.columns]
+        s_idx = southern['Time'].notnull().to_numpy()
+
+        # The rows are merged as objects (like the rows in apply) and the column types are inferred afterwards
+        merged = northern.iloc[:, :-1].astype(object)
+        merged.loc[s_idx, :] = southern.iloc[:, :-1].loc[s_idx, merged.columns].to_numpy(dtype=object)
+        merged['Note N'] = northern['Notes']
+        merged['Note S'] = southern['Notes']
+        merged['Conjugacy/FOV'] = datafile['Conjugacy/FOV']
+        return merged.infer_objects()
+
+    @staticmethod
+    def stack_x_columns(tpa_df: pd.DataFrame) -> pd.DataFrame:
+        """Replaces the X position columns (X1-X6) with one column 'X' with a list of the positions that are not null
+        (NaN if there are none) in each row."""
+        x_index = [colname for colname in tpa_df.columns if re.fullmatch('X[0-9]', colname[:2])]
+        x_values = tpa_df[x_index].to_numpy(dtype=object)
+        x_notnull = pd.notnull(x_values)
+        # Row by row, the positions that are not null are consecutive in x_values[x_notnull]
+        x_lists = np.split(x_values[x_notnull], np.cumsum(x_notnull.sum(axis=1))[:-1])
+        x_column = np.full(len(tpa_df), np.nan, dtype=object)
+        for i in np.flatnonzero(x_notnull.any(axis=1)):
+            x_column[i] = x_lists[i].tolist()
+
+        stacked_df = tpa_df.drop(columns=x_index)
+        stacked_df.insert(loc=tpa_df.columns.get_loc('Hemi-sphere') + 1, column='X', value=x_column)
+        return stacked_df
+
     def thor_dfs(self, filename: str = 'Sept_Oct_2015_TPAs_final_210518.xlsx', *args, **kwargs):
-        datafile = pd.read_excel(self.data_dir + filename, *args, **kwargs)
+        datafile = self.read_excel(self.data_dir + filename, *args, **kwargs)
         datafile.replace(' ', np.nan, inplace=True)
 
-        # TODO: Slow, do not use apply
-        merged_sn_df = datafile.apply(self.merge_sn, axis=1)
-
-        # northern = datafile.iloc[:, :datafile.columns.get_loc('Date.1')]
-        # southern = datafile.iloc[:, datafile.columns.get_loc('Date.1'):]
-        # southern.columns = [name.replace('.1', '') for name in southern.columns]
-        # pd.concat([northern, southern], axis=1, join='inner')
-
-        def listify(row, x_index):
-            """merge all X position columns (X1-X6) into one list
-            TODO: Probably inefficient. Use pd.Series.notna() and turn Series into list?
-            """
-            tpa_list = [tpa_loc for tpa_loc in row[x_index] if pd.notnull(tpa_loc)]
-            if tpa_list:
-                return tpa_list
-            else:
-                return np.nan
-
-        all_tpa_df = merged_sn_df.copy()
-        all_tpa_df.insert(loc=all_tpa_df.columns.get_loc('Hemi-sphere') + 1, column='X',
-                          value=merged_sn_df.apply(listify, axis=1,
-                                                   x_index=[colname for colname in merged_sn_df.columns if
-                                                            re.fullmatch('X[0-9]', colname[:2])]))
-        all_tpa_df.drop([colname for colname in merged_sn_df.columns if re.fullmatch('X[0-9]', colname[:2])], axis=1,
-                        inplace=True)
-        # Create separate dataframe for each TPA event
-        tpa_separator_index = all_tpa_df.index[all_tpa_df.isnull().all(1)]
-        tpa_dfs = [all_tpa_df.iloc[:tpa_separator_index[0], :]]
-        for i, j in zip(tpa_separator_index, np.append(tpa_separator_index[1:], None)):
-            tpa_dfs.append(all_tpa_df.iloc[i + 1:j, :])
+        all_tpa_df = self.stack_x_columns(self.merge_sn_columns(datafile))
+        # Create separate dataframe for each TPA event. Events are separated by empty rows
+        tpa_separator_index = np.flatnonzero(all_tpa_df.isnull().all(axis=1).to_numpy())
+        event_bounds = np.concatenate([[-1], tpa_separator_index, [len(all_tpa_df)]])
+        tpa_dfs = [all_tpa_df.iloc[i + 1:j, :] for i, j in zip(event_bounds[:-1], event_bounds[1:])]
 
         return tpa_dfs
 
@@ -323,7 +371,28 @@ class DataExtract:
                            ignore_singlearcs_with_multiple: bool = False, only_first_tpa: bool = False, debug: bool = False,
                            ignore_single_image: bool = False, *args, **kwargs):
         """More efficient TPA extracter with cleaner code. This will become `thor_dataclean` in future versions."""
-        raw_datafile = pd.read_excel(self.data_dir + filename, *args, **kwargs)
+        clean_df = self.new_thor_clean_df(filename, *args, **kwargs)
+
+        if debug:
+            yield clean_df
+
+        yield from DataExtract.tpas_from_columns(self.new_thor_columns(clean_df, ignore_noimage,
+                                                                       ignore_singlearcs_with_multiple, only_first_tpa,
+                                                                       ignore_single_image))
+
+    def new_thor_batch(self, filename: str = 'Sept_Oct_2015_TPAs_final_210518.xlsx', ignore_noimage: bool = True,
+                       ignore_singlearcs_with_multiple: bool = False, only_first_tpa: bool = False,
+                       ignore_single_image: bool = False, *args, **kwargs) -> TPABatch:
+        """The TPAs of new_thor_dataclean (which has the same arguments, except for debug) as a TPABatch."""
+        clean_df = self.new_thor_clean_df(filename, *args, **kwargs)
+        return TPABatch.from_columns(self.new_thor_columns(clean_df, ignore_noimage, ignore_singlearcs_with_multiple,
+                                                           only_first_tpa, ignore_single_image))
+
+    def new_thor_clean_df(self, filename: str = 'Sept_Oct_2015_TPAs_final_210518.xlsx', *args,
+                          **kwargs) -> pd.DataFrame:
+        """Reads and cleans the spreadsheet of new_thor_dataclean. Returns one row for each image with a TPA, with
+        the event number, dawn/dusk and conjugate type of each TPA. Events that should be ignored are removed."""
+        raw_datafile = self.read_excel(self.data_dir + filename, *args, **kwargs)
 
         # Clean data and merge SH columns with NH columns
         merged_sn_df = raw_datafile.replace(' ', pd.NA)
@@ -349,9 +418,11 @@ class DataExtract:
         tpa_count = (df_with_eventnr.loc[:, 'X1 dusk':'X4 dawn'].notnull()).sum(axis=1)
         df_with_eventnr = df_with_eventnr[tpa_count != 0]
 
-        clean_df = df_with_eventnr.groupby('event nr').filter(
-            lambda event_df: not event_df['Conjugacy/FOV'].str.contains('- ignore', na=False).any())
-        clean_df.reset_index(drop=True, inplace=True)
+        # Event numbers are ordered, so the rows of each event are consecutive
+        event_nr = df_with_eventnr['event nr'].to_numpy(dtype=float, na_value=np.nan)
+        ignored = event_any(df_with_eventnr['Conjugacy/FOV'].str.contains('- ignore', na=False).to_numpy(), event_nr)
+        # Rows before the first empty line have no event number and are removed as well
+        clean_df = df_with_eventnr[~ignored & ~np.isnan(event_nr)].reset_index(drop=True)
 
         clean_df['dawn/dusk'] = None
         tpa_count = (clean_df.loc[:, 'X1 dusk':'X4 dawn'].notnull()).sum(axis=1)
@@ -363,86 +434,221 @@ class DataExtract:
 
         clean_df['Hemi-sphere'] = clean_df['Hemi-sphere'].str.lower()
 
-        # Checks if both N and S are in the event. If they are not, it is a non-conjugate event
-        # TODO: Probably slow but works. Can maybe use the fact that event nr is ordered
+        # Checks if both N and S are in the event (and nothing else). If they are not, it is a non-conjugate event
         # TODO: if ignore_single_image is True, this might need to be changed
-        clean_df.loc[
-            clean_df['event nr'].isin(clean_df['event nr'].unique()[clean_df.groupby('event nr')['Hemi-sphere'].agg(set) != {'n', 's'}])
-            , 'conjugate type'] = 'non-conjugate'
+        event_nr = clean_df['event nr'].to_numpy(dtype=float)
+        hemisphere = clean_df['Hemi-sphere']
+        conjugate_event = (event_any(hemisphere.isin(['n']).to_numpy(), event_nr)
+                           & event_any(hemisphere.isin(['s']).to_numpy(), event_nr)
+                           & ~event_any(~hemisphere.isin(['n', 's']).to_numpy(), event_nr))
+        clean_df.loc[~conjugate_event, 'conjugate type'] = 'non-conjugate'
 
         clean_df.loc[
             clean_df['Conjugacy/FOV'].str.contains('conjugate', na=False)
             & ~clean_df['Conjugacy/FOV'].str.contains('non-conjugate', na=False), 'conjugate type'] = 'conjugate below'
 
         clean_df.loc[clean_df['Conjugacy/FOV'].str.contains('no image', na=False), 'conjugate type'] = ''
+        return clean_df
 
-        if debug:
-            yield clean_df
-
-        first_sn_index = clean_df.reset_index().groupby(['event nr', 'Hemi-sphere']).first()['index'].values
-        chosen_tpas_index = pd.Series(index=clean_df.index, data=False, dtype=bool)
-        chosen_tpas_index[first_sn_index] = True
+    @staticmethod
+    def new_thor_columns(clean_df: pd.DataFrame, ignore_noimage: bool = True,
+                         ignore_singlearcs_with_multiple: bool = False, only_first_tpa: bool = False,
+                         ignore_single_image: bool = False) -> dict:
+        """Chooses the TPAs in clean_df (see new_thor_clean_df) and returns them as columns (see tpas_from_columns).
+        See new_thor_dataclean for the arguments."""
+        event_nr = clean_df['event nr'].to_numpy(dtype=float)
+        multiple = clean_df['Conjugacy/FOV'].str.contains('multiple', na=False).to_numpy()
+        hemisphere_known = clean_df['Hemi-sphere'].notnull().to_numpy()
+
+        # The first TPA in each hemisphere of each event
+        chosen_tpas_index = ~clean_df.duplicated(['event nr', 'Hemi-sphere']).to_numpy() & hemisphere_known
         if not only_first_tpa:
-            chosen_tpas_index[clean_df[clean_df['Conjugacy/FOV'].str.contains('multiple', na=False)].index] = True
+            chosen_tpas_index |= multiple
         if ignore_noimage:
-            assert chosen_tpas_index.shape == clean_df['Conjugacy/FOV'].str.contains('no image', na=False).shape
-            chosen_tpas_index &= ~clean_df['Conjugacy/FOV'].str.contains('no image', na=False)
+            chosen_tpas_index &= ~clean_df['Conjugacy/FOV'].str.contains('no image', na=False).to_numpy()
         if ignore_singlearcs_with_multiple:
-            # TODO: This code is probably slow. Might be possible to remove for-loop
-            for _, event_df in clean_df.groupby('event nr'):
-                if (multiple_idx := event_df['Conjugacy/FOV'].str.contains('multiple', na=False)).any() and \
-                        event_df.index[0] != event_df.index[multiple_idx][0]:
-                    chosen_tpas_index[event_df.index[0]] = False
+            # The first TPA of an event with multiple arcs, unless the first TPA is one of the multiple arcs
+            event_start = np.ones(event_nr.size, dtype=bool)
+            event_start[1:] = event_nr[1:] != event_nr[:-1]
+            chosen_tpas_index &= ~(event_start & ~multiple & event_any(multiple, event_nr))
         if ignore_single_image:
-            # TODO: This code is probably slow. Might be possible to remove for-loop
-            for i, event in clean_df.groupby(['event nr', 'Hemi-sphere']):
-                if event.shape[0] <= 1:
-                    chosen_tpas_index[event.index[0]] = False
+            # Hemispheres of an event with only one image
+            single_image = ~clean_df.duplicated(['event nr', 'Hemi-sphere'], keep=False).to_numpy() & hemisphere_known
+            chosen_tpas_index &= ~single_image
 
         print('number of TPAs:', chosen_tpas_index.sum())
-        for row in clean_df[chosen_tpas_index].itertuples():
-            yield TPA(dt.datetime.combine(row.Date.date(), row.Time), hemisphere=row[4], conjugate=row[13],
-                      dadu=row[12], multiple=True if 'multiple' in str(row[10]).lower() else False)
-
-    def from_cache(self, all_datasets: Iterable):
-        # Load cached data
-        for dataset in all_datasets:
-            dataset.tpa_values = dict(np.load(f'{self.data_dir}{dataset.name}/tpa_values.npz'))
-            dataset.tpa_properties = dict(
-                np.load(f'{self.data_dir}{dataset.name}/tpa_properties.npz', allow_pickle=True))
-            dataset.total = dict(np.load(f'{self.data_dir}{dataset.name}/total.npz'))
-        return all_datasets
-
-    def to_cache(self, all_datasets: Iterable, settings: dict):
-        # cache data
+        chosen_df = clean_df[chosen_tpas_index]
+        dates = pd.to_datetime(chosen_df['Date']).dt.normalize() + pd.to_timedelta(chosen_df['Time'].astype(str))
+        return {'date': dates.to_numpy(dtype='datetime64[us]'),
+                'hemisphere': chosen_df['Hemi-sphere'].to_numpy(dtype=object),
+                'conjugate': chosen_df['conjugate type'].to_numpy(dtype=object),
+                'dadu': chosen_df['dawn/dusk'].to_numpy(dtype=object),
+                'multiple': chosen_df['Conjugacy/FOV'].astype(str).str.lower().str.contains('multiple').to_numpy()}
+
+    def source_file(self, dataset_name: str, **kwargs) -> str:
+        """Path to the catalog file that get_tpas(dataset_name, **kwargs) reads."""
+        try:
+            retriever_function = self.name_to_function[dataset_name]
+        except KeyError:
+            raise KeyError(f'No TPA data extracting function for dataset with name {dataset_name}')
+        filename = kwargs.get('filename', inspect.signature(retriever_function).parameters['filename'].default)
+        return self.data_dir + filename
+
+    def cache_key(self, dataset, parameters: Iterable[str], settings: dict = None, **kwargs) -> str:
+        """Key of the dataset in the DatasetCache, see dataset_cache.dataset_key.
+        kwargs are the keyword arguments of get_tpas that were used for the dataset."""
+        return dataset_key(dataset, parameters, [self.source_file(dataset.name, **kwargs)],
+                           {**(settings or {}), **kwargs})
+
+    def from_cache(self, all_datasets: Iterable, parameters: Iterable[str], settings: dict = None,
+                   cache_dir: str = None, **kwargs) -> list:
+        """Loads the cached values of the datasets that have been cached with the same parameters, settings, TPA
+        catalog and code version. The columns are memory-mapped.
+        Inputs:
+        all_datasets (Iterable[TPADataset]): the datasets.
+        parameters (Iterable[str]): the calculated parameters.
+        settings (dict): other settings the datasets depend on.
+        cache_dir (str): directory of the cache. Default: 'cache/' in the TPA data directory.
+        kwargs: keyword arguments of get_tpas that were used for the datasets.
+        Returns: the datasets that were not cached and still have to be calculated.
+        """
+        parameters = list(parameters)
+        cache = DatasetCache(self.data_dir + 'cache/' if cache_dir is None else cache_dir)
+        return [dataset for dataset in all_datasets
+                if not cache.load(dataset, self.cache_key(dataset, parameters, settings, **kwargs))]
+
+    def to_cache(self, all_datasets: Iterable, parameters: Iterable[str], settings: dict = None,
+                 cache_dir: str = None, **kwargs):
+        """Caches the calculated values of the datasets, see from_cache. The settings are saved in the manifest of each
+        dataset."""
+        parameters = list(parameters)
+        cache = DatasetCache(self.data_dir + 'cache/' if cache_dir is None else cache_dir)
         for dataset in all_datasets:
-            np.savez(f'{self.data_dir}{dataset.name}/tpa_values.npz', **dataset.tpa_values)
-            np.savez(f'{self.data_dir}{dataset.name}/total.npz', **dataset.total)
-            np.savez(f'{self.data_dir}{dataset.name}/tpa_properties.npz', **dataset.tpa_properties)
-
-        with open('F:/Simon TPA research/cached data/README.txt', 'w') as data_config_file:
-            data_config_file.write(f'Settings used when generating this data:\n')
-            for setting_name, value in settings.items():
-                data_config_file.write(f'{setting_name} = {value}\n')
+            cache.save(dataset, self.cache_key(dataset, parameters, settings, **kwargs),
+                       settings={**(settings or {}), **kwargs, 'parameters': list(parameters)})
 
     @staticmethod
     def calc_motion(mlt_start, mlt_end):
-        """Checks if TPA is moving or not."""
-        d = abs(mlt_end - mlt_start)
-        if d > 12:
-            d = 24 - d
-        if d > 2:
-            return "yes"
-        else:
-            return "no"
+        """Checks if TPA is moving or not. Also works for arrays of TPAs."""
+        d = np.abs(np.asarray(mlt_end) - np.asarray(mlt_start))
+        d = np.where(d > 12, 24 - d, d)
+        motion = np.where(d > 2, "yes", "no")
+        return motion.item() if motion.ndim == 0 else motion
 
     @staticmethod
     def calc_dadu(mlt):
-        """Checks if TPA is on dawn or dusk side."""
-        if 0 < mlt <= 12:
-            return "dawn"
-        else:
-            return "dusk"
+        """Checks if TPA is on dawn or dusk side. Also works for arrays of TPAs."""
+        mlt = np.asarray(mlt)
+        dadu = np.where((0 < mlt) & (mlt <= 12), "dawn", "dusk")
+        return dadu.item() if dadu.ndim == 0 else dadu
         # else:
         #    print("Unknown value of dadu (dawn or dusk): {}".format(mlt1))
         #    dadu = None
+
+
+def event_any(mask: np.ndarray, event_nr: np.ndarray) -> np.ndarray:
+    """For rows that are ordered by event number: True for every row of the events where mask is True in any row."""
+    if mask.size == 0:
+        return mask.astype(bool)
+    event_start = np.flatnonzero(np.concatenate([[True], event_nr[1:] != event_nr[:-1]]))
+    event_size = np.diff(np.append(event_start, mask.size))
+    return np.repeat(np.logical_or.reduceat(mask.astype(bool), event_start), event_size)
+
+
+def is_int(string: str) -> bool:
+    try:
+        int(string)
+        return True
+    except ValueError:
+        return False
+
+
+def fixed_width_digits(strings: List[str], width: int) -> np.ndarray:
+    """Converts strings of width digits (e.g. 'yymmddHHMM') into an array of shape (len(strings), width) with the
+    value of each digit."""
+    strings = np.array(strings, dtype=f'U{width}')
+    digits = strings.view(np.uint32).reshape(strings.size, width).astype(np.int64) - ord('0')
+    lengths = np.char.str_len(strings)
+    if ((digits < 0) | (digits > 9)).any() or (lengths != width).any():
+        raise ValueError(f'Expected strings of {width} digits.')
+    return digits
+
+
+def two_digit_year(years: np.ndarray) -> np.ndarray:
+    """Same as '%y' in datetime.strptime: 69-99 are 1969-1999 and 0-68 are 2000-2068."""
+    return np.where(years < 69, 2000 + years, 1900 + years)
+
+
+def month_numbers(abbreviations: Iterable[str]) -> np.ndarray:
+    """Converts English month abbreviations (e.g. 'Oct', case insensitive) into month numbers (1-12)."""
+    abbreviations, inverse = np.unique(np.char.lower(np.array(abbreviations, dtype=str)), return_inverse=True)
+    try:
+        numbers = np.array([MONTH_ABBREVIATIONS.index(abbreviation) + 1 for abbreviation in abbreviations], dtype=int)
+    except ValueError:
+        unknown = [abbreviation for abbreviation in abbreviations if abbreviation not in MONTH_ABBREVIATIONS]
+        raise ValueError(f'Unknown month {unknown[0]!r}.')
+    return numbers[inverse.ravel()]
+
+
+def clock_times(times: List[str]) -> (np.ndarray, np.ndarray, np.ndarray):
+    """Splits times written as 'HH:MM' or 'HH:MM:SS' into hours, minutes and seconds."""
+    if not times:
+        return (np.array([], dtype=int),) * 3
+    fields = [time.split(':') for time in times]
+    if any(len(time_fields) not in (2, 3) for time_fields in fields):
+        raise ValueError("Expected times written as 'HH:MM' or 'HH:MM:SS'.")
+    fields = np.array([time_fields + ['0'] * (3 - len(time_fields)) for time_fields in fields], dtype=int)
+    return fields[:, 0], fields[:, 1], fields[:, 2]
+
+
+def compose_datetimes(year, month, day, hour=0, minute=0, second=0) -> np.ndarray:
+    """Combines arrays of date and time fields into an array of numpy.datetime64[us].
+    Raises ValueError for invalid dates and times, like datetime.strptime."""
+    year, month, day, hour, minute, second = np.broadcast_arrays(*(np.asarray(values, dtype=np.int64) for values in
+                                                                    (year, month, day, hour, minute, second)))
+    months = (year - 1970) * 12 + month - 1
+    month_starts = months.astype('datetime64[M]').astype('datetime64[D]')
+    month_lengths = ((months + 1).astype('datetime64[M]').astype('datetime64[D]') - month_starts).astype(np.int64)
+    valid = ((1 <= month) & (month <= 12) & (1 <= day) & (day <= month_lengths) & (0 <= hour) & (hour < 24)
+             & (0 <= minute) & (minute < 60) & (0 <= second) & (second < 60))
+    if not valid.all():
+        i = np.flatnonzero(~valid)[0]
+        raise ValueError(f'Invalid date {year[i]}-{month[i]}-{day[i]} {hour[i]}:{minute[i]}:{second[i]}.')
+    return (month_starts.astype('datetime64[us]') + (day - 1).astype('timedelta64[D]')
+            + hour.astype('timedelta64[h]') + minute.astype('timedelta64[m]') + second.astype('timedelta64[s]'))
+
+
+if __name__ == '__main__':
+    # Check that the column-wise thor_dfs returns the same events as applying merge_sn and listify row by row
+    import tempfile
+    from pandas.testing import assert_frame_equal
+    from ..benchmarks.fixtures import THOR_FILENAME, seed_spreadsheet, thor_spreadsheet
+
+    def listify(row, x_index):
+        """merge all X position columns (X1-X6) into one list (the previous row-wise version)"""
+        tpa_list = [tpa_loc for tpa_loc in row[x_index] if pd.notnull(tpa_loc)]
+        return tpa_list if tpa_list else np.nan
+
+    for n_events in [1, 40, 500]:
+        spreadsheet = thor_spreadsheet(n_events, np.random.default_rng(n_events))
+        merged_sn_df = spreadsheet.replace(' ', np.nan).apply(DataExtract.merge_sn, axis=1)
+        x_index = [colname for colname in merged_sn_df.columns if re.fullmatch('X[0-9]', colname[:2])]
+        rowwise_df = merged_sn_df.drop(x_index, axis=1)
+        rowwise_df.insert(loc=merged_sn_df.columns.get_loc('Hemi-sphere') + 1, column='X',
+                          value=merged_sn_df.apply(listify, axis=1, x_index=x_index))
+        separator_index = rowwise_df.index[rowwise_df.isnull().all(1)]
+        rowwise_dfs = [rowwise_df.iloc[:separator_index[0], :]]
+        for i, j in zip(separator_index, np.append(separator_index[1:], None)):
+            rowwise_dfs.append(rowwise_df.iloc[i + 1:j, :])
+
+        with tempfile.TemporaryDirectory() as tpa_dir:
+            data_extractor = DataExtract(tpa_dir + '/')
+            seed_spreadsheet(data_extractor, THOR_FILENAME, spreadsheet)
+            columnwise_dfs = data_extractor.thor_dfs(THOR_FILENAME)
+        assert len(columnwise_dfs) == len(rowwise_dfs)
+        for columnwise_event, rowwise_event in zip(columnwise_dfs, rowwise_dfs):
+            assert_frame_equal(columnwise_event, rowwise_event)
+            # assert_frame_equal compares the lists of X positions as objects, so also compare their elements' types
+            assert ([[type(x) for x in xs] if isinstance(xs, list) else None for xs in columnwise_event['X']]
+                    == [[type(x) for x in xs] if isinstance(xs, list) else None for xs in rowwise_event['X']])
+        print(f'thor_dfs is equal to the row-wise version for {n_events} events')
@@ -1,2 +1,3 @@
 from .tpa_dataset import TPADataset
-from .tpa import TPA
\ No newline at end of file
+from .tpa import TPA
+from .tpa_batch import TPABatch, TPARecord
\ No newline at end of file
@@ -0,0 +1,39 @@
+import numpy as np
+
+
+class ColumnBuilder:
+    """1D NumPy array that can be grown one value (or many values) at a time.
+    The values are written into a buffer whose capacity is doubled whenever it is full, so appending is amortized O(1)
+    instead of copying the whole array like numpy.append does. The dtype is promoted in the same way as numpy.append.
+    """
+
+    def __init__(self, values=None):
+        self.size = 0
+        self.buffer = None
+        # The array that was returned last time, used to check if the column was replaced from outside
+        self.view = None
+        if values is not None:
+            self.extend(values)
+
+    def extend(self, values) -> np.ndarray:
+        """Add values to the end of the column.
+        Returns: the column (a view of the buffer) including the new values.
+        """
+        values = np.asarray(values).ravel()
+        size = self.size + values.size
+        if self.buffer is None:
+            self.buffer = np.empty(max(size, 1), dtype=values.dtype)
+        else:
+            dtype = np.result_type(self.buffer.dtype, values.dtype)
+            if size > self.buffer.size or dtype != self.buffer.dtype:
+                buffer = np.empty(max(size, 2 * self.buffer.size), dtype=dtype)
+                buffer[:self.size] = self.buffer[:self.size]
+                self.buffer = buffer
+        self.buffer[self.size:size] = values
+        self.size = size
+        self.view = self.buffer[:size]
+        return self.view
+
+    def append(self, value) -> np.ndarray:
+        """Add a single value to the end of the column."""
+        return self.extend([value])
@@ -2,10 +2,11 @@ import datetime as dt
 from dataclasses import dataclass, field
 from typing import List
 
-from geopack import geopack
 import numpy as np
 
 from ..data_extraction import test_OMNI
+from ..data_extraction.dipole_table import lookup_dipole_tilt
+from ..data_extraction.dipole_tilt import to_unix_seconds
 
 
 @dataclass
@@ -54,15 +55,18 @@ class TPA:
                 else:
                     setattr(self, key, np.nan)
 
+    def parameter_values(self) -> dict:
+        """Returns the dipole tilt and the OMNI parameters that have been calculated for the TPA."""
+        # The dipole tilt is NaN (the class attribute) until get_dipole_data is called, so it is not in vars(self)
+        return {'dipole': self.dipole, **dict((key, value) for key, value in vars(self).items()
+                                              if key not in self.properties and key != 'properties')}
+
     def get_dipole_data(self, avgcalctime: int):
         """Retrieves information about the dipole tile of the Earth during the transpolar arc.
         Inputs:
         avgcalctime (int): calculate the average dipole tilt over these number of minutes.
         """
-        def get_dipole_tilt(minute):
-            t = (self.date - dt.datetime(1970, 1, 1) - dt.timedelta(minutes=int(minute))).total_seconds()
-            return 180 / np.pi * geopack.recalc(t)
-
-        dipoles = np.vectorize(get_dipole_tilt)(np.arange(1, avgcalctime+1, dtype=int))
+        minutes = np.arange(1, avgcalctime+1, dtype=int)
+        dipoles = lookup_dipole_tilt(to_unix_seconds(self.date) - 60 * minutes)
         self.dipole = np.nanmean(dipoles)
 
@@ -0,0 +1,230 @@
+# Standard library
+import datetime as dt
+from typing import Iterable, List
+# Packages
+import numpy as np
+import pandas as pd
+# Self-written modules
+from ..data_extraction.test_OMNI import LoadOMNI
+
+
+# Fixed dtypes of the TPA properties. The strings are widened if a dataset contains longer values.
+PROPERTY_DTYPES = [('date', 'datetime64[us]'), ('hemisphere', 'U1'), ('dadu', 'U4'), ('moving', 'U3'),
+                   ('conjugate', 'U15'), ('multiple', '?')]
+PROPERTY_NAMES = [name for name, _ in PROPERTY_DTYPES]
+
+
+def tpa_dtype(parameters: Iterable[str] = (), string_widths: dict = None) -> np.dtype:
+    """Structured dtype of a TPABatch: the TPA properties, the dipole tilt and one float64 field for each OMNI
+    parameter in `parameters` (in the order of LoadOMNI.full_para_list).
+    Inputs:
+    parameters (Iterable[str]): OMNI parameters, e.g. ['BxGSM', 'vel'].
+    string_widths (dict): number of characters of the string properties, e.g. {'conjugate': 20}, if they should be
+                          wider than the default.
+    """
+    string_widths = {} if string_widths is None else string_widths
+    fields = []
+    for name, dtype in PROPERTY_DTYPES:
+        if name in string_widths:
+            dtype = f'U{max(int(dtype[1:]), string_widths[name])}'
+        fields.append((name, dtype))
+    fields.append(('dipole', 'f8'))
+    fields.extend((paraname, 'f8') for paraname in sort_parameters(parameters))
+    return np.dtype(fields)
+
+
+def sort_parameters(parameters: Iterable[str]) -> List[str]:
+    """Sorts OMNI parameters in the order of LoadOMNI.full_para_list. 'dipole' is not an OMNI parameter and is removed.
+    """
+    parameters = set(parameters) - {'dipole'}
+    # LoadOMNI also accepts 'BxGSM', which is the same as 'BxGSE'
+    para_list = LoadOMNI.full_para_list.copy()
+    para_list.insert(para_list.index('BxGSE') + 1, 'BxGSM')
+    unknown = parameters - set(para_list)
+    if unknown:
+        raise ValueError(f'Unknown OMNI parameters: {sorted(unknown)}. See LoadOMNI.full_para_list.')
+    return [paraname for paraname in para_list if paraname in parameters]
+
+
+def property_string(value) -> str:
+    """Converts a TPA property to a string for the fixed-width string fields. None (e.g. an unknown dadu) becomes ''."""
+    return '' if value is None else str(value)
+
+
+class TPARecord:
+    """Compact version of data_structures.tpa.TPA for storing a single transpolar arc.
+    The fields are stored in __slots__ and the OMNI parameters in the tuples parameter_names and parameter_array,
+    instead of the instance dict, the duplicated properties dict and the dynamically set attributes of TPA.
+    """
+    __slots__ = ('date', 'hemisphere', 'dadu', 'moving', 'conjugate', 'multiple', 'dipole', 'parameter_names',
+                 'parameter_array')
+
+    def __init__(self, date: dt.datetime, hemisphere: str = '', dadu: str = '', moving: str = '', conjugate: str = '',
+                 multiple: bool = False, dipole: float = np.nan, parameters: dict = None):
+        self.date = date
+        self.hemisphere = hemisphere
+        self.dadu = dadu
+        self.moving = moving
+        self.conjugate = conjugate
+        self.multiple = multiple
+        self.dipole = dipole
+        parameters = {} if parameters is None else parameters
+        self.parameter_names = tuple(parameters.keys())
+        self.parameter_array = tuple(float(value) for value in parameters.values())
+
+    @classmethod
+    def from_tpa(cls, tpa) -> 'TPARecord':
+        """Converts a data_structures.tpa.TPA (including the OMNI parameters calculated for it) into a TPARecord."""
+        parameters = tpa.parameter_values()
+        dipole = parameters.pop('dipole', np.nan)
+        return cls(tpa.date, tpa.hemisphere, tpa.dadu, tpa.moving, tpa.conjugate, tpa.multiple, dipole, parameters)
+
+    @property
+    def properties(self) -> dict:
+        """The same dict as TPA.properties."""
+        return dict((name, getattr(self, name)) for name in PROPERTY_NAMES)
+
+    @property
+    def parameters(self) -> dict:
+        return dict(zip(self.parameter_names, self.parameter_array))
+
+    def parameter_values(self) -> dict:
+        """Dipole tilt and OMNI parameters of the TPA, in the same format as TPA.parameter_values."""
+        return {'dipole': self.dipole, **self.parameters}
+
+    def __getitem__(self, key: str):
+        if key in PROPERTY_NAMES or key == 'dipole':
+            return getattr(self, key)
+        try:
+            return self.parameter_array[self.parameter_names.index(key)]
+        except ValueError:
+            raise KeyError(key)
+
+    def __eq__(self, other):
+        if not isinstance(other, TPARecord):
+            return NotImplemented
+        return self.properties == other.properties and np.array_equal(self.dipole, other.dipole, equal_nan=True) \
+            and self.parameter_names == other.parameter_names \
+            and np.array_equal(self.parameter_array, other.parameter_array, equal_nan=True)
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={value!r}' for name, value in self.properties.items())
+        return f'TPARecord({fields}, dipole={self.dipole!r}, parameters={self.parameters!r})'
+
+
+class TPABatch:
+    """Many transpolar arcs stored in a single NumPy structured array with fixed dtypes (see tpa_dtype).
+    Every property and parameter is a contiguous column, e.g. batch['BxGSM'] or batch['date'], which can be used
+    directly in the statistics and plotting functions.
+    Inputs:
+    data (numpy.ndarray): structured array with the dtype from tpa_dtype.
+    """
+
+    def __init__(self, data: np.ndarray):
+        missing = set(PROPERTY_NAMES + ['dipole']) - set(data.dtype.names)
+        if missing:
+            raise ValueError(f'TPA data is missing the fields {sorted(missing)}')
+        self.data = data
+
+    @classmethod
+    def empty(cls, size: int, parameters: Iterable[str] = (), string_widths: dict = None) -> 'TPABatch':
+        """Batch of `size` TPAs where all parameters are NaN and all properties are empty."""
+        data = np.zeros(size, dtype=tpa_dtype(parameters, string_widths))
+        data['date'] = np.datetime64('NaT')
+        data['dipole'] = np.nan
+        for paraname in sort_parameters(parameters):
+            data[paraname] = np.nan
+        return cls(data)
+
+    @classmethod
+    def from_columns(cls, columns: dict) -> 'TPABatch':
+        """Creates a batch from a dict of columns, e.g. {'date': dates, 'hemisphere': 'n', 'BxGSM': values}.
+        Single values are used for all TPAs and missing properties and parameters are left empty (NaN)."""
+        size = max(np.size(values) for values in columns.values())
+        parameters = [key for key in columns.keys() if key not in PROPERTY_NAMES]
+        string_widths = {}
+        for name, dtype in PROPERTY_DTYPES:
+            if name in columns and dtype.startswith('U'):
+                strings = np.asarray(columns[name])
+                if strings.dtype.kind == 'O':
+                    strings = np.array([property_string(value) for value in strings.ravel()])
+                columns = {**columns, name: strings}
+                string_widths[name] = strings.dtype.itemsize // 4 if strings.dtype.kind == 'U' else 0
+
+        batch = cls.empty(size, parameters, string_widths)
+        for key, values in columns.items():
+            batch.data[key] = np.asarray(values, dtype='datetime64[us]') if key == 'date' else values
+        return batch
+
+    @classmethod
+    def from_tpas(cls, tpas: Iterable, parameters: Iterable[str] = None) -> 'TPABatch':
+        """Converts TPA or TPARecord objects into a batch.
+        Inputs:
+        tpas (Iterable): the TPAs, e.g. DataExtract.get_tpas(name).
+        parameters (Iterable[str]): OMNI parameters that are stored. Default: all parameters that were calculated for
+                                    any of the TPAs. Parameters that were not calculated for a TPA are NaN.
+        """
+        columns = dict((name, []) for name in PROPERTY_NAMES)
+        tpa_parameters = []
+        for tpa in tpas:
+            for name in PROPERTY_NAMES:
+                columns[name].append(getattr(tpa, name))
+            tpa_parameters.append(tpa.parameter_values())
+
+        if parameters is None:
+            parameters = set().union(*tpa_parameters)
+        for paraname in ['dipole', *sort_parameters(parameters)]:
+            columns[paraname] = [values.get(paraname, np.nan) for values in tpa_parameters]
+        for name, dtype in PROPERTY_DTYPES:
+            if dtype.startswith('U'):
+                columns[name] = np.array([property_string(value) for value in columns[name]], dtype=str)
+        return cls.from_columns(columns)
+
+    @property
+    def parameters(self) -> List[str]:
+        """OMNI parameters that are stored in the batch."""
+        return [name for name in self.data.dtype.names if name not in PROPERTY_NAMES and name != 'dipole']
+
+    def set_parameters(self, values: dict):
+        """Sets the values of parameters for all TPAs, e.g. the output of TPADataset.get_batch_parameters.
+        Parameters that are not yet stored in the batch are added."""
+        new_parameters = [key for key in values.keys() if key not in self.data.dtype.names]
+        if new_parameters:
+            string_widths = dict((name, self.data.dtype[name].itemsize // 4) for name, dtype in PROPERTY_DTYPES
+                                 if dtype.startswith('U'))
+            data = TPABatch.empty(len(self), [*self.parameters, *new_parameters], string_widths).data
+            for name in self.data.dtype.names:
+                data[name] = self.data[name]
+            self.data = data
+        for key, value in values.items():
+            self.data[key] = value
+
+    def get_parameters(self, OMNI_dir: str, parameters, timeshift: float, avgcalctime: float):
+        """Calculates parameters (e.g. 'BxGSM' or 'dipole') for all TPAs at once and stores them in the batch.
+        Gives the same values as TPA.get_parameters, see TPADataset.get_batch_parameters."""
+        from .tpa_dataset import batch_parameters
+        self.set_parameters(batch_parameters(OMNI_dir, parameters, self.data['date'], timeshift, avgcalctime))
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(dict((name, self.data[name]) for name in self.data.dtype.names))
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, key):
+        """batch['BxGSM'] returns a column, batch[i] a TPARecord and batch[mask] or batch[i:j] a new TPABatch."""
+        if isinstance(key, str):
+            return self.data[key]
+        if isinstance(key, (int, np.integer)):
+            row = self.data[key]
+            return TPARecord(row['date'].astype(dt.datetime), *(row[name].item() for name in PROPERTY_NAMES[1:]),
+                             dipole=float(row['dipole']),
+                             parameters=dict((paraname, float(row[paraname])) for paraname in self.parameters))
+        return TPABatch(self.data[key])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return f'TPABatch(size={len(self)}, parameters={self.parameters})'
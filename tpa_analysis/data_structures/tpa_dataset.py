@@ -1,14 +1,20 @@
 # Standard library
 import datetime as dt
-from typing import Union, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Union
 from dataclasses import dataclass, field
 # Packages
 import numpy as np
 import pandas as pd
-from geopack import geopack
 # Self-written modules
+from ..data_extraction.dipole_table import lookup_dipole_tilt
+from ..data_extraction.dipole_tilt import to_unix_seconds
 from ..data_extraction.test_OMNI import LoadOMNI
+from ..data_structures.columns import ColumnBuilder
 from ..data_structures.tpa import TPA
+from ..data_structures.tpa_batch import PROPERTY_NAMES, TPABatch
+from ..statistics.streaming import RunningStats, StreamingHistogram
+from ..statistics.windows import window_nanmean
 
 
 @dataclass
@@ -23,16 +29,20 @@ class TPADataset:
     total: dict = field(default_factory=lambda: dict((paraname, []) for paraname in [*LoadOMNI.full_para_list, 'dipole']))
     tpa_values: dict = field(init=False)
     tpa_properties: dict = field(init=False, default_factory=lambda: {})
+    _columns: dict = field(init=False, repr=False, compare=False, default_factory=dict)
 
     def __post_init__(self):
         self.tpa_values = self.total.copy()
 
-    def get_dataset_parameters(self, OMNI_dir: str, parameters: Union[List[str], str]):
+    def get_dataset_parameters(self, OMNI_dir: str, parameters: Union[List[str], str], n_workers: int = None,
+                               executor: str = 'thread'):
         """Loads the value of parameters for the entire period of the dataset.
         Inputs:
         OMNI_dir (str): directory where OMNI data is stored.
         paras (List[str], str): parameters that will be extracted. A full list of available parameters can be seen in
-                                LoadOMNI.full_para_list. """
+                                LoadOMNI.full_para_list.
+        n_workers (int): number of months that are decoded in parallel. Default: one month at a time.
+        executor (str): 'thread' or 'process', see LoadOMNI.load_OMNI_data. """
         if isinstance(parameters, str):
             parameters = [parameters]
 
@@ -40,36 +50,250 @@ class TPADataset:
 
         if 'dipole' in parameters:
             dataset_date_range = pd.date_range(self.start_time, self.end_time, freq='H')
-            dipoles = np.empty(dataset_date_range.shape, dtype=float)
-            for i, time in enumerate(dataset_date_range):
-                unix_time = (time - dt.datetime(1970, 1, 1)).total_seconds()
-                dipole = 180 / np.pi * geopack.recalc(unix_time)
-                dipoles[i] = dipole
-
-            self.total['dipole'] = dipoles
+            self.total['dipole'] = lookup_dipole_tilt(dataset_date_range.values)
 
             parameters.remove('dipole')
 
         OMNI_data_loader = LoadOMNI(self.start_time, self.end_time, data_dir=OMNI_dir)
-        OMNI_data_loader.load_OMNI_data(paras_in=parameters)
+        OMNI_data_loader.load_OMNI_data(paras_in=parameters, n_workers=n_workers, executor=executor)
 
         for key, val in OMNI_data_loader.paras.items():
             if key in parameters:
                 val = val.flatten()
                 self.total[key] = val
 
+    def get_dataset_summary(self, OMNI_dir: str, parameters: Union[List[str], str], bins: dict = None) -> dict:
+        """Calculates summary statistics (and optionally histograms) of parameters for the entire period of the dataset
+        without keeping the full time series in memory. The OMNI data is read one month at a time and every month is
+        reduced before the next one is read, so this also works for periods that do not fit in memory.
+        Inputs:
+        OMNI_dir (str): directory where OMNI data is stored.
+        parameters (List[str], str): parameters that will be summarized.
+        bins (dict): bin edges of the histogram of each parameter, e.g. {'BzGSM': np.arange(-20, 21)}. Parameters
+                     without bins get no histogram.
+        Returns: dict with for each parameter a dict with 'stats' (statistics.RunningStats) and, if bins were given,
+                 'hist' (statistics.StreamingHistogram).
+        """
+        if isinstance(parameters, str):
+            parameters = [parameters]
+        bins = {} if bins is None else bins
+
+        summary = {}
+        for key in parameters:
+            summary[key] = {'stats': RunningStats()}
+            if key in bins:
+                summary[key]['hist'] = StreamingHistogram(bins[key])
+
+        def reduce_chunk(chunk):
+            for key, values in chunk.items():
+                if key in summary:
+                    for reducer in summary[key].values():
+                        reducer.update(values)
+
+        OMNI_parameters = [parameter for parameter in parameters if parameter != 'dipole']
+        if 'dipole' in parameters:
+            dataset_date_range = pd.date_range(self.start_time, self.end_time, freq='H')
+            reduce_chunk({'dipole': lookup_dipole_tilt(dataset_date_range.values)})
+
+        OMNI_data_loader = LoadOMNI(self.start_time, self.end_time, data_dir=OMNI_dir)
+        for chunk in OMNI_data_loader.iter_OMNI_data(paras_in=OMNI_parameters, cache=False):
+            reduce_chunk(chunk)
+        return summary
+
+    def get_batch_parameters(self, OMNI_dir: str, parameters: Union[List[str], str], dates,
+                             timeshift: float = None, avgcalctime: float = None) -> dict:
+        """Calculates the parameters of many TPAs at once.
+        Gives the same values as TPA.get_parameters for each date, but the OMNI months are only loaded once and all
+        averages are calculated from prefix sums over the 1-minute data.
+        Inputs:
+        OMNI_dir (str): directory where OMNI data is stored.
+        parameters (List[str], str): parameters that will be calculated, e.g. 'BxGSM' or 'dipole'.
+        dates (array_like): dates of the TPAs, e.g. self.tpa_properties['date'].
+        timeshift (float): minutes that the averaging window is shifted backwards in time. Default: self.time_shift.
+        avgcalctime (float): length of the averaging window in minutes. Default: self.average_calctime.
+        Returns: dict with an array containing the value for each date for each parameter.
+        """
+        timeshift = self.time_shift if timeshift is None else timeshift
+        avgcalctime = self.average_calctime if avgcalctime is None else avgcalctime
+        return batch_parameters(OMNI_dir, parameters, dates, timeshift, avgcalctime)
+
+    def sweep_parameters(self, OMNI_dir: str, parameters: Union[List[str], str], dates, timeshifts, avgcalctimes,
+                         n_workers: int = None) -> np.ndarray:
+        """Calculates the parameters of many TPAs for every combination of time shift and averaging window.
+        The OMNI data is loaded once and the prefix sums of each parameter are calculated once, after which every
+        combination costs O(1) per TPA. Each value is the same as TPA.get_parameters would give for that combination.
+        Inputs:
+        OMNI_dir (str): directory where OMNI data is stored.
+        parameters (List[str], str): parameters that will be calculated, e.g. 'BxGSM' or 'dipole'.
+        dates (array_like): dates of the TPAs, e.g. self.tpa_properties['date'].
+        timeshifts (array_like): time shifts in minutes, e.g. np.arange(0, 121, 10).
+        avgcalctimes (array_like): lengths of the averaging windows in minutes, e.g. np.arange(10, 61, 10).
+        n_workers (int): number of threads that calculate the parameters in parallel. Default: no parallelism.
+        Returns: array with shape (TPA, time shift, averaging window, parameter).
+        """
+        if isinstance(parameters, str):
+            parameters = [parameters]
+
+        dates = np.asarray(dates, dtype='datetime64[us]')
+        timeshifts = np.asarray(timeshifts, dtype=float)
+        avgcalctimes = np.asarray(avgcalctimes, dtype=float)
+        sweep_values = np.empty((dates.size, timeshifts.size, avgcalctimes.size, len(parameters)))
+
+        OMNI_parameters = [parameter for parameter in parameters if parameter != 'dipole']
+        if OMNI_parameters:
+            starts = dates[:, None, None] - minutes_to_timedelta(timeshifts[None, :, None] + avgcalctimes[None, None, :])
+            stops = np.broadcast_to(dates[:, None, None] - minutes_to_timedelta(timeshifts[None, :, None]), starts.shape)
+            paras = self.load_OMNI_windows(OMNI_dir, OMNI_parameters, starts.min(axis=(1, 2)), stops.max(axis=(1, 2)))
+            first, last = window_indices(paras['datetime'], starts, stops)
+
+            def sweep_parameter(key):
+                return window_nanmean(paras[key], first, last)
+
+            if n_workers is None:
+                sweeps = map(sweep_parameter, OMNI_parameters)
+            else:
+                with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                    sweeps = list(executor.map(sweep_parameter, OMNI_parameters))
+            for key, sweep in zip(OMNI_parameters, sweeps):
+                sweep_values[..., parameters.index(key)] = sweep
+
+        if 'dipole' in parameters:
+            # The dipole tilt is averaged over the minutes before the TPA and does not depend on the time shift
+            for i, avgcalctime in enumerate(avgcalctimes):
+                sweep_values[:, :, i, parameters.index('dipole')] = self.batch_dipoles(dates, avgcalctime)[:, None]
+
+        return sweep_values
+
+    @staticmethod
+    def batch_dipoles(dates: np.ndarray, avgcalctime: float) -> np.ndarray:
+        """Calculates the dipole tilt of TPAs in the same way as TPA.get_dipole_data."""
+        minutes = np.arange(1, avgcalctime+1, dtype=int)
+        return np.nanmean(lookup_dipole_tilt(to_unix_seconds(dates)[:, None] - 60 * minutes), axis=1)
+
+    @staticmethod
+    def load_OMNI_windows(OMNI_dir: str, parameters: List[str], starts: np.ndarray, stops: np.ndarray) -> dict:
+        """Loads the OMNI data covering the time windows between starts and stops, loading each needed month once.
+        Windows in consecutive months are loaded together, while months without any windows are skipped.
+        Returns: dict in the same format as LoadOMNI.paras. Use window_indices to find the data of each window.
+        """
+        start_months = starts.astype('datetime64[M]').astype(int)
+        stop_months = stops.astype('datetime64[M]').astype(int)
+        runs = []
+        for i in np.argsort(starts, kind='stable'):
+            if runs and start_months[i] <= runs[-1][2] + 1:
+                runs[-1][1] = max(runs[-1][1], stops[i])
+                runs[-1][2] = max(runs[-1][2], stop_months[i])
+            else:
+                runs.append([starts[i], stops[i], stop_months[i]])
+
+        run_paras = []
+        for run_start, run_stop, _ in runs:
+            OMNI_data_loader = LoadOMNI(run_start.tolist(), run_stop.tolist(), data_dir=OMNI_dir)
+            # Load the last month to its end so that the last time <= stop of every window is included
+            OMNI_data_loader.dt_ranges[-1][1] = -1
+            OMNI_data_loader.load_OMNI_data(paras_in=parameters)
+            run_paras.append(OMNI_data_loader.paras)
+
+        return dict((key, np.concatenate([run_para[key].flatten() for run_para in run_paras]))
+                    for key in ['datetime', *parameters])
+
     def append(self, tpa: TPA):
         """Add a transpolar arc (TPA) to the dataset.
          Takes the TPA's attributes and appends its values to self.tpa_values and self.tpa_properties.
         Inputs:
         tpa (data_structures.tpa_dataset.tpa.TPA): transpolar arc that will be added to the dataset.
         """
-        for value in self.total.keys():
-            if hasattr(tpa, value):
-                self.tpa_values[value] = np.append(self.tpa_values[value], getattr(tpa, value))
+        self.extend([tpa])
 
-        for prop in tpa.properties:
-            if prop in self.tpa_properties.keys():
-                self.tpa_properties[prop] = np.append(self.tpa_properties[prop], getattr(tpa, prop))
-            else:
-                self.tpa_properties[prop] = np.array([getattr(tpa, prop)])
+    def extend(self, tpas: Iterable[TPA]):
+        """Add many transpolar arcs (TPAs) to the dataset at once.
+        The values of all TPAs are collected first and then added to self.tpa_values and self.tpa_properties in one
+        step. Both dicts keep containing NumPy arrays, which are grown with amortized doubling instead of being copied
+        for every TPA.
+        Inputs:
+        tpas (Iterable[TPA], TPABatch): transpolar arcs that will be added to the dataset, e.g.
+                                        DataExtract.get_tpas(name). Can also contain TPARecord objects.
+        """
+        if isinstance(tpas, TPABatch):
+            # The columns of the batch can be added directly
+            new_values = dict((key, tpas[key]) for key in ['dipole', *tpas.parameters] if key in self.total)
+            new_properties = dict((prop, tpas[prop]) for prop in PROPERTY_NAMES)
+            new_properties['date'] = new_properties['date'].astype(dt.datetime)
+            tpas = []
+        else:
+            new_values = {}
+            new_properties = {}
+        for tpa in tpas:
+            for key, value in tpa.parameter_values().items():
+                if key in self.total:
+                    new_values.setdefault(key, []).append(value)
+            for prop in tpa.properties:
+                new_properties.setdefault(prop, []).append(getattr(tpa, prop))
+
+        for key, values in new_values.items():
+            self.tpa_values[key] = self._column_builder('values', key, self.tpa_values.get(key)).extend(values)
+        for prop, values in new_properties.items():
+            self.tpa_properties[prop] = self._column_builder('properties', prop,
+                                                             self.tpa_properties.get(prop)).extend(values)
+        return self
+
+    def _column_builder(self, group: str, key: str, column) -> ColumnBuilder:
+        """Returns the builder of a column in self.tpa_values or self.tpa_properties. A new builder is started from
+        the current column if the column was replaced (e.g. by DataExtract.from_cache) since it was last built."""
+        builder = self._columns.get((group, key))
+        if builder is None or builder.view is not column:
+            builder = ColumnBuilder(column)
+            self._columns[(group, key)] = builder
+        return builder
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Returns the TPAs of the dataset as a DataFrame with one row per TPA, containing the TPA properties and all
+        values that were calculated for every TPA."""
+        tpa_df = pd.DataFrame(self.tpa_properties)
+        for key, values in self.tpa_values.items():
+            if len(values) == len(tpa_df) and len(values) != 0:
+                tpa_df[key] = values
+        return tpa_df
+
+
+def batch_parameters(OMNI_dir: str, parameters: Union[List[str], str], dates, timeshift: float,
+                     avgcalctime: float) -> dict:
+    """Calculates the parameters of many TPAs at once, see TPADataset.get_batch_parameters."""
+    if isinstance(parameters, str):
+        parameters = [parameters]
+
+    parameters = parameters.copy()
+    dates = np.asarray(dates, dtype='datetime64[us]')
+
+    batch_values = {}
+    if 'dipole' in parameters:
+        batch_values['dipole'] = TPADataset.batch_dipoles(dates, avgcalctime)
+        parameters.remove('dipole')
+
+    if not parameters:
+        return batch_values
+
+    starts = dates - minutes_to_timedelta(timeshift + avgcalctime)
+    stops = dates - minutes_to_timedelta(timeshift)
+    paras = TPADataset.load_OMNI_windows(OMNI_dir, parameters, starts, stops)
+    first, last = window_indices(paras['datetime'], starts, stops)
+    for key in parameters:
+        batch_values[key] = window_nanmean(paras[key], first, last)
+    return batch_values
+
+
+def minutes_to_timedelta(minutes):
+    """Convert a (possibly fractional) number of minutes, or an array of minutes, into numpy.timedelta64 with
+    microsecond resolution."""
+    return np.round(np.asarray(minutes) * 60e6).astype(np.int64).astype('timedelta64[us]')
+
+
+def window_indices(times: np.ndarray, starts: np.ndarray, stops: np.ndarray):
+    """Finds the indices of the windows between starts and stops in the sorted array `times`.
+    Selects the same data as LoadOMNI.load_OMNI_data: from the first time >= start up to (but excluding) the last
+    time <= stop.
+    Returns: index of the first and (exclusive) last element of each window.
+    """
+    first = np.searchsorted(times, starts, side='left')
+    last = np.maximum(np.searchsorted(times, stops, side='right') - 1, first)
+    return first, last
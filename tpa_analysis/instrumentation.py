@@ -0,0 +1,306 @@
+# Standard library
+import functools
+import importlib
+import inspect
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+# Self-written modules
+from .data_extraction.omni_cache import OMNI_cache
+
+
+def decoded_month_bytes(month) -> dict:
+    """Counters of LoadOMNI.cache_month, which is called once for every decoded OMNI month."""
+    time_index, _, data = month
+    return {'OMNI months decoded': 1,
+            'OMNI bytes decoded': time_index.times.nbytes + sum(values.nbytes for values in data.values())}
+
+
+def store_chunk_bytes(chunk: dict) -> dict:
+    """Counters of OMNIStore.iter_files, which yields the data of one month at a time."""
+    return {'OMNI bytes read from store': sum(values.nbytes for values in chunk.values())}
+
+
+@dataclass
+class Probe:
+    """A function or method that is timed while instrumentation is enabled.
+    module (str): module where the function is defined, e.g. 'tpa_analysis.data_structures.tpa'.
+    name (str): name of the function in the module, or 'Class.method' for methods.
+    counter (Callable): optional function of the return value (or of each yielded value for generators) that returns
+                        a dict with the amounts to add to counters, e.g. decoded_month_bytes.
+    context (bool): True if the function returns a context manager (e.g. hist2d_plot). It is then timed until the end
+                    of the with block.
+    """
+    module: str
+    name: str
+    counter: Optional[Callable[[object], Dict[str, float]]] = None
+    context: bool = False
+
+    @property
+    def label(self) -> str:
+        # e.g. 'tpa.TPA.get_parameters', but 'scipy.io.loadmat' for other packages
+        module = self.module.rsplit('.', 1)[-1] if self.module.startswith('tpa_analysis.') else self.module
+        return f'{module}.{self.name}'
+
+
+_CLEANERS = ['kullen_dataclean', 'cumnock2009_dataclean', 'cumnock2005_dataclean', 'fear_dataclean',
+             'reidy_dataclean', 'thor_dfs', 'thor_dataclean', 'new_thor_dataclean', 'new_thor_clean_df']
+DEFAULT_PROBES = [
+    Probe('tpa_analysis.data_extraction.test_OMNI', 'LoadOMNI.load_OMNI_data'),
+    Probe('tpa_analysis.data_extraction.test_OMNI', 'LoadOMNI.cache_month', decoded_month_bytes),
+    Probe('tpa_analysis.data_extraction.test_OMNI', 'decode_OMNI_month'),
+    Probe('scipy.io', 'loadmat'),
+    Probe('tpa_analysis.data_extraction.omni_store', 'OMNIStore.iter_files', store_chunk_bytes),
+    Probe('tpa_analysis.data_extraction.dipole_table', 'lookup_dipole_tilt'),
+    Probe('tpa_analysis.data_extraction.dipole_table', 'build_dipole_table'),
+    Probe('tpa_analysis.data_structures.tpa', 'TPA.get_parameters'),
+    Probe('tpa_analysis.data_structures.tpa', 'TPA.get_dipole_data'),
+    Probe('tpa_analysis.data_structures.tpa_dataset', 'TPADataset.get_dataset_parameters'),
+    Probe('tpa_analysis.data_structures.tpa_dataset', 'TPADataset.extend'),
+    Probe('tpa_analysis.data_structures.tpa_dataset', 'batch_parameters'),
+    Probe('tpa_analysis.data_extraction.tpa_extract', 'DataExtract.get_tpa_batch'),
+    *[Probe('tpa_analysis.data_extraction.tpa_extract', f'DataExtract.{cleaner}') for cleaner in _CLEANERS],
+    Probe('tpa_analysis.data_extraction.excel_cache', 'read_excel_cached', lambda _: {'spreadsheets read': 1}),
+    Probe('pandas', 'read_excel', lambda _: {'spreadsheets parsed': 1}),
+    Probe('tpa_analysis.plotting.hist', 'hist1d'),
+    Probe('tpa_analysis.plotting.hist', 'hist2d_scatter'),
+    Probe('tpa_analysis.plotting.hist', 'hist2d_plot', context=True),
+    Probe('tpa_analysis.plotting.scatter', 'scatter_template', context=True),
+    Probe('tpa_analysis.plotting.scatter', 'scatter'),
+    Probe('tpa_analysis.plotting.render', 'render_figures'),
+    Probe('tpa_analysis.plotting.render', 'render_figure'),
+    Probe('matplotlib.figure', 'Figure.savefig'),
+]
+
+
+@dataclass
+class TimerStats:
+    calls: int = 0
+    total: float = 0.
+    max: float = 0.
+
+    def add(self, seconds: float):
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+@dataclass
+class Report:
+    """Report of an instrumented run: the time spent in each timer and the counters.
+    The time of a timer includes the time of the timers that are called inside it (e.g. LoadOMNI.load_OMNI_data
+    includes scipy.io.loadmat)."""
+    wall_time: float
+    timers: Dict[str, TimerStats] = field(default_factory=dict)
+    counters: Dict[str, float] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return {'wall_time': self.wall_time,
+                'timers': dict((label, vars(stats).copy()) for label, stats in self.timers.items()),
+                'counters': self.counters.copy()}
+
+    def __str__(self):
+        lines = [f'{"timer":<45} {"calls":>8} {"total (s)":>10} {"mean (ms)":>10} {"max (ms)":>10} {"of run":>7}']
+        for label, stats in sorted(self.timers.items(), key=lambda item: -item[1].total):
+            lines.append(f'{label:<45} {stats.calls:>8} {stats.total:>10.3f} {stats.total / stats.calls * 1e3:>10.3f} '
+                         f'{stats.max * 1e3:>10.3f} {stats.total / self.wall_time:>7.1%}')
+        for name, value in sorted(self.counters.items()):
+            value = f'{value / 2**20:.1f} MiB' if 'bytes' in name else f'{value:g}'
+            lines.append(f'{name:<45} {value:>8}')
+        lines.append(f'{"wall time (s)":<45} {self.wall_time:>8.3f}')
+        return '\n'.join(lines)
+
+
+class Instrumentation:
+    """Opt-in timers and counters for the slow parts of the analysis (loading OMNI data, the dipole tilt, the TPA
+    extraction, Excel parsing and plotting).
+    The probed functions are only replaced by timed wrappers while the instrumentation is enabled, and the original
+    functions are put back when it is disabled, so there is no overhead at all when it is not used:
+    >>> with Instrumentation() as run:
+    ...     datasets = run_pipeline(jobs, tpa_dir, OMNI_dir, parameters)
+    >>> print(run.report())
+    Only calls in this process are timed (e.g. not in the worker processes of run_pipeline with n_workers).
+    Bound methods that were created before enable() (e.g. DataExtract.name_to_function of an existing DataExtract)
+    still call the original methods.
+    Inputs:
+    probes (List[Probe]): the timed functions. Default: DEFAULT_PROBES.
+    """
+    # Only one instrumentation can replace the probed functions at a time
+    _active = None
+
+    def __init__(self, probes: List[Probe] = None):
+        self.probes = DEFAULT_PROBES if probes is None else probes
+        self.timers = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._patches = []
+        self._start_time = None
+        self._wall_time = 0.
+        self._cache_start = None
+
+    @property
+    def enabled(self) -> bool:
+        return Instrumentation._active is self
+
+    def enable(self):
+        if Instrumentation._active is not None:
+            raise RuntimeError('Another Instrumentation is already enabled.')
+        Instrumentation._active = self
+        for probe in self.probes:
+            self._patch(probe)
+        self._start_time = time.perf_counter()
+        self._cache_start = OMNI_cache.info()
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self._stop_clock()
+        for owner, name, original in reversed(self._patches):
+            setattr(owner, name, original)
+        self._patches = []
+        Instrumentation._active = None
+
+    def __enter__(self) -> 'Instrumentation':
+        self.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+
+    def reset(self):
+        """Removes all timings and counters."""
+        with self._lock:
+            self.timers = {}
+            self.counters = {}
+            self._wall_time = 0.
+            if self.enabled:
+                self._start_time = time.perf_counter()
+                self._cache_start = OMNI_cache.info()
+
+    def _stop_clock(self):
+        self._wall_time += time.perf_counter() - self._start_time
+        cache_info = OMNI_cache.info()
+        self.count('OMNI cache hits', cache_info.hits - self._cache_start.hits)
+        self.count('OMNI cache misses', cache_info.misses - self._cache_start.misses)
+
+    def report(self) -> Report:
+        """Report of the timers and counters so far (also while the instrumentation is enabled)."""
+        if self.enabled:
+            # Include the time and cache use up to now
+            self._stop_clock()
+            self._start_time = time.perf_counter()
+            self._cache_start = OMNI_cache.info()
+        with self._lock:
+            return Report(self._wall_time, dict((label, TimerStats(**vars(stats)))
+                                                for label, stats in self.timers.items()), self.counters.copy())
+
+    def count(self, name: str, value: float = 1):
+        """Adds value to the counter name."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def _record(self, label: str, seconds: float, calls: int = 1):
+        with self._lock:
+            stats = self.timers.setdefault(label, TimerStats())
+            stats.calls += calls
+            stats.add(seconds)
+
+    @contextmanager
+    def timer(self, label: str):
+        """Times a block of code, e.g. `with run.timer('make figures'):`. Nothing is recorded if the instrumentation is
+        not enabled."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self._record(label, time.perf_counter() - start)
+
+    def timed(self, function: Callable, label: str = None, counter: Callable = None, context: bool = False) -> Callable:
+        """Returns a wrapper of function that records its time under label (default: the name of function), e.g. as a
+        decorator. Generator functions are timed while they produce values. See Probe for counter and context."""
+        label = function.__qualname__ if label is None else label
+
+        def add_counts(value):
+            if counter is not None:
+                for name, amount in counter(value).items():
+                    self.count(name, amount)
+
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def timed_generator(*args, **kwargs):
+                generator = function(*args, **kwargs)
+                seconds = 0.
+                try:
+                    while True:
+                        start = time.perf_counter()
+                        try:
+                            value = next(generator)
+                        except StopIteration as stop:
+                            return stop.value
+                        finally:
+                            seconds += time.perf_counter() - start
+                        add_counts(value)
+                        yield value
+                finally:
+                    self._record(label, seconds)
+            return timed_generator
+
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                value = function(*args, **kwargs)
+            except BaseException:
+                self._record(label, time.perf_counter() - start)
+                raise
+            if context:
+                return TimedContext(value, lambda seconds: self._record(label, seconds), start)
+            self._record(label, time.perf_counter() - start)
+            add_counts(value)
+            return value
+        return timed_function
+
+    def _patch(self, probe: Probe):
+        module = importlib.import_module(probe.module)
+        owner_name, _, attribute = probe.name.rpartition('.')
+        owner = getattr(module, owner_name) if owner_name else module
+        original = inspect.getattr_static(owner, attribute)
+        function = original.__func__ if isinstance(original, (staticmethod, classmethod)) else original
+        wrapper = self.timed(function, probe.label, probe.counter, probe.context)
+        if isinstance(original, (staticmethod, classmethod)):
+            wrapper = type(original)(wrapper)
+        self._patches.append((owner, attribute, original))
+        setattr(owner, attribute, wrapper)
+        if owner_name:
+            return
+        # Module functions are also replaced where they have been imported into other modules of the package or into
+        # __main__ (e.g. `from tpa_analysis.plotting import hist1d` in a script)
+        for other_name, other_module in list(sys.modules.items()):
+            if other_module is module or not (other_name == '__main__' or other_name.startswith('tpa_analysis')):
+                continue
+            for name, value in list(vars(other_module).items()):
+                if value is function:
+                    self._patches.append((other_module, name, value))
+                    setattr(other_module, name, wrapper)
+
+
+class TimedContext:
+    """Context manager that wraps another context manager and reports the time from start until its with block
+    ends."""
+
+    def __init__(self, context, record: Callable[[float], None], start: float):
+        self._context = context
+        self._record = record
+        self._start = start
+
+    def __enter__(self):
+        return self._context.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            return self._context.__exit__(exc_type, exc_value, traceback)
+        finally:
+            self._record(time.perf_counter() - self._start)
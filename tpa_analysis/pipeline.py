@@ -0,0 +1,132 @@
+# Standard library
+import datetime as dt
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Union
+# Packages
+import numpy as np
+# Self-written modules
+from .data_extraction.omni_store import OMNIStore, convert_OMNI_archive
+from .data_extraction.tpa_extract import DataExtract
+from .data_structures.tpa_dataset import TPADataset
+
+
+@dataclass
+class DatasetJob:
+    """Settings for processing one TPA catalog with run_pipeline.
+    name (str): name of the dataset, one of DataExtract.name_to_function.
+    average_calctime, time_shift (float): see TPADataset.
+    start_time, end_time (datetime): period of the background (TPADataset.total). Default: from the start of the month
+                                     of the first TPA to the end of the month of the last TPA.
+    kwargs (dict): passed on to DataExtract.get_tpas, e.g. {'only_first_tpa': True}.
+    """
+    name: str
+    average_calctime: float
+    time_shift: float
+    start_time: Optional[dt.datetime] = None
+    end_time: Optional[dt.datetime] = None
+    kwargs: dict = field(default_factory=dict)
+
+
+def catalog_jobs(tpa_dir: str, average_calctime: float, time_shift: float, **kwargs) -> List[DatasetJob]:
+    """One job for every catalog in DataExtract.name_to_function. Names that use the same extraction function
+    (e.g. 'New dataset' and 'This study') are only included once. Keyword arguments are passed on to DatasetJob."""
+    jobs = []
+    functions = []
+    for name, function in DataExtract(tpa_dir).name_to_function.items():
+        if function not in functions:
+            functions.append(function)
+            jobs.append(DatasetJob(name, average_calctime, time_shift, **kwargs))
+    return jobs
+
+
+def process_dataset(job: DatasetJob, tpa_dir: str, OMNI_dir: str, parameters: List[str],
+                    cache_dir: str = None) -> TPADataset:
+    """Extracts the TPAs of one catalog, calculates their parameters and the background and returns the dataset.
+    The parameters of all TPAs are calculated at once with TPABatch.get_parameters. With cache_dir, the dataset is
+    loaded from the DatasetCache if it has been calculated with the same settings before, and cached otherwise."""
+    data_extractor = DataExtract(tpa_dir)
+    tpas = data_extractor.get_tpa_batch(job.name, **job.kwargs)
+    start_time, end_time = job.start_time, job.end_time
+    if start_time is None or end_time is None:
+        months = tpas['date'].astype('datetime64[M]')
+        start_time = months.min().astype('datetime64[us]').tolist() if start_time is None else start_time
+        # The last minute of the month, as LoadOMNI also loads the month that end_time is in
+        end_time = ((months.max() + 1).astype('datetime64[us]') - np.timedelta64(1, 'm')).tolist() \
+            if end_time is None else end_time
+    dataset = TPADataset(job.name, job.average_calctime, job.time_shift, start_time, end_time)
+
+    if cache_dir is not None and not data_extractor.from_cache([dataset], parameters, cache_dir=cache_dir,
+                                                               **job.kwargs):
+        return dataset
+    dataset.get_dataset_parameters(OMNI_dir, parameters)
+    tpas.get_parameters(OMNI_dir, parameters, job.time_shift, job.average_calctime)
+    dataset.extend(tpas)
+    if cache_dir is not None:
+        data_extractor.to_cache([dataset], parameters, cache_dir=cache_dir, **job.kwargs)
+    return dataset
+
+
+def print_progress(done: int, total: int, name: str, seconds: float):
+    print(f'finished {name} in {seconds:.1f} s ({done} dataset(s) out of {total})')
+
+
+def _timed_process_dataset(job: DatasetJob, tpa_dir: str, OMNI_dir: str, parameters: List[str], cache_dir: str):
+    start = time.perf_counter()
+    dataset = process_dataset(job, tpa_dir, OMNI_dir, parameters, cache_dir)
+    return dataset, time.perf_counter() - start
+
+
+def run_pipeline(jobs: List[DatasetJob], tpa_dir: str, OMNI_dir: str, parameters: Union[List[str], str],
+                 n_workers: int = None, store_dir: str = None, cache_dir: str = None,
+                 progress: Optional[Callable[[int, int, str, float], None]] = print_progress) -> List[TPADataset]:
+    """Processes many TPA catalogs (see process_dataset), each in its own process.
+    Inputs:
+    jobs (List[DatasetJob]): the catalogs and their settings, e.g. catalog_jobs(tpa_dir, 20, 100).
+    tpa_dir (str): directory of the TPA catalogs, see DataExtract.
+    OMNI_dir (str): directory where OMNI data is stored.
+    parameters (List[str], str): parameters that will be calculated, e.g. ['BxGSM', 'vel', 'dipole'].
+    n_workers (int): number of processes. Default: all jobs are run one after another in this process.
+    store_dir (str): if given, the OMNI .mat files in OMNI_dir are first converted into a columnar store in store_dir
+                     (see omni_store.convert_OMNI_archive), which all processes memory-map. The processes then share
+                     the same read-only pages instead of each decoding the same months.
+    cache_dir (str): directory of a DatasetCache. Datasets that have been calculated with the same settings before are
+                     loaded from it instead of being calculated again.
+    progress (Callable): called with (number of finished jobs, number of jobs, dataset name, seconds) when a job has
+                         finished. None to not report progress.
+    Returns: the datasets in the same order as jobs, independent of the order in which the jobs finished.
+    """
+    if isinstance(parameters, str):
+        parameters = [parameters]
+    if store_dir is not None and not OMNIStore.is_store(OMNI_dir):
+        # Only months that are not yet in the store are converted
+        convert_OMNI_archive(OMNI_dir, store_dir)
+        OMNI_dir = store_dir
+
+    datasets = [None] * len(jobs)
+    if n_workers is None:
+        for i, job in enumerate(jobs):
+            datasets[i], seconds = _timed_process_dataset(job, tpa_dir, OMNI_dir, parameters, cache_dir)
+            if progress is not None:
+                progress(i + 1, len(jobs), job.name, seconds)
+        return datasets
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = dict((executor.submit(_timed_process_dataset, job, tpa_dir, OMNI_dir, parameters, cache_dir), i)
+                       for i, job in enumerate(jobs))
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            datasets[i], seconds = future.result()
+            if progress is not None:
+                progress(done, len(jobs), jobs[i].name, seconds)
+    return datasets
+
+
+if __name__ == '__main__':
+    tpa_dir = 'data/'
+    OMNI_dir = 'C:/Users/simon/MATLABProjects/KTH research/Data/OMNI/OMNI_1min_Lv1/'
+    jobs = catalog_jobs(tpa_dir, 20, 100)
+    datasets = run_pipeline(jobs, tpa_dir, OMNI_dir, ['BxGSE', 'ByGSM', 'vel', 'dipole'], n_workers=len(jobs))
+    for dataset in datasets:
+        print(dataset.name, np.size(dataset.tpa_properties.get('date', [])))
@@ -1,5 +1,6 @@
 from .hist import *
 from .scatter import *
+from .render import *
 from scipy.constants import mu_0
 
 
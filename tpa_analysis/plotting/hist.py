@@ -1,8 +1,8 @@
 import matplotlib.pyplot as plt
-from matplotlib import cm
 import matplotlib
 import numpy as np
 from contextlib import contextmanager
+from ..statistics.streaming import StreamingHistogram, StreamingHistogram2D
 
 
 def hist1d(foreground, background, axis: matplotlib.axes.Axes, dataset_name: str, normalize=True,
@@ -11,20 +11,29 @@ def hist1d(foreground, background, axis: matplotlib.axes.Axes, dataset_name: str
     Parameters
     ----------
     foreground (array_like): data for the TPAs.
-    background (array_like): all the data for the IMF during the period of the dataset.
+    background (array_like, StreamingHistogram): all the data for the IMF during the period of the dataset, or its
+                                                 histogram (e.g. from statistics.BackgroundHistograms), which is then
+                                                 not calculated again. The bins of the histogram are used instead of
+                                                 nbins.
 
     Returns
     -------
     fg_hist_values, bg_hist_values, bins
     """
-    foreground = foreground[~np.isnan(foreground)]
-    background = background[~np.isnan(background)]
+    if not isinstance(background, StreamingHistogram):
+        background = np.asarray(background, dtype=float)
+        if np.ndim(nbins) == 0:
+            nbins = np.histogram_bin_edges(background[~np.isnan(background)], nbins)
+        background = StreamingHistogram(nbins).update(background)
+    bins = background.bins
+    foreground = StreamingHistogram(bins).update(foreground)
+    # Fraction of all (non-NaN) values, also the ones outside of the bins
+    bg_hist_values = background.counts / background.total
+    fg_hist_values = foreground.counts / foreground.total
 
     axis.axvline(0, color="grey", lw=1, zorder=-1)
-    bg_hist_values, _, _ = axis.hist(background, bins=nbins, weights=np.ones_like(background) / len(background),
-                                     label=bg_label, histtype='step', zorder=0)
-    fg_hist_values, bins, _ = axis.hist(foreground, bins=nbins, weights=np.ones_like(foreground) / len(foreground),
-                                        label=dataset_name, histtype='step', zorder=1)
+    axis.stairs(bg_hist_values, bins, label=bg_label, zorder=0)
+    axis.stairs(fg_hist_values, bins, label=dataset_name, zorder=1)
     if normalize:
         normalized_axis = axis.twinx()  # instantiate a second axes that shares the same x-axis
         normalized_axis.axhline(1, ls="--", color='lightgrey', lw=1)
@@ -53,20 +62,28 @@ def hist2d_scatter(x, y, bg_x, bg_y, axis: matplotlib.axes.Axes, dataset_name: s
                        This data will correspond to the dots in the plot.
     bg_x, bg_y (array_like): Values of the IMF over the period of the dataset.
                              These will form the background (colored tiles) of the plot
+                             bg_x can also be the 2D histogram of the background (e.g. from
+                             statistics.BackgroundHistograms) and bg_y None. The histogram is then drawn with pcolormesh
+                             without binning the background again, bins is ignored and hist2dkw is passed to pcolormesh.
     """
-    colormap = cm.get_cmap(colormap_name)
+    colormap = plt.get_cmap(colormap_name)
     axis.axhline(0, color='grey', zorder=1)
     axis.axvline(0, color='grey', zorder=1)
     omit_index = np.isnan(x) | np.isnan(y)
     x = x[~omit_index]
     y = y[~omit_index]
-    bg_omit_index = np.isnan(bg_x) | np.isnan(bg_y)
-    bg_x = bg_x[~bg_omit_index]
-    bg_y = bg_y[~bg_omit_index]
-    counts, xedges, yedges, im = axis.hist2d(bg_x, bg_y, bins=bins, cmap=colormap, density=normalize, zorder=0, **hist2dkw)
+    if isinstance(bg_x, StreamingHistogram2D):
+        counts, xedges, yedges = bg_x.density() if normalize else bg_x.counts, bg_x.xbins, bg_x.ybins
+        im = axis.pcolormesh(xedges, yedges, counts.T, cmap=colormap, zorder=0, **hist2dkw)
+    else:
+        bg_omit_index = np.isnan(bg_x) | np.isnan(bg_y)
+        bg_x = bg_x[~bg_omit_index]
+        bg_y = bg_y[~bg_omit_index]
+        counts, xedges, yedges, im = axis.hist2d(bg_x, bg_y, bins=bins, cmap=colormap, density=normalize, zorder=0,
+                                                 **hist2dkw)
 
     if color_bar:
-        cbar = plt.colorbar(im, ax=axis)
+        cbar = axis.figure.colorbar(im, ax=axis)
         cbar.set_label('IMF probability distribution', rotation=270, labelpad=10)
 
     scatter = axis.scatter(x, y, s=30, marker='P', edgecolors='w', linewidth=0.5, label=dataset_name,
@@ -78,7 +95,10 @@ def hist2d_scatter(x, y, bg_x, bg_y, axis: matplotlib.axes.Axes, dataset_name: s
 
 
 @contextmanager
-def hist2d_plot(save=False, cmap='jet', clear=True, *args, **kwargs):
+def hist2d_plot(save=False, cmap='jet', clear=True, *args, show=True, **kwargs):
+    """Figure with a 2D histogram template in every subplot. Other arguments are passed to plt.subplots.
+    show (bool): show the figure after the with block (if the backend is not inline). False for scripts that only save
+                 figures, e.g. on a headless backend."""
     fig, ax = plt.subplots(*args, **kwargs)
     if isinstance(ax, matplotlib.axes.Axes):
         ax = [ax]
@@ -86,7 +106,7 @@ def hist2d_plot(save=False, cmap='jet', clear=True, *args, **kwargs):
     for subplot in ax:
         subplot.axhline(0, color='grey', zorder=1)
         subplot.axvline(0, color='grey', zorder=1)
-        subplot.set_facecolor(cm.get_cmap(cmap)(0))
+        subplot.set_facecolor(plt.get_cmap(cmap)(0))
 
     yield fig, ax
 
@@ -95,7 +115,7 @@ def hist2d_plot(save=False, cmap='jet', clear=True, *args, **kwargs):
     if save:
         fig.savefig(save)
 
-    if 'inline' not in matplotlib.get_backend():
+    if show and 'inline' not in matplotlib.get_backend():
         fig.show()
 
     if clear:
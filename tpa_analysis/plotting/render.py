@@ -0,0 +1,180 @@
+# Standard library
+import glob
+import hashlib
+import inspect
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+# Packages
+import matplotlib
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+# Increase when figures have to be rendered again (e.g. after a change of the renderer)
+RENDER_CACHE_VERSION = 1
+MANIFEST_NAME = '.render_cache.json'
+# Arguments of plt.subplots that are arguments of Figure.subplots instead of Figure
+_SUBPLOTS_ARGUMENTS = ['nrows', 'ncols', 'sharex', 'sharey', 'squeeze', 'width_ratios', 'height_ratios', 'subplot_kw',
+                       'gridspec_kw']
+
+
+@dataclass
+class FigureSpec:
+    """A figure that is rendered by render_figures.
+    filename (str): file the figure is saved to, relative to the output directory, e.g. 'hist1d/BzGSM.png'.
+    function (Callable): draws the figure, called as function(fig, ax, **data, **kwargs) where fig and ax are like the
+                         return values of plt.subplots(**subplots). It must be a module-level function (not a lambda)
+                         to be rendered in other processes, e.g. a function that calls hist1d.
+    data (dict): the data of the figure, e.g. {'foreground': dataset.tpa_values['BzGSM'], 'background': histogram}.
+    kwargs (dict): other settings of the figure.
+    subplots (dict): arguments of plt.subplots, e.g. {'ncols': 3, 'figsize': (15, 5)}.
+    savefig (dict): arguments of Figure.savefig, e.g. {'dpi': 200}.
+    """
+    filename: str
+    function: Callable
+    data: dict = field(default_factory=dict)
+    kwargs: dict = field(default_factory=dict)
+    subplots: dict = field(default_factory=dict)
+    savefig: dict = field(default_factory=dict)
+
+    def spec_hash(self, code_version: str = None) -> str:
+        """Hash of everything that decides what the figure looks like: the data, the settings, the code of function
+        and the code of the plotting functions it calls (see plotting_code_version, which can be passed as
+        code_version when many figures are hashed)."""
+        digest = hashlib.sha256()
+        try:
+            source = inspect.getsource(self.function)
+        except (OSError, TypeError):
+            source = ''
+        code_version = plotting_code_version() if code_version is None else code_version
+        _update_hash(digest, [RENDER_CACHE_VERSION, matplotlib.__version__, code_version, self.filename,
+                              getattr(self.function, '__module__', ''), getattr(self.function, '__qualname__', ''),
+                              source, self.data, self.kwargs, self.subplots, self.savefig])
+        return digest.hexdigest()
+
+
+def plotting_code_version() -> str:
+    """Hash of the code of the plotting and statistics subpackages (e.g. hist1d and hist2d_scatter), so that figures
+    are rendered again when a function that draws them changes, not only when the drawing function of the spec does."""
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code_hash = hashlib.sha1()
+    for subpackage in ['plotting', 'statistics']:
+        for path in sorted(glob.glob(os.path.join(package_dir, subpackage, '*.py'))):
+            with open(path, 'rb') as code_file:
+                code_hash.update(code_file.read())
+    return code_hash.hexdigest()[:12]
+
+
+def _update_hash(digest, value):
+    """Adds value to digest. Arrays are hashed by their bytes, and containers and objects (e.g. StreamingHistogram)
+    by their contents."""
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            _update_hash(digest, ['ndarray', value.shape, value.tolist()])
+            return
+        digest.update(f'ndarray {value.dtype.str} {value.shape}'.encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        digest.update(f'dict {len(value)}'.encode())
+        for key in sorted(value, key=repr):
+            _update_hash(digest, key)
+            _update_hash(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'{type(value).__name__} {len(value)}'.encode())
+        for item in value:
+            _update_hash(digest, item)
+    elif hasattr(value, 'to_numpy') and hasattr(value, 'index'):
+        # pandas Series and DataFrame
+        _update_hash(digest, ['pandas', type(value).__name__, value.index.to_numpy(),
+                              list(getattr(value, 'columns', [])), value.to_numpy()])
+    elif hasattr(value, '__dict__') and not callable(value):
+        digest.update(f'object {type(value).__module__}.{type(value).__qualname__}'.encode())
+        _update_hash(digest, vars(value))
+    else:
+        digest.update(f'{type(value).__name__} {value!r}'.encode())
+
+
+def render_figure(spec: FigureSpec, path: str) -> str:
+    """Draws spec with the Agg backend and saves it to path. pyplot is not used, so this neither shows the figure nor
+    changes the figures or backend of pyplot.
+    Returns: path.
+    """
+    subplots_kwargs = dict((key, value) for key, value in spec.subplots.items() if key in _SUBPLOTS_ARGUMENTS)
+    figure_kwargs = dict((key, value) for key, value in spec.subplots.items() if key not in _SUBPLOTS_ARGUMENTS)
+    fig = Figure(**figure_kwargs)
+    FigureCanvasAgg(fig)
+    ax = fig.subplots(**subplots_kwargs)
+    spec.function(fig, ax, **spec.data, **spec.kwargs)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fig.savefig(path, **spec.savefig)
+    return path
+
+
+def load_manifest(output_dir: str) -> Dict[str, str]:
+    """The hash of every figure in output_dir that was rendered by render_figures."""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+    return manifest.get('figures', {}) if manifest.get('version') == RENDER_CACHE_VERSION else {}
+
+
+def save_manifest(output_dir: str, figures: Dict[str, str]):
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as manifest_file:
+        json.dump({'version': RENDER_CACHE_VERSION, 'figures': figures}, manifest_file, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def render_figures(specs: List[FigureSpec], output_dir: str, n_workers: int = None, force: bool = False,
+                   progress: Optional[Callable[[int, int, str], None]] = None) -> Dict[str, str]:
+    """Renders many figures without showing them, and skips the figures that have not changed since the last run.
+    A figure is rendered again when its file is missing or the hash of its spec (data, settings and drawing function,
+    see FigureSpec.spec_hash) differs from when it was last rendered into output_dir.
+    Inputs:
+    specs (List[FigureSpec]): the figures.
+    output_dir (str): directory the figures are saved to. The hashes of the rendered figures are saved in it as well.
+    n_workers (int): number of processes. Default: all figures are rendered one after another in this process.
+    force (bool): render all figures, also the ones that have not changed.
+    progress (Callable): called with (number of rendered figures, number of figures to render, filename) when a
+                         figure has been rendered.
+    Returns: dict with 'rendered' or 'unchanged' for the filename of every spec.
+    """
+    filenames = [spec.filename for spec in specs]
+    if len(set(filenames)) != len(filenames):
+        raise ValueError('Every figure must have its own filename.')
+    manifest = load_manifest(output_dir)
+    code_version = plotting_code_version()
+    hashes = dict((spec.filename, spec.spec_hash(code_version)) for spec in specs)
+    todo = [spec for spec in specs if force or manifest.get(spec.filename) != hashes[spec.filename]
+            or not os.path.isfile(os.path.join(output_dir, spec.filename))]
+    status = dict((filename, 'unchanged') for filename in filenames)
+
+    def finished(spec, done):
+        manifest[spec.filename] = hashes[spec.filename]
+        status[spec.filename] = 'rendered'
+        if progress is not None:
+            progress(done, len(todo), spec.filename)
+
+    try:
+        if n_workers is None:
+            for done, spec in enumerate(todo, start=1):
+                render_figure(spec, os.path.join(output_dir, spec.filename))
+                finished(spec, done)
+        elif todo:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                futures = dict((executor.submit(render_figure, spec, os.path.join(output_dir, spec.filename)), spec)
+                               for spec in todo)
+                for done, future in enumerate(as_completed(futures), start=1):
+                    future.result()
+                    finished(futures[future], done)
+    finally:
+        # Figures that were rendered before an error are not rendered again in the next run
+        save_manifest(output_dir, manifest)
+    return status
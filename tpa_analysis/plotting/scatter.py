@@ -5,7 +5,10 @@ import numpy as np
 
 
 @contextmanager
-def scatter_template(save: str = False, *args, **kwargs):
+def scatter_template(save: str = False, *args, show: bool = True, **kwargs):
+    """Figure with a scatter plot template in every subplot. Other arguments are passed to plt.subplots.
+    show (bool): show the figure after the with block (if the backend is not inline). False for scripts that only save
+                 figures, e.g. on a headless backend."""
     fig, ax = plt.subplots(*args, **kwargs)
     if not isinstance(ax, np.ndarray):
         ax = np.array([ax])
@@ -21,7 +24,7 @@ def scatter_template(save: str = False, *args, **kwargs):
     fig.tight_layout()
     if save:
         fig.savefig(save)
-    if 'inline' not in matplotlib.get_backend():
+    if show and 'inline' not in matplotlib.get_backend():
         fig.show()
     # TODO: Add functionality for deleting figure after use? E.g.: fig.clf()
 
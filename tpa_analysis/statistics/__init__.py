@@ -1 +1,7 @@
 from .analysis import *
+from .streaming import *
+from .windows import *
+from .histograms import *
+from .resampling import *
+from .tables import *
+from .ecdf import *
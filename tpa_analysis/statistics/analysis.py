@@ -1,6 +1,6 @@
 import numpy as np
 from scipy import stats
-from typing import Tuple
+from typing import List, Tuple
 
 
 def compare_dists(sample: np.ndarray, comparison: np.ndarray, bins: np.ndarray, *args, **kwargs) -> Tuple[float, np.ndarray, np.ndarray, np.ndarray]:
@@ -49,33 +49,143 @@ def compare_dists(sample: np.ndarray, comparison: np.ndarray, bins: np.ndarray,
         return p_value, sample, comparison, bins
 
     # Use algorithm to merge bins to contain at least 5 elements
-    merged_comparison, merged_sample, merged_bins = np.copy(comparison), np.copy(sample), np.array(bins, copy=True, dtype=float)
-
-    for i in range(merged_comparison.size-1):
-        if merged_comparison[i] < 5:
-            merged_comparison[i+1] += merged_comparison[i]
-            merged_comparison[i] = -1
-            merged_sample[i+1] += merged_sample[i]
-            merged_sample[i] = -1
-            merged_bins[i+1] = np.nan
-
-    merged_comparison = merged_comparison[merged_comparison != -1]
-    merged_sample = merged_sample[merged_sample != -1]
-    merged_bins = merged_bins[~np.isnan(merged_bins)]
-
-    for i in reversed(range(1, merged_comparison.size)):
-        if merged_comparison[i] < 5:
-            merged_comparison[i-1] += merged_comparison[i]
-            merged_comparison[i] = -1
-            merged_sample[i-1] += merged_sample[i]
-            merged_sample[i] = -1
-            merged_bins[i] = np.nan
-
-    merged_comparison = merged_comparison[merged_comparison != -1]
-    merged_sample = merged_sample[merged_sample != -1]
-    merged_bins = merged_bins[~np.isnan(merged_bins)]
-
-    assert (merged_comparison >= 5).all(), merged_comparison
+    starts = merge_groups(comparison)
+    merged_comparison = np.add.reduceat(comparison, starts)
+    merged_sample = np.add.reduceat(sample, starts)
+    merged_bins = np.asarray(bins, dtype=float)[np.append(starts, comparison.size)]
+
+    # The sums of the merged bins may be rounded slightly differently than while merging
+    assert (merged_comparison >= 5 - 1e-9 * total).all(), merged_comparison
 
     _, p_value = stats.chisquare(merged_sample, merged_comparison, *args, **kwargs)
     return p_value, merged_sample, merged_comparison, merged_bins
+
+
+def compare_dists_batch(samples: List[np.ndarray], comparisons: List[np.ndarray], bins: List[np.ndarray],
+                        ddof: int = 0) -> List[Tuple[float, np.ndarray, np.ndarray, np.ndarray]]:
+    """`compare_dists` for many histograms in one vectorized pass.
+
+    The histograms are concatenated, merged with `merge_segments` and the chi-square statistic of every histogram is
+    summed with a single bincount, so the time hardly depends on the number of histograms.
+
+    Parameters
+    ----------
+    samples, comparisons, bins : List[numpy.ndarray]
+        The measured counts, expected counts and bin edges of every histogram, see `compare_dists`.
+    ddof : int, optional
+        Adjustment to the degrees of freedom, see scipy.stats.chisquare.
+
+    Returns
+    ----------
+    results : List[tuple]
+        `(p_value, merged_sample, merged_comparison, merged_bins)` of every histogram, like `compare_dists`. Instead of
+        raising a ValueError, histograms where the sum of comparison is fewer than 5 get a p value of NaN, as do histograms
+        without degrees of freedom left after merging (e.g. all bins merged into one).
+    """
+    if not (len(samples) == len(comparisons) == len(bins)):
+        raise ValueError(f'Got {len(samples)} samples, {len(comparisons)} comparisons and {len(bins)} bins.')
+    for sample, comparison, edges in zip(samples, comparisons, bins):
+        if (np.size(comparison) != np.size(sample)) or (np.size(edges) != np.size(comparison) + 1):
+            raise ValueError('comparison and sample must be equal size with bins being sample.size + 1. '
+                             f'Instead, sizes {np.size(sample)=}, {np.size(comparison)=}, {np.size(edges)=} were given.')
+    if not samples:
+        return []
+
+    offsets = np.cumsum([0, *(np.size(comparison) for comparison in comparisons)])
+    all_comparisons = np.concatenate([np.asarray(comparison, dtype=float) for comparison in comparisons])
+    all_samples = np.concatenate([np.asarray(sample, dtype=float) for sample in samples])
+    starts = merge_segments(all_comparisons, offsets)
+    merged_comparisons = np.add.reduceat(all_comparisons, starts)
+    merged_samples = np.add.reduceat(all_samples, starts)
+
+    # Histogram of every merged bin (empty histograms have the same offset as the next one)
+    histogram = np.searchsorted(offsets, starts, side='right') - 1
+    statistics = np.bincount(histogram, (merged_samples - merged_comparisons)**2 / merged_comparisons,
+                             minlength=len(samples))
+    n_merged = np.bincount(histogram, minlength=len(samples))
+    with np.errstate(invalid='ignore'):
+        p_values = stats.chi2.sf(statistics, n_merged - 1 - ddof)
+    totals = np.bincount(np.repeat(np.arange(len(samples)), np.diff(offsets)), all_comparisons, minlength=len(samples))
+    p_values[totals < 5] = np.nan
+    # Without degrees of freedom (e.g. all bins merged into one), chi2.sf is 0 for any statistic that is not exactly 0
+    p_values[n_merged - 1 - ddof <= 0] = np.nan
+
+    results = []
+    merged_offsets = np.cumsum([0, *n_merged])
+    for i, edges in enumerate(bins):
+        merged = slice(merged_offsets[i], merged_offsets[i + 1])
+        sample, comparison = np.asarray(samples[i]), np.asarray(comparisons[i])
+        merged_bins = np.asarray(edges, dtype=float)[np.append(starts[merged] - offsets[i], comparison.size)]
+        results.append((p_values[i], merged_samples[merged].astype(sample.dtype),
+                        merged_comparisons[merged].astype(comparison.dtype), merged_bins))
+    return results
+
+
+def merge_groups(comparison: np.ndarray, min_count: float = 5) -> np.ndarray:
+    """Find the groups of neighboring bins that `compare_dists` merges so that every merged bin of `comparison` has at
+    least `min_count` counts.
+
+    Going from the first bin, a bin with fewer than `min_count` counts (including the bins merged into it) is merged
+    with the next bin. If the last merged bin then still has too few counts, it is merged with the previous one.
+    The groups only depend on `comparison`, so they can be calculated once and applied to many samples with
+    `np.add.reduceat(samples, starts, axis=-1)`.
+
+    Parameters
+    ----------
+    comparison : numpy.ndarray
+        The expected counts. Must have a sum of at least `min_count`.
+    min_count : float, optional
+        The smallest number of counts in a merged bin.
+
+    Returns
+    ----------
+    starts : numpy.ndarray
+        Index of the first bin of each group. The merged bin edges are `bins[np.append(starts, comparison.size)]`.
+    """
+    return merge_segments(comparison, np.array([0, np.size(comparison)]), min_count)
+
+
+def merge_segments(comparisons: np.ndarray, offsets: np.ndarray, min_count: float = 5) -> np.ndarray:
+    """`merge_groups` for many histograms at once, which are concatenated in `comparisons`.
+
+    A group ends at the first bin where the sum since the end of the previous group reaches `min_count`, which is found
+    for all histograms at the same time with a binary search in the cumulative sum of `comparisons`. The number of
+    steps is the largest number of groups of a histogram, independent of the number of histograms and bins.
+
+    Parameters
+    ----------
+    comparisons : numpy.ndarray
+        The expected counts of all histograms after each other. Counts must not be negative.
+    offsets : numpy.ndarray
+        Index of the first bin of each histogram in `comparisons`, followed by `comparisons.size`.
+    min_count : float, optional
+        The smallest number of counts in a merged bin.
+
+    Returns
+    ----------
+    starts : numpy.ndarray
+        Index in `comparisons` of the first bin of each group, sorted. The first bin of each (non-empty) histogram is
+        always a start, so `np.add.reduceat(comparisons, starts)` gives the merged bins of all histograms.
+    """
+    offsets = np.asarray(offsets, dtype=np.intp)
+    cumulative = np.zeros(np.size(comparisons) + 1)
+    np.cumsum(comparisons, out=cumulative[1:])
+    segment_ends = offsets[1:]
+    position = offsets[:-1].copy()
+    # Sums that reach min_count exactly (e.g. of scaled float counts) must not fall just short of it by rounding
+    threshold = min_count - 4 * np.finfo(float).eps * cumulative.size * max(cumulative[-1], min_count)
+    segments = np.flatnonzero(position < segment_ends)
+    starts = [position[segments]]
+    while segments.size:
+        # End (exclusive) of the group that starts at position, or the end of the histogram for its last group
+        ends = np.searchsorted(cumulative, cumulative[position[segments]] + threshold, side='left')
+        position[segments] = np.minimum(ends, segment_ends[segments])
+        segments = segments[position[segments] < segment_ends[segments]]
+        starts.append(position[segments])
+    starts = np.sort(np.concatenate(starts))
+
+    # The last group of a histogram with too few counts is merged with the previous group of the same histogram
+    next_starts = np.append(starts[1:], np.size(comparisons))
+    last = np.isin(next_starts, segment_ends)
+    too_few = last & (cumulative[next_starts] - cumulative[starts] < threshold) & ~np.isin(starts, offsets)
+    return starts[~too_few]
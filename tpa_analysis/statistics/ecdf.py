@@ -0,0 +1,217 @@
+import numpy as np
+from dataclasses import dataclass
+from scipy import special, stats
+
+
+@dataclass
+class TwoSampleResult:
+    """Result of a two-sample test (see `BackgroundECDF`).
+    statistic: the test statistic (D for Kolmogorov-Smirnov, the standardized statistic for Anderson-Darling like
+               scipy.stats.anderson_ksamp).
+    p_value: the p value.
+    """
+    statistic: float
+    p_value: float
+
+
+# Interpolation coefficients of the critical values of the Anderson-Darling test (Table 2 of Scholz & Stephens 1987),
+# the same as in scipy.stats.anderson_ksamp
+_AD_B0 = np.array([0.675, 1.281, 1.645, 1.96, 2.326, 2.573, 3.085])
+_AD_B1 = np.array([-0.245, 0.25, 0.678, 1.149, 1.822, 2.364, 3.615])
+_AD_B2 = np.array([-0.105, -0.305, -0.362, -0.391, -0.396, -0.345, -0.154])
+_AD_SIGNIFICANCE = np.array([0.25, 0.1, 0.05, 0.025, 0.01, 0.005, 0.001])
+
+
+def harmonic(k):
+    """The harmonic number 1 + 1/2 + ... + 1/k (0 for k = 0), for arrays of any size at the same cost."""
+    return special.digamma(np.asarray(k, dtype=float) + 1) + np.euler_gamma
+
+
+def anderson_pvalue(A2: float, N: int, n_samples: np.ndarray) -> TwoSampleResult:
+    """Standardize the k-sample Anderson-Darling statistic A2 and interpolate its p value like
+    scipy.stats.anderson_ksamp. The p value is limited to between 0.001 and 0.25.
+
+    Parameters
+    ----------
+    A2 : float
+        The Anderson-Darling statistic A2kN.
+    N : int
+        The total number of values.
+    n_samples : numpy.ndarray
+        The number of values of every sample.
+
+    Returns
+    ----------
+    result : TwoSampleResult
+    """
+    k = len(n_samples)
+    H = (1. / np.asarray(n_samples, dtype=float)).sum()
+    h = harmonic(N - 1)
+    # Closed form of the double sum in scipy.stats.anderson_ksamp, which would cost O(N) for every test
+    g = h**2 - harmonic(N)**2 + np.pi**2 / 6 - special.polygamma(1, N + 1)
+
+    a = (4*g - 6) * (k - 1) + (10 - 6*g)*H
+    b = (2*g - 4)*k**2 + 8*h*k + (2*g - 14*h - 4)*H - 8*h + 4*g - 6
+    c = (6*h + 2*g - 2)*k**2 + (4*h - 4*g + 6)*k + (2*h - 6)*H + 4*h
+    d = (2*h + 6)*k**2 - 4*h*k
+    sigmasq = (a*N**3 + b*N**2 + c*N + d) / ((N - 1.) * (N - 2.) * (N - 3.))
+    m = k - 1
+    statistic = (A2 - m) / np.sqrt(sigmasq)
+
+    critical = _AD_B0 + _AD_B1 / np.sqrt(m) + _AD_B2 / m
+    if statistic < critical.min():
+        p_value = _AD_SIGNIFICANCE.max()
+    elif statistic > critical.max():
+        p_value = _AD_SIGNIFICANCE.min()
+    else:
+        p_value = np.exp(np.polyval(np.polyfit(critical, np.log(_AD_SIGNIFICANCE), 2), statistic))
+    return TwoSampleResult(float(statistic), float(p_value))
+
+
+class BackgroundECDF:
+    """Empirical distribution of a background series (e.g. one parameter of TPADataset.total) for unbinned two-sample
+    tests of small samples (e.g. the TPAs) against it.
+
+    The background is sorted once, after which a test only sorts the sample and searches for its values in the sorted
+    background, so many samples (datasets, timeshifts) can be tested against the same background cheaply.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        The background. NaN values are ignored.
+    """
+
+    def __init__(self, values: np.ndarray):
+        values = np.asarray(values, dtype=float).ravel()
+        self.values = np.sort(values[~np.isnan(values)])
+        # The distinct values and their counts, for the tie-corrected Anderson-Darling test. Only kept if the
+        # background has ties (e.g. rounded OMNI values), otherwise they are the same as self.values
+        starts = np.flatnonzero(np.diff(self.values, prepend=np.nan) != 0)
+        if starts.size < self.size:
+            self.unique_values = self.values[starts]
+            self.unique_counts = np.diff(np.append(starts, self.size))
+        else:
+            self.unique_values, self.unique_counts = self.values, None
+
+    @property
+    def size(self) -> int:
+        return self.values.size
+
+    def cdf(self, x: np.ndarray) -> np.ndarray:
+        """Fraction of the background that is at most x."""
+        return np.searchsorted(self.values, x, side='right') / self.size
+
+    @staticmethod
+    def _sorted_sample(sample: np.ndarray) -> np.ndarray:
+        sample = np.asarray(sample, dtype=float).ravel()
+        return np.sort(sample[~np.isnan(sample)])
+
+    def ks_2samp(self, sample: np.ndarray) -> TwoSampleResult:
+        """Two-sided two-sample Kolmogorov-Smirnov test of sample against the background.
+
+        Between two values of the sample the empirical distribution of the sample is constant and the one of the
+        background increases, so the largest difference D is found at the sample values, from the left or right.
+        The p value is the asymptotic one of scipy.stats.ks_2samp (method='asymp'), which is exact enough for samples
+        of more than about 100 values against a large background.
+        """
+        sample = self._sorted_sample(sample)
+        n, m = sample.size, self.size
+        if n == 0 or m == 0:
+            return TwoSampleResult(np.nan, np.nan)
+        D = max(np.abs(np.searchsorted(sample, sample, side=side) / n
+                       - np.searchsorted(self.values, sample, side=side) / m).max() for side in ('left', 'right'))
+        p_value = stats.kstwo.sf(D, np.round(n * m / (n + m)))
+        return TwoSampleResult(float(D), float(np.clip(p_value, 0, 1)))
+
+    def anderson_ksamp(self, sample: np.ndarray) -> TwoSampleResult:
+        """Two-sample Anderson-Darling test of sample against the background (Scholz & Stephens 1987), like
+        scipy.stats.anderson_ksamp with the default (midrank) variant.
+
+        If there are ties (the background has equal values, e.g. rounded OMNI values, or the sample has values that
+        are equal to each other or to background values), the tie-corrected (midrank) statistic is summed over the
+        distinct values of the background and the sample, see _midrank_statistic.
+        Without ties, the sum over the pooled values is calculated per stretch between two sample values, where the
+        number of sample values before the pooled value is constant and the sum has a closed form, so it costs O(n)
+        instead of O(N) for a sample of n values. This is the statistic of scipy.stats.anderson_ksamp(variant='right'),
+        which differs from the midrank statistic by O(1/N) for data without ties.
+        The p value is interpolated like in scipy.stats.anderson_ksamp and is between 0.001 and 0.25.
+        """
+        sample = self._sorted_sample(sample)
+        n, m = sample.size, self.size
+        N = n + m
+        if n == 0 or m == 0 or N < 4:
+            return TwoSampleResult(np.nan, np.nan)
+        left = np.searchsorted(self.values, sample, side='left')
+        right = np.searchsorted(self.values, sample, side='right')
+        if self.unique_counts is not None or (right > left).any() or (np.diff(sample) == 0).any():
+            return anderson_pvalue(self._midrank_statistic(sample), N, np.array([n, m]))
+        # Rank (from 1) of every sample value among all values
+        ranks = left + np.arange(1, n + 1)
+
+        # Stretches j = first, ..., last of the pooled values with c sample values among the first j values
+        c = np.arange(n + 1, dtype=float)
+        first = np.concatenate([[1], ranks]).astype(float)
+        last = np.concatenate([ranks - 1, [N - 1]]).astype(float)
+        # (N c - j n)^2 / (j (N - j)) = -n^2 + N c^2 / j + N (n - c)^2 / (N - j), summed over j
+        S = (-n**2 * (last - first + 1)
+             + N * c**2 * (special.digamma(last + 1) - special.digamma(first))
+             + N * (n - c)**2 * (special.digamma(N - first + 1) - special.digamma(N - last))).sum()
+        A2 = (1 / n + 1 / m) * S / N
+        return anderson_pvalue(A2, N, np.array([n, m]))
+
+    def _midrank_statistic(self, sample: np.ndarray) -> float:
+        """The tie-corrected statistic A2akN (equation 7 of Scholz & Stephens 1987) of the sorted sample against the
+        background. It is a sum over the distinct pooled values, which are the distinct background values (found once
+        in __init__) with the sample values inserted, so it costs O(U + n) for U distinct background values.
+        For two samples, the terms of the sample and of the background are equal, so only the sample's are summed."""
+        n, m = sample.size, self.size
+        N = n + m
+        sample_values, sample_starts = np.unique(sample, return_index=True)
+        sample_counts = np.diff(np.append(sample_starts, n))
+        background_counts = np.ones(self.unique_values.size) if self.unique_counts is None else self.unique_counts
+
+        # Insert the sample values that are not background values into the distinct background values
+        position = np.searchsorted(self.unique_values, sample_values)
+        found = position < self.unique_values.size
+        found[found] = self.unique_values[position[found]] == sample_values[found]
+        insert = position[~found]
+        distinct_background = np.insert(background_counts.astype(float), insert, 0.)
+        distinct_sample = np.zeros(distinct_background.size)
+        # Index of every distinct sample value among the distinct pooled values
+        sample_index = position + np.cumsum(~found) - (~found)
+        distinct_sample[sample_index] = sample_counts
+
+        lj = distinct_background + distinct_sample
+        Bj = np.cumsum(lj) - lj / 2
+        Mj = np.cumsum(distinct_sample) - distinct_sample / 2
+        inner = lj / N * (N * Mj - Bj * n)**2 / (Bj * (N - Bj) - N * lj / 4)
+        return (N - 1) / N * (1 / n + 1 / m) * inner.sum()
+
+
+class BackgroundECDFs:
+    """Sorted backgrounds of a dataset (e.g. TPADataset.total) that are sorted once for every parameter:
+    >>> ecdfs = BackgroundECDFs(dataset.total)
+    >>> ecdfs['BzGSM'].ks_2samp(dataset.tpa_values['BzGSM'])
+    A background is sorted again if the series of its parameter has been replaced since it was sorted (e.g. by
+    TPADataset.get_dataset_parameters).
+
+    Parameters
+    ----------
+    background : dict
+        The series of each parameter, e.g. {'BzGSM': np.ndarray}.
+    """
+
+    def __init__(self, background: dict):
+        self.background = background
+        self._cache = {}
+
+    def __getitem__(self, parameter: str) -> BackgroundECDF:
+        series = self.background[parameter]
+        cached = self._cache.get(parameter)
+        if cached is None or cached[0] is not series:
+            cached = (series, BackgroundECDF(series))
+            self._cache[parameter] = cached
+        return cached[1]
+
+    def clear(self):
+        self._cache = {}
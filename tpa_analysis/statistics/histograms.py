@@ -0,0 +1,67 @@
+import numpy as np
+from typing import Union
+from .streaming import StreamingHistogram, StreamingHistogram2D
+
+
+class BackgroundHistograms:
+    """Histograms of the background of a dataset (e.g. TPADataset.total) that are calculated once for every parameter
+    and bin edges, so that figures with many panels of the same parameters do not bin the full series every time:
+    >>> histograms = BackgroundHistograms(dataset.total)
+    >>> hist1d(dataset.tpa_values['BzGSM'], histograms.hist1d('BzGSM', bins), axis, dataset.name)
+    A histogram is calculated again if the series of its parameter has been replaced in the background since it was
+    cached (e.g. by TPADataset.get_dataset_parameters).
+
+    Parameters
+    ----------
+    background : dict
+        The series of each parameter, e.g. {'BzGSM': np.ndarray}.
+    """
+
+    def __init__(self, background: dict):
+        self.background = background
+        self._cache = {}
+
+    @staticmethod
+    def _edges(bins, values: np.ndarray) -> np.ndarray:
+        # A number of bins is turned into equally wide bins between the smallest and largest value, like matplotlib
+        if np.ndim(bins) == 0:
+            return np.histogram_bin_edges(values[~np.isnan(values)], bins)
+        return np.asarray(bins, dtype=float)
+
+    @staticmethod
+    def _bins_key(bins):
+        return bins if np.ndim(bins) == 0 else np.asarray(bins, dtype=float).tobytes()
+
+    def _series(self, parameter: str) -> np.ndarray:
+        return np.asarray(self.background[parameter], dtype=float).ravel()
+
+    def hist1d(self, parameter: str, bins: Union[np.ndarray, int]) -> StreamingHistogram:
+        """Histogram of parameter with the bin edges bins (or the number of bins)."""
+        series = self.background[parameter]
+        key = (parameter, self._bins_key(bins))
+        cached = self._cache.get(key)
+        if cached is None or cached[0] is not series:
+            values = self._series(parameter)
+            cached = (series, StreamingHistogram(self._edges(bins, values)).update(values))
+            self._cache[key] = cached
+        return cached[1]
+
+    def hist2d(self, x_parameter: str, y_parameter: str,
+               bins: Union[np.ndarray, int, tuple] = 300) -> StreamingHistogram2D:
+        """2D histogram of x_parameter and y_parameter. bins is the same as in numpy.histogram2d: one number or bin
+        edges for both parameters, or a pair with one for each."""
+        x_series, y_series = self.background[x_parameter], self.background[y_parameter]
+        x_bins, y_bins = bins if isinstance(bins, (tuple, list)) and len(bins) == 2 else (bins, bins)
+        key = (x_parameter, y_parameter, self._bins_key(x_bins), self._bins_key(y_bins))
+        cached = self._cache.get(key)
+        if cached is None or cached[0] is not x_series or cached[1] is not y_series:
+            x, y = self._series(x_parameter), self._series(y_parameter)
+            # Like matplotlib.hist2d, only pairs without NaN decide the range of a number of bins
+            nan_idx = np.isnan(x) | np.isnan(y)
+            histogram = StreamingHistogram2D(self._edges(x_bins, x[~nan_idx]), self._edges(y_bins, y[~nan_idx]))
+            cached = (x_series, y_series, histogram.update(x, y))
+            self._cache[key] = cached
+        return cached[-1]
+
+    def clear(self):
+        self._cache = {}
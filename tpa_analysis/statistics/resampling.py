@@ -0,0 +1,287 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from scipy import stats
+from typing import Callable, Tuple
+from .analysis import merge_groups
+from .streaming import StreamingHistogram, bin_indices
+
+
+# Number of resamples that are drawn and binned at a time (and by one process with n_workers). The resamples only
+# depend on the seed and this number, not on the number of processes.
+CHUNK_SIZE = 1000
+
+
+def value_bins(values: np.ndarray, bins: np.ndarray) -> np.ndarray:
+    """Index of the bin of every non-NaN value in `values` (see `streaming.bin_indices`), as the smallest integer type.
+    NaN values are dropped. Values outside of the bins keep their index below 0 or above the last bin, so that they
+    are still drawn in resamples but not counted in any bin.
+    """
+    values = np.asarray(values, dtype=float).ravel()
+    bins = np.asarray(bins, dtype=float)
+    index = bin_indices(values[~np.isnan(values)], bins)
+    return index.astype(np.min_scalar_type(-bins.size))
+
+
+def bin_counts(index: np.ndarray, n_bins: int) -> np.ndarray:
+    """Histogram of the values with the bins `index` (see `value_bins`)."""
+    return np.bincount(index[(index >= 0) & (index < n_bins)], minlength=n_bins)
+
+
+def resample_counts(index: np.ndarray, n_bins: int, draws: np.ndarray) -> np.ndarray:
+    """Histograms of many resamples at once.
+
+    Parameters
+    ----------
+    index : numpy.ndarray
+        Bin of every value that is resampled, see `value_bins`.
+    n_bins : int
+        Number of bins.
+    draws : numpy.ndarray
+        2D array with one resample in every row, as indices of `index`.
+
+    Returns
+    ----------
+    counts : numpy.ndarray
+        2D array with the counts of every bin (columns) for every resample (rows).
+    """
+    draw_bins = index[draws].astype(np.intp)
+    inside = (draw_bins >= 0) & (draw_bins < n_bins)
+    # Every row gets its own range of bins, so that one bincount histograms all rows
+    draw_bins += np.arange(draws.shape[0])[:, np.newaxis] * n_bins
+    return np.bincount(draw_bins[inside], minlength=draws.shape[0] * n_bins).reshape(draws.shape[0], n_bins)
+
+
+def draw_with_replacement(rng: np.random.Generator, n_rows: int, size: int, population: int) -> np.ndarray:
+    return rng.integers(0, population, (n_rows, size))
+
+
+def draw_without_replacement(rng: np.random.Generator, n_rows: int, size: int, population: int) -> np.ndarray:
+    """Rows of `size` different indices below `population`. For a sample that is much smaller than the population
+    (e.g. TPAs among all minutes of OMNI data), indices are drawn with replacement and the few duplicates in a row are
+    drawn again until there are none."""
+    if size > population // 2:
+        return np.argsort(rng.random((n_rows, population)), axis=1)[:, :size]
+    draws = np.sort(rng.integers(0, population, (n_rows, size)), axis=1)
+    while (duplicates := draws[:, 1:] == draws[:, :-1]).any():
+        draws[:, 1:][duplicates] = rng.integers(0, population, duplicates.sum())
+        draws.sort(axis=1)
+    return draws
+
+
+def _chunk_counts(index: np.ndarray, n_bins: int, draw: Callable, n_rows: int, size: int,
+                  seed: np.random.SeedSequence) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return resample_counts(index, n_bins, draw(rng, n_rows, size, index.size))
+
+
+# The bins of the resampled values in a worker process, which are only sent once to every process
+_worker_index = None
+
+
+def _set_worker_index(index: np.ndarray):
+    global _worker_index
+    _worker_index = index
+
+
+def _worker_chunk_counts(*args) -> np.ndarray:
+    return _chunk_counts(_worker_index, *args)
+
+
+def resampled_counts(index: np.ndarray, n_bins: int, size: int, n_resamples: int, replace: bool = True,
+                     seed=None, n_workers: int = None) -> np.ndarray:
+    """Histograms of `n_resamples` resamples of `size` values each.
+
+    The resamples are drawn in chunks of `CHUNK_SIZE` with independent random generators that are spawned from `seed`
+    with `numpy.random.SeedSequence`, so the result is the same for the same seed with or without processes.
+
+    Parameters
+    ----------
+    index : numpy.ndarray
+        Bin of every value that is resampled, see `value_bins`.
+    n_bins : int
+        Number of bins.
+    size : int
+        Number of values in every resample.
+    n_resamples : int
+        Number of resamples.
+    replace : bool, optional
+        Whether the values are drawn with replacement (bootstrap) or without (permutation).
+    seed : int, numpy.random.SeedSequence, optional
+        Seed of the resamples. Default: a new random seed.
+    n_workers : int, optional
+        Number of processes. Default: all chunks are drawn in this process.
+
+    Returns
+    ----------
+    counts : numpy.ndarray
+        2D array with the counts of every bin (columns) for every resample (rows).
+    """
+    seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    rows = [min(CHUNK_SIZE, n_resamples - start) for start in range(0, n_resamples, CHUNK_SIZE)]
+    draw = draw_with_replacement if replace else draw_without_replacement
+    chunk_args = [(n_bins, draw, n_rows, size, chunk_seed) for n_rows, chunk_seed in zip(rows, seed.spawn(len(rows)))]
+    if n_workers is None:
+        chunks = [_chunk_counts(index, *args) for args in chunk_args]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_set_worker_index, initargs=(index,)) as executor:
+            chunks = list(executor.map(_worker_chunk_counts, *zip(*chunk_args)))
+    return np.concatenate(chunks) if chunks else np.zeros((0, n_bins), dtype=np.int64)
+
+
+def batch_chisquare(samples: np.ndarray, comparison: np.ndarray, ddof: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Chi-square test of every row of `samples` against the distribution of `comparison`, with the bins merged as in
+    `compare_dists`.
+
+    For every row, `comparison` is scaled to the sum of the row. The bins are merged once for every distinct row sum
+    (resamples of the same size mostly have the same sum) and applied to all rows with that sum at once.
+
+    Parameters
+    ----------
+    samples : numpy.ndarray
+        2D array with the measured counts in every row.
+    comparison : numpy.ndarray
+        The counts (of any sum) of the expected distribution, e.g. the histogram of the background.
+    ddof : int, optional
+        Adjustment to the degrees of freedom, see scipy.stats.chisquare.
+
+    Returns
+    ----------
+    statistics, p_values : numpy.ndarray
+        The chi-square statistic and p value of every row. Rows with a sum where the expected counts are fewer than 5 in
+        total get NaN, and rows where no degrees of freedom are left after merging get a p value of NaN.
+    """
+    samples = np.atleast_2d(samples)
+    comparison = np.asarray(comparison, dtype=float)
+    totals = samples.sum(axis=1)
+    statistics = np.full(totals.size, np.nan)
+    p_values = np.full(totals.size, np.nan)
+    for total in np.unique(totals):
+        if total < 5:
+            continue
+        rows = totals == total
+        expected = comparison * (total / comparison.sum())
+        starts = merge_groups(expected)
+        merged_expected = np.add.reduceat(expected, starts)
+        merged_samples = np.add.reduceat(samples[rows], starts, axis=1)
+        statistics[rows] = ((merged_samples - merged_expected)**2 / merged_expected).sum(axis=1)
+        # Without degrees of freedom (e.g. all bins merged into one) the p value is NaN, see compare_dists_batch
+        if starts.size - 1 - ddof > 0:
+            p_values[rows] = stats.chi2.sf(statistics[rows], starts.size - 1 - ddof)
+    return statistics, p_values
+
+
+@dataclass
+class BootstrapResult:
+    """Bootstrap confidence band of the IMF normalized TPA distribution (see `bootstrap_ratio`).
+    bins: the bin edges.
+    ratio: the normalized distribution of the sample, i.e. the fraction of the sample in every bin divided by the
+           fraction of the background.
+    lower, upper: the confidence band of ratio.
+    ratios: the normalized distribution of every resample (rows).
+    """
+    bins: np.ndarray
+    ratio: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+    ratios: np.ndarray
+
+
+def bootstrap_ratio(foreground: np.ndarray, background: np.ndarray, bins: np.ndarray, n_resamples: int = 10000,
+                    confidence: float = 0.95, seed=None, n_workers: int = None) -> BootstrapResult:
+    """Bootstrap confidence band of the IMF normalized TPA distribution (the green line of `plotting.hist1d`).
+
+    The TPA values are resampled with replacement. The background is much larger than the sample, so it is not
+    resampled. Like in `hist1d`, the fractions are of all non-NaN values, also the ones outside of the bins.
+
+    Parameters
+    ----------
+    foreground : numpy.ndarray
+        The values of the TPAs.
+    background : numpy.ndarray or StreamingHistogram
+        All values of the IMF during the period of the dataset, or their histogram with the same bins (e.g. from
+        `BackgroundHistograms`).
+    bins : numpy.ndarray
+        The bin edges.
+    n_resamples : int, optional
+        Number of bootstrap resamples.
+    confidence : float, optional
+        Confidence level of the band (percentile interval).
+    seed, n_workers : optional
+        See `resampled_counts`.
+
+    Returns
+    ----------
+    result : BootstrapResult
+    """
+    bins = np.asarray(bins, dtype=float)
+    n_bins = bins.size - 1
+    if isinstance(background, StreamingHistogram):
+        background_fraction = background.counts / background.total
+    else:
+        background_index = value_bins(background, bins)
+        background_fraction = bin_counts(background_index, n_bins) / background_index.size
+    index = value_bins(foreground, bins)
+    sample_counts = bin_counts(index, n_bins)
+    counts = resampled_counts(index, n_bins, index.size, n_resamples, replace=True, seed=seed, n_workers=n_workers)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = sample_counts / index.size / background_fraction
+        ratios = counts / index.size / background_fraction
+    alpha = (1 - confidence) / 2
+    lower, upper = np.quantile(ratios, [alpha, 1 - alpha], axis=0)
+    return BootstrapResult(bins, ratio, lower, upper, ratios)
+
+
+@dataclass
+class PermutationResult:
+    """Permutation test of a sample against its background (see `permutation_test`).
+    statistic: the chi-square statistic of the sample.
+    p_value: the fraction of the permutations with a statistic at least as large (counting the sample itself).
+    chisquare_p_value: the p value of the chi-square distribution (like `compare_dists`).
+    null_statistics: the statistic of every permutation.
+    """
+    statistic: float
+    p_value: float
+    chisquare_p_value: float
+    null_statistics: np.ndarray
+
+
+def permutation_test(foreground: np.ndarray, background: np.ndarray, bins: np.ndarray, n_resamples: int = 10000,
+                     seed=None, n_workers: int = None) -> PermutationResult:
+    """Permutation test of whether the TPA values are distributed like the background.
+
+    The TPA and background values are pooled, and every permutation takes as many values from the pool without
+    replacement as there are TPAs. The test statistic is the chi-square statistic of the histogram of the TPAs against
+    the histogram of the pool, with the bins merged as in `compare_dists`. The pool is the same for all permutations,
+    so its bins only have to be merged once (per number of values inside the bins).
+
+    Parameters
+    ----------
+    foreground : numpy.ndarray
+        The values of the TPAs.
+    background : numpy.ndarray
+        All values of the IMF during the period of the dataset.
+    bins : numpy.ndarray
+        The bin edges.
+    n_resamples : int, optional
+        Number of permutations.
+    seed, n_workers : optional
+        See `resampled_counts`.
+
+    Returns
+    ----------
+    result : PermutationResult
+    """
+    bins = np.asarray(bins, dtype=float)
+    n_bins = bins.size - 1
+    index = value_bins(foreground, bins)
+    pool = np.concatenate([index, value_bins(background, bins)])
+    sample_counts = bin_counts(index, n_bins)
+    pool_counts = bin_counts(pool, n_bins)
+
+    statistic, chisquare_p_value = batch_chisquare(sample_counts, pool_counts)
+    counts = resampled_counts(pool, n_bins, index.size, n_resamples, replace=False, seed=seed, n_workers=n_workers)
+    null_statistics, _ = batch_chisquare(counts, pool_counts)
+    p_value = (1 + np.sum(null_statistics >= statistic[0])) / (1 + n_resamples)
+    return PermutationResult(statistic[0], p_value, chisquare_p_value[0], null_statistics)
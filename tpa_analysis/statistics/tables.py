@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Union
+from .analysis import compare_dists_batch
+from .histograms import BackgroundHistograms
+from .streaming import StreamingHistogram
+
+
+def pvalue_table(datasets: list, bins: Dict[str, Union[np.ndarray, List[np.ndarray]]],
+                 histograms: List[BackgroundHistograms] = None) -> pd.DataFrame:
+    """Compare the distribution of the TPAs with the background (like `plotting.hist1d` and `compare_dists`) for every
+    combination of dataset, parameter and bin edges.
+
+    The background of every dataset is binned once per parameter and bin edges (see `BackgroundHistograms`) and all
+    chi-square tests are calculated together with `compare_dists_batch`.
+
+    Parameters
+    ----------
+    datasets : List[TPADataset]
+        The datasets, with `tpa_values` and `total` of the parameters (see `TPADataset.get_dataset_parameters`).
+    bins : dict
+        The bin edges of every parameter, or a list of bin edges to compare with several settings, e.g.
+        `{'BzGSM': [np.linspace(-20, 20, 41), np.linspace(-20, 20, 21)], 'vel': np.linspace(200, 900, 36)}`.
+    histograms : List[BackgroundHistograms], optional
+        Histograms of the background of every dataset that have been used before (e.g. for figures), so that the
+        background is not binned again. Default: new histograms for every dataset.
+
+    Returns
+    ----------
+    table : pandas.DataFrame
+        One row for every dataset, parameter and bin setting with the columns
+        dataset, parameter, bin_setting (index of the bin edges of the parameter), n_bins, n_tpas (non-NaN values),
+        p_value, merged_bins, merged_sample, merged_comparison (see `compare_dists`), bins and ratio (the IMF normalized
+        TPA distribution of `hist1d`, NaN where the background has no values).
+    """
+    if histograms is None:
+        histograms = [BackgroundHistograms(dataset.total) for dataset in datasets]
+    bins = dict((parameter, [edges] if np.ndim(edges[0]) == 0 else list(edges)) for parameter, edges in bins.items())
+
+    rows, samples, comparisons, edges_list = [], [], [], []
+    for dataset, dataset_histograms in zip(datasets, histograms):
+        for parameter, settings in bins.items():
+            for setting, edges in enumerate(settings):
+                edges = np.asarray(edges, dtype=float)
+                foreground = StreamingHistogram(edges).update(dataset.tpa_values[parameter])
+                background = dataset_histograms.hist1d(parameter, edges)
+                sample = foreground.counts
+                # The expected counts have the same sum as the sample, as required by the chi-square test
+                background_sum = background.counts.sum()
+                comparison = background.counts * (sample.sum() / background_sum if background_sum else 0.)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    ratio = (foreground.counts / foreground.total) / (background.counts / background.total)
+                ratio[background.counts == 0] = np.nan
+                rows.append({'dataset': dataset.name, 'parameter': parameter, 'bin_setting': setting,
+                             'n_bins': edges.size - 1, 'n_tpas': foreground.total, 'bins': edges, 'ratio': ratio})
+                samples.append(sample)
+                comparisons.append(comparison)
+                edges_list.append(edges)
+
+    for row, (p_value, merged_sample, merged_comparison, merged_bins) in zip(
+            rows, compare_dists_batch(samples, comparisons, edges_list)):
+        row.update(p_value=p_value, merged_bins=merged_bins, merged_sample=merged_sample,
+                   merged_comparison=merged_comparison)
+    columns = ['dataset', 'parameter', 'bin_setting', 'n_bins', 'n_tpas', 'p_value', 'merged_bins', 'merged_sample',
+               'merged_comparison', 'bins', 'ratio']
+    return pd.DataFrame(rows, columns=columns)
@@ -0,0 +1,59 @@
+import numpy as np
+from typing import Tuple
+
+
+def nan_prefix_sums(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Calculate NaN-aware prefix sums of `values` that can be used for the mean over any window.
+
+    The values are centered around their mean before summing, which keeps the rounding error of the differences of the
+    prefix sums small also for long series.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        1D array that may contain NaN.
+
+    Returns
+    ----------
+    sums : numpy.ndarray
+        Cumulative sum of the centered non-NaN values with a leading 0, i.e. `sums.size = values.size + 1`.
+    counts : numpy.ndarray
+        Cumulative number of non-NaN values with a leading 0.
+    center : float
+        The value that was subtracted from `values` before summing.
+    """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    center = values[valid].mean() if valid.any() else 0.
+    sums = np.zeros(values.size + 1)
+    np.cumsum(np.where(valid, values - center, 0.), out=sums[1:])
+    counts = np.zeros(values.size + 1, dtype=np.int64)
+    np.cumsum(valid, out=counts[1:])
+    return sums, counts, center
+
+
+def window_nanmean(values: np.ndarray, starts: np.ndarray, stops: np.ndarray, prefix_sums=None) -> np.ndarray:
+    """Calculate the mean of `values[start:stop]` for all windows, ignoring NaN.
+
+    Gives the same result as `np.nanmean(values[start:stop])` for each window (to within floating point rounding) but
+    costs O(1) per window after a single pass over `values`. Windows without any non-NaN values give NaN.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        1D array that may contain NaN.
+    starts, stops : numpy.ndarray
+        Integer index arrays of any (broadcastable) shape with the start (inclusive) and stop (exclusive) of each window.
+    prefix_sums : tuple, optional
+        The output of `nan_prefix_sums(values)`, if it has already been calculated.
+
+    Returns
+    ----------
+    means : numpy.ndarray
+        Mean of each window with the broadcasted shape of `starts` and `stops`.
+    """
+    sums, counts, center = nan_prefix_sums(values) if prefix_sums is None else prefix_sums
+    window_counts = counts[stops] - counts[starts]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = (sums[stops] - sums[starts]) / window_counts + center
+    return np.where(window_counts > 0, means, np.nan)